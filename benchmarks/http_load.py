@@ -0,0 +1,182 @@
+"""
+Measure requests per second and latency of the tracking endpoints over HTTP.
+
+Start the servers to compare, e.g. the WSGI and ASGI entry points:
+
+    gunicorn panalytics.wsgi -w 1 --threads 8 -b 127.0.0.1:8000
+    ASYNC_VIEWS=True uvicorn panalytics.asgi:application --port 8001
+
+then run
+
+    python -m benchmarks.http_load --tid PA-XXXXXXXXX \\
+        --target wsgi=http://127.0.0.1:8000 \\
+        --target asgi=http://127.0.0.1:8001
+
+Each target is driven by ``--concurrency`` keep-alive connections for
+``--duration`` seconds. Only the standard library is used so the numbers
+aren't skewed by a client side framework.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from urllib.parse import urlencode, urlsplit
+
+USER_AGENT = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/85.0 Safari/537.36')
+
+
+def collect_paths(tid, pages=50):
+    for i in itertools.cycle(range(pages)):
+        yield '/a.gif?' + urlencode({
+            'tid': tid,
+            'url': f'https://example.com/page/{i}',
+            'ref': 'https://www.google.com/',
+            't': f'Page {i}',
+            'wiw': '1272',
+            'wih': '675',
+        })
+
+
+def script_paths(tid):
+    return itertools.repeat(f'/a.js?tid={tid}')
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    length, chunked, close = 0, False, False
+    while True:
+        line = (await reader.readline()).strip().lower()
+        if not line:
+            break
+        name, _, value = line.partition(b':')
+        value = value.strip()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'transfer-encoding' and value == b'chunked':
+            chunked = True
+        elif name == b'connection' and value == b'close':
+            close = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return status, close
+
+
+def format_headers(headers):
+    return ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+
+
+async def client(host, port, paths, headers, deadline, latencies, errors):
+    reader = writer = None
+    default_headers = format_headers(headers)
+    while time.perf_counter() < deadline:
+        path = next(paths, None)
+        if path is None:
+            break
+        if isinstance(path, str):
+            path_headers = default_headers
+        else:
+            path, extra = path
+            path_headers = format_headers({**headers, **extra})
+        if writer is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        request = (f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'
+                   f'{path_headers}\r\n').encode()
+        start = time.perf_counter()
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, close = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(None)
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, paths, concurrency, duration, headers=None):
+    """Drive ``url`` with ``paths`` and return latencies and errors.
+
+    ``paths`` yields request targets, or ``(target, headers)`` pairs to
+    send extra headers with a request. Clients stop after ``duration``
+    seconds or when ``paths`` is exhausted.
+    """
+    target = urlsplit(url)
+    headers = {'User-Agent': USER_AGENT, **(headers or {})}
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        client(target.hostname, target.port or 80, paths, headers, deadline,
+               latencies, errors)
+        for _ in range(concurrency)
+    ))
+    return latencies, errors
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies, errors, duration):
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / duration,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'p999_ms': percentile(latencies, 99.9) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--target', action='append', required=True,
+                        metavar='NAME=URL', help='Server to benchmark.')
+    parser.add_argument('--tid', required=True)
+    parser.add_argument('--endpoint', choices=['collect', 'script'],
+                        default='collect')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f'{"target":<10} {"req/s":>10} {"p50 ms":>9} {"p99 ms":>9} '
+          f'{"errors":>7}')
+    for target in args.target:
+        name, _, url = target.partition('=')
+        if args.endpoint == 'collect':
+            paths = collect_paths(args.tid)
+        else:
+            paths = script_paths(args.tid)
+        latencies, errors = asyncio.run(
+            run(url, paths, args.concurrency, args.duration)
+        )
+        result = summarize(latencies, errors, args.duration)
+        print(f'{name:<10} {result["rps"]:>10.1f} {result["p50_ms"]:>9.2f} '
+              f'{result["p99_ms"]:>9.2f} {result["errors"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
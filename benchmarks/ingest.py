@@ -0,0 +1,318 @@
+"""
+Measure throughput and latency of the collect and script endpoints with
+realistic, replayable hit streams.
+
+By default requests go through Django's WSGI handler in process, with
+``--concurrency`` threads, against the database of the settings module:
+
+    python -m benchmarks.ingest --hits 20000 --concurrency 8
+    python -m benchmarks.ingest --sqlite /tmp/bench.sqlite3 --endpoint script
+
+``--sqlite`` swaps the database for a SQLite file, migrated on first use,
+so no PostgreSQL server is needed. ``--url`` drives a running server over
+HTTP with the ``benchmarks.http_load`` client instead:
+
+    python -m benchmarks.ingest --url http://127.0.0.1:8000 --tid PA-XXXXXXXXX
+
+Hit streams are generated from ``--seed``: page popularity is skewed
+towards a few pages, visitors come from a pool of IPs and user agents and
+about half arrive from a search engine or another site. The same seed
+replays the same stream. ``--save`` writes a stream to a JSON lines file
+and ``--replay`` reads it back, e.g. to replay hits recorded elsewhere.
+
+Every run appends a JSON object with the git revision, environment and
+results to ``--results`` (``benchmarks/results.jsonl`` by default), and
+prints the change from the previous run of the same scenario there, so
+regressions in the hot path show up across versions.
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+import django
+
+from benchmarks.http_load import USER_AGENT, run, summarize
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+USER_AGENTS = [
+    USER_AGENT,
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:81.0) Gecko/20100101 '
+    'Firefox/81.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_6) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/14.0 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 '
+    'Safari/604.1',
+]
+
+REFERERS = ['https://www.google.com/', 'https://duckduckgo.com/',
+            'https://news.ycombinator.com/', 'https://twitter.com/']
+
+WINDOWS = [(1272, 675), (1920, 969), (1440, 789), (375, 667), (414, 736)]
+
+
+def hit_stream(tid, hits, seed=0, endpoint='collect', pages=500,
+               visitors=5000):
+    """Yield ``(target, headers)`` of ``hits`` generated requests."""
+    rng = random.Random(seed)
+    for _ in range(hits):
+        visitor = rng.randrange(visitors)
+        headers = {
+            'User-Agent': USER_AGENTS[visitor % len(USER_AGENTS)],
+            'X-Forwarded-For': f'10.{visitor >> 16 & 255}.'
+                               f'{visitor >> 8 & 255}.{visitor & 255}',
+        }
+        if endpoint == 'script':
+            if rng.random() < 0.9:
+                headers['Accept-Encoding'] = 'gzip, deflate, br'
+            yield f'/a.js?tid={tid}', headers
+            continue
+
+        page = int(rng.random() ** 3 * pages)
+        source = rng.random()
+        if source < 0.5:
+            referer = ''
+        elif source < 0.8:
+            referer = rng.choice(REFERERS)
+        else:
+            referer = f'https://example.com/page/{rng.randrange(pages)}'
+        width, height = rng.choice(WINDOWS)
+        yield '/a.gif?' + urlencode({
+            'tid': tid,
+            'url': f'https://example.com/page/{page}?utm_source=bench',
+            'ref': referer,
+            't': f'Page {page}',
+            'wiw': width,
+            'wih': height,
+        }), headers
+
+
+def save_stream(path, stream):
+    with open(path, 'w') as file:
+        for target, headers in stream:
+            file.write(json.dumps([target, headers]) + '\n')
+
+
+def load_stream(path):
+    with open(path) as file:
+        return [tuple(json.loads(line)) for line in file]
+
+
+def run_in_process(stream, concurrency, host='localhost'):
+    """Send ``stream`` through the WSGI handler from ``concurrency``
+    threads and return latencies, errors and the elapsed seconds."""
+    from django.core.handlers.wsgi import WSGIHandler
+    handler = WSGIHandler()
+    stream = iter(stream)
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.value = int(status.split()[0])
+
+    statuses = threading.local()
+
+    def worker():
+        while True:
+            with lock:
+                item = next(stream, None)
+            if item is None:
+                return
+            target, headers = item
+            path, _, query = target.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query,
+                'SERVER_NAME': host,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'REMOTE_ADDR': headers.get('X-Forwarded-For', '127.0.0.1'),
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0),
+                'wsgi.multithread': True,
+                'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            for name, value in {'Host': host, **headers}.items():
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+            start = time.perf_counter()
+            response = handler(environ, start_response)
+            b''.join(response)
+            response.close()
+            latencies.append(time.perf_counter() - start)
+            if statuses.value >= 400:
+                errors.append(statuses.value)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_http(url, stream, concurrency, duration):
+    start = time.perf_counter()
+    latencies, errors = asyncio.run(
+        run(url, iter(stream), concurrency, duration)
+    )
+    return latencies, errors, time.perf_counter() - start
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(url):
+    """Return the settings and versions a result depends on."""
+    info = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+    if url:
+        info['server'] = url
+    else:
+        from django.conf import settings
+        from django.db import connection
+        from panalytics.core.buffer import pageview_buffer
+        info.update({
+            'database': connection.vendor,
+            'buffer': pageview_buffer.enabled,
+            'storage': settings.PAGEVIEW_STORAGE,
+            'intern_dimensions': settings.INTERN_DIMENSIONS,
+        })
+    return info
+
+
+def previous_result(path, scenario):
+    """Return the last result of ``scenario`` recorded in ``path``."""
+    previous = None
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                record = json.loads(line)
+                if record['scenario'] == scenario:
+                    previous = record
+    return previous
+
+
+def setup(args):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panalytics.settings')
+    from django.conf import settings
+    if args.sqlite:
+        settings.DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': args.sqlite,
+        }
+    django.setup()
+    if args.sqlite:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+
+def benchmark_tid():
+    from panalytics.core.models import Project
+    project, _ = Project.objects.get_or_create(name='bench-ingest')
+    return project.tid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--endpoint', choices=['collect', 'script'],
+                        default='collect')
+    parser.add_argument('--hits', type=int, default=10000,
+                        help='Length of the generated stream.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--tid', help='Tracking ID of the hits, by default '
+                        'that of a "bench-ingest" project created locally.')
+    parser.add_argument('--url', help='Benchmark a server over HTTP.')
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help='Time limit of --url runs in seconds.')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='Benchmark in process on a SQLite file.')
+    parser.add_argument('--save', metavar='PATH',
+                        help='Write the stream to PATH and exit.')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='Send the stream saved at PATH.')
+    parser.add_argument('--results', default=RESULTS, metavar='PATH')
+    parser.add_argument('--name', help='Scenario name to compare results '
+                        'under, by default derived from the options.')
+    args = parser.parse_args()
+
+    if not args.url or not args.tid:
+        setup(args)
+    tid = args.tid or benchmark_tid()
+    if args.replay:
+        stream = load_stream(args.replay)
+    else:
+        stream = list(hit_stream(tid, args.hits, args.seed, args.endpoint))
+    if args.save:
+        save_stream(args.save, stream)
+        return
+
+    if args.url:
+        latencies, errors, elapsed = run_http(args.url, stream,
+                                              args.concurrency,
+                                              args.duration)
+    else:
+        latencies, errors, elapsed = run_in_process(stream,
+                                                    args.concurrency)
+
+    scenario = args.name or '{}-{}-c{}-{}'.format(
+        args.endpoint,
+        os.path.basename(args.replay) if args.replay else
+        f'seed{args.seed}x{args.hits}',
+        args.concurrency,
+        'http' if args.url else 'wsgi',
+    )
+    record = {
+        'scenario': scenario,
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'environment': environment(args.url),
+        'result': summarize(latencies, errors, elapsed),
+    }
+    previous = previous_result(args.results, scenario)
+    with open(args.results, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+    result = record['result']
+    print(f'{scenario} at {record["revision"]}')
+    for key, label in [('rps', 'req/s'), ('p50_ms', 'p50 ms'),
+                       ('p90_ms', 'p90 ms'), ('p99_ms', 'p99 ms'),
+                       ('p999_ms', 'p99.9 ms'), ('errors', 'errors')]:
+        line = f'{label:>9} {result[key]:>10.2f}'
+        if previous and previous['result'][key]:
+            change = result[key] / previous['result'][key] - 1
+            line += f' {change:+8.1%} vs {previous["revision"]}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
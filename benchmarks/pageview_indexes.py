@@ -0,0 +1,139 @@
+"""
+Compare query plans of the page view reporting queries with and without
+the indexes declared in ``PageView.Meta.indexes``.
+
+Run against a scratch PostgreSQL database, never production:
+
+    python -m benchmarks.pageview_indexes --rows 10000000
+
+Synthetic page views are generated with ``generate_series`` the first time
+(use ``--skip-load`` to reuse them). Each query is then explained with
+``EXPLAIN (ANALYZE, BUFFERS)`` twice, once inside a transaction that drops
+the indexes and is rolled back ("before") and once as migrated ("after").
+"""
+import argparse
+import os
+import re
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panalytics.settings')
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from panalytics.core.models import PageView, Project  # noqa: E402
+
+BENCHMARK_PREFIX = 'bench-'
+
+LOAD_SQL = """
+    INSERT INTO core_pageview (timestamp, project_id, protocol, domain, path,
+                               url, title, window_width, window_height,
+                               referer, unique_visit, query, sample_weight)
+    SELECT now() - random() * interval '365 days',
+           projects.ids[1 + floor(random() * %(projects)s)::int],
+           'https',
+           'example.com',
+           '/page/' || floor(power(random(), 3) * 1000)::int,
+           'https://example.com/page',
+           'Benchmark page',
+           1272,
+           675,
+           '',
+           random() < 0.3,
+           '',
+           1
+    FROM generate_series(1, %(rows)s),
+         (SELECT array_agg(id) AS ids FROM core_project
+          WHERE name LIKE %(prefix)s) AS projects
+"""
+
+QUERIES = {
+    'view_count(days=30)': """
+        SELECT COUNT(*) FROM core_pageview
+        WHERE project_id = %(project)s AND timestamp >= now() - '30 days'
+    """,
+    'unique_view_count(days=30)': """
+        SELECT COUNT(*) FROM core_pageview
+        WHERE project_id = %(project)s AND unique_visit
+              AND timestamp >= now() - '30 days'
+    """,
+    'top_paths()': """
+        SELECT path, COUNT(*) FROM core_pageview
+        WHERE project_id = %(project)s
+        GROUP BY path ORDER BY 2 DESC LIMIT 5
+    """,
+    'admin changelist filtered by project': """
+        SELECT * FROM core_pageview
+        WHERE project_id = %(project)s
+        ORDER BY timestamp DESC LIMIT 100
+    """,
+}
+
+
+def load(rows, projects, batch_size=1000000):
+    for i in range(projects):
+        Project.objects.get_or_create(name=f'{BENCHMARK_PREFIX}{i}')
+
+    with connection.cursor() as cursor:
+        for start in range(0, rows, batch_size):
+            params = {'rows': min(batch_size, rows - start),
+                      'projects': projects,
+                      'prefix': f'{BENCHMARK_PREFIX}%'}
+            with transaction.atomic():
+                cursor.execute(LOAD_SQL, params)
+            print(f'Loaded {start + params["rows"]} of {rows} rows')
+        cursor.execute('ANALYZE core_pageview')
+
+
+def explain(cursor, sql, params):
+    cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+    plan = '\n'.join(row[0] for row in cursor.fetchall())
+    runtime = re.search(r'Execution Time: ([\d.]+) ms', plan)
+    return plan, float(runtime.group(1)) if runtime else None
+
+
+def compare(project_id, verbose):
+    params = {'project': project_id}
+    indexes = [index.name for index in PageView._meta.indexes]
+    results = {}
+
+    with connection.cursor() as cursor:
+        with transaction.atomic():
+            for name in indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+            for label, sql in QUERIES.items():
+                results[label] = [explain(cursor, sql, params)]
+            transaction.set_rollback(True)
+
+        for label, sql in QUERIES.items():
+            results[label].append(explain(cursor, sql, params))
+
+    for label, ((before_plan, before), (after_plan, after)) in \
+            results.items():
+        print(f'{label}: {before:.1f} ms -> {after:.1f} ms')
+        if verbose:
+            print(f'--- before\n{before_plan}\n--- after\n{after_plan}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--projects', type=int, default=20)
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Print the full query plans.')
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        parser.error('This benchmark needs a PostgreSQL database.')
+
+    if not args.skip_load:
+        load(args.rows, args.projects)
+    project = Project.objects.filter(name__startswith=BENCHMARK_PREFIX) \
+        .order_by('pk').first()
+    compare(project.pk, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
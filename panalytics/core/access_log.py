@@ -0,0 +1,176 @@
+"""
+Import of page views from web server access logs.
+
+Lines in the nginx/Apache combined format are parsed one at a time and
+mapped onto page views with the same URL and referrer handling as the
+collect endpoint. Rows are written to the storage backend in batches,
+with COPY when that is the PostgreSQL database.
+After each batch the byte offset reached is known, so an interrupted
+import can be resumed from there.
+"""
+import csv
+import datetime
+import gzip
+import io
+import re
+from functools import lru_cache
+
+from django.db import connection, transaction
+
+from .models import PageView
+from .storage import get_storage
+from .timeseries import forget_buckets
+from .utils import hash_visitor
+
+COMBINED = re.compile(
+    rb'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] '
+    rb'"(?P<method>[A-Z]+) (?P<target>\S+)[^"]*" (?P<status>\d{3}) \S+ '
+    rb'"(?P<referer>(?:[^"\\]|\\.)*)" "(?P<agent>(?:[^"\\]|\\.)*)"'
+)
+
+# Requests for assets rather than pages
+ASSETS = re.compile(r'\.(?:css|js|mjs|map|png|jpe?g|gif|webp|svg|ico|'
+                    r'woff2?|ttf|eot|txt|xml|json|pdf|zip)$', re.IGNORECASE)
+
+MONTHS = {month: index for index, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+     'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+
+
+def open_log(path):
+    """Open a plain or gzipped log file for reading bytes."""
+    with open(path, 'rb') as log:
+        compressed = log.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if compressed else open(path, 'rb')
+
+
+@lru_cache(maxsize=1024)
+def parse_time(value):
+    """Parse ``10/Oct/2000:13:55:36 -0700``, faster than strptime."""
+    offset = int(value[-4:-2]) * 60 + int(value[-2:])
+    if value[-5] == '-':
+        offset = -offset
+    return datetime.datetime(
+        int(value[7:11]), MONTHS[value[3:6]], int(value[:2]),
+        int(value[12:14]), int(value[15:17]), int(value[18:20]),
+        tzinfo=datetime.timezone(datetime.timedelta(minutes=offset)),
+    )
+
+
+def parse_line(line, site, project_id):
+    """Return PageView field values for a log line, None to skip it."""
+    match = COMBINED.match(line)
+    if not match or match['method'] != b'GET' or \
+            not 200 <= int(match['status']) < 400:
+        return None
+    target = match['target'].decode('utf-8', 'replace')
+    if not target.startswith('/') or \
+            ASSETS.search(target.partition('?')[0]):
+        return None
+
+    try:
+        fields = dict(_parse_page(site + target, match['referer'],
+                                  project_id))
+    except ValueError:
+        # Malformed URL, e.g. an invalid IPv6 host in the referrer
+        return None
+    timestamp = parse_time(match['time'].decode())
+    fields['timestamp'] = timestamp
+    fields['visitor_hash'] = hash_visitor(
+        project_id, match['ip'].decode(),
+        match['agent'].decode('utf-8', 'replace'),
+        timestamp.astimezone(datetime.timezone.utc).date(),
+    )
+    return fields
+
+
+@lru_cache(maxsize=65536)
+def _parse_page(url, referer, project_id):
+    # Logs repeat the same pages and referrers over and over
+    referer = referer.decode('utf-8', 'replace')
+    fields = PageView.parse_hit({
+        'url': url,
+        'ref': '' if referer == '-' else referer,
+    }, project_id)
+    fields['window_width'] = fields['window_height'] = 0
+    return fields
+
+
+def read_lines(log, offset=0):
+    """Yield ``(line, offset after the line)`` from a binary file."""
+    log.seek(offset)
+    for line in log:
+        offset += len(line)
+        yield line, offset
+
+
+def import_log(log, site, project_id, offset=0, batch_size=50000):
+    """Import page views from an open log file starting at ``offset``.
+
+    ``site`` is the scheme and host the logged paths belong to. Yields
+    ``(rows written, offset)`` after each batch, the offset being where
+    to resume from once the batch is committed.
+    """
+    site = site.rstrip('/')
+    batch = []
+    for line, offset in read_lines(log, offset):
+        fields = parse_line(line, site, project_id)
+        if fields is not None:
+            batch.append(fields)
+        if len(batch) >= batch_size:
+            yield write_rows(batch), offset
+            batch = []
+    yield write_rows(batch), offset
+
+
+def write_rows(rows):
+    """Store parsed page views, with COPY into PostgreSQL."""
+    if not rows:
+        return 0
+    storage = get_storage()
+    buckets = {(row['project_id'], row['timestamp']) for row in rows}
+    rows = PageView.intern(rows)
+    if storage.uses_orm and connection.vendor == 'postgresql':
+        with transaction.atomic():
+            _copy(rows)
+        written = len(rows)
+    else:
+        written = storage.write([PageView(**row) for row in rows])
+    # Old days are usually cached by the time their logs are imported
+    forget_buckets(buckets)
+    return written
+
+
+def _copy(rows):
+    columns, nullable, buffer = copy_buffer(rows)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {PageView._meta.db_table} ({", ".join(columns)}) '
+            f'FROM STDIN WITH (FORMAT csv, '
+            f'FORCE_NULL ({", ".join(nullable)}))',
+            buffer
+        )
+
+
+def copy_buffer(rows):
+    """Return quoted column names and a CSV file of ``rows`` for COPY.
+
+    Everything but numbers is quoted so that empty strings aren't read as
+    NULL. None is written as an empty quoted value too, so the nullable
+    columns are returned as well to be listed in FORCE_NULL.
+    """
+    fields = [field for field in PageView._meta.concrete_fields
+              if not field.primary_key]
+    defaults = {field.attname: field.get_default() for field in fields}
+    names = [field.attname for field in fields]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        values = {**defaults, **row}
+        writer.writerow([values[name] for name in names])
+    buffer.seek(0)
+
+    def quoted(fields):
+        return [connection.ops.quote_name(field.column) for field in fields]
+    return quoted(fields), quoted(f for f in fields if f.null), buffer
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.utils.html import format_html
@@ -21,10 +22,30 @@ class ReadOnlyAdmin(admin.ModelAdmin):
         return False
 
 
+class ProjectChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Fetch the top paths and visitors for the whole page at once
+        project_ids = [p.pk for p in self.result_list]
+        top_paths = Project.top_paths_for(project_ids)
+        visitors = Project.unique_visitor_counts(project_ids, days=30)
+        for project in self.result_list:
+            project.prefetched_top_paths = top_paths.get(project.pk, [])
+            project.prefetched_visitors_30d = visitors[project.pk]
+
+
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ('name', 'tid', 'unique_view_count', 'view_count',
                     'single_day_view_count', 'seven_day_view_count',
-                    'thirty_day_view_count', 'top_paths')
+                    'thirty_day_view_count', 'thirty_day_visitors',
+                    'top_paths')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_view_counts()
+
+    def get_changelist(self, request, **kwargs):
+        return ProjectChangeList
 
     # Remove the Tracking ID (tid) from the project admin add page to prevent
     # user from overriding the auto generated ID on model save().
@@ -35,20 +56,45 @@ class ProjectAdmin(admin.ModelAdmin):
             exclude_set.add('tid')
         return [f for f in fields if f not in exclude_set]
 
+    def unique_view_count(self, obj):
+        return obj.total_unique_views
+    unique_view_count.short_description = 'Unique view count'
+    unique_view_count.admin_order_field = 'total_unique_views'
+
+    def view_count(self, obj):
+        return obj.total_views
+    view_count.short_description = 'View count'
+    view_count.admin_order_field = 'total_views'
+
     def single_day_view_count(self, obj):
-        return obj.view_count(days=1)
+        return obj.views_1d
     single_day_view_count.short_description = '24 Hours'
+    single_day_view_count.admin_order_field = 'views_1d'
 
     def seven_day_view_count(self, obj):
-        return obj.view_count(days=7)
+        return obj.views_7d
     seven_day_view_count.short_description = '7 Days'
+    seven_day_view_count.admin_order_field = 'views_7d'
 
     def thirty_day_view_count(self, obj):
-        return obj.view_count(days=30)
+        return obj.views_30d
     thirty_day_view_count.short_description = '30 Days'
+    thirty_day_view_count.admin_order_field = 'views_30d'
+
+    def thirty_day_visitors(self, obj):
+        visitors = getattr(obj, 'prefetched_visitors_30d', None)
+        if visitors is None:
+            visitors = obj.unique_visitor_count(days=30)
+        return visitors
+    # Visitors get new IDs every day, see Project.unique_visitor_counts
+    thirty_day_visitors.short_description = \
+        '30 Days, Sum of Daily Visitors (approx.)'
 
     def top_paths(self, obj):
-        value = '<br>'.join([f'{c} - {p}' for c, p in obj.top_paths()])
+        top_paths = getattr(obj, 'prefetched_top_paths', None)
+        if top_paths is None:
+            top_paths = obj.top_paths()
+        value = '<br>'.join([f'{c} - {p}' for c, p in top_paths])
         return format_html(value)
     top_paths.short_description = 'Most Visited (C-P)'
     top_paths.allow_tags = True
@@ -56,8 +102,11 @@ class ProjectAdmin(admin.ModelAdmin):
 
 class PageViewAdmin(ReadOnlyAdmin):
     list_filter = ('project',)
-    list_display = ('timestamp', 'project_link', 'url', 'title', 'referer',
-                    'unique_visit',)
+    ordering = ('-timestamp',)
+    list_display = ('timestamp', 'project_link', 'page_url', 'page_title',
+                    'page_referer', 'unique_visit',)
+    list_select_related = ('project', 'domain_key', 'path_key', 'title_key',
+                           'referer_key')
 
     def project_link(self, obj):
         return mark_safe('<a href="{}">{}</a>'.format(
@@ -66,6 +115,18 @@ class PageViewAdmin(ReadOnlyAdmin):
         ))
     project_link.short_description = 'project'
 
+    def page_url(self, obj):
+        return obj.get_url()
+    page_url.short_description = 'url'
+
+    def page_title(self, obj):
+        return obj.get_dimension('title')
+    page_title.short_description = 'title'
+
+    def page_referer(self, obj):
+        return obj.get_dimension('referer')
+    page_referer.short_description = 'referer'
+
 
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(PageView, PageViewAdmin)
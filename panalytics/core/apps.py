@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import DatabaseError, connection
 
 
 class CoreConfig(AppConfig):
-    name = 'core'
+    name = 'panalytics.core'
+    label = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .cache import tracking_ids
+
+        if settings.TRACKING_ID_CACHE_WARM:
+            try:
+                tracking_ids.warm()
+            except DatabaseError:
+                # Tables don't exist yet (e.g. before the first migrate)
+                pass
+            finally:
+                # Don't share the connection with forked worker processes
+                connection.close()
@@ -0,0 +1,328 @@
+"""
+Column oriented archive segments for old page views.
+
+``archive`` moves page views of closed UTC days out of the database into
+one segment file per day under ARCHIVE_DIR. A segment stores each column
+as a separately compressed typed array: timestamps as microseconds since
+the epoch, IDs, viewport sizes and flags as integers, and strings
+(protocol, domain, path, title, referer, URL) as integer codes into a
+per segment table of distinct values. Readers memory map the file and
+only decompress the columns they use.
+
+Only page views already folded into the rollups are archived, so the
+rollup based reports keep covering them. ``count_views`` answers queries
+the rollups can't, such as arbitrary time ranges.
+
+File layout: ``MAGIC``, the header length as a 4 byte big endian
+integer, a JSON header locating each column, then the column data.
+"""
+import array
+import datetime
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import PageView, RollupWatermark, dimension_value
+
+MAGIC = b'PASEG1'
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Column name -> array type code, None for dictionary encoded strings
+COLUMNS = {
+    'id': 'q',
+    'timestamp': 'q',
+    'project_id': 'q',
+    'window_width': 'I',
+    'window_height': 'I',
+    'unique_visit': 'B',
+    'visitor_hash': 'q',
+    'sample_weight': 'I',
+    'protocol': None,
+    'domain': None,
+    'path': None,
+    'title': None,
+    'referer': None,
+    'url': None,
+}
+
+# Values of the columns missing from segments written before they existed
+ADDED_COLUMNS = {
+    'sample_weight': 1,
+}
+
+
+def to_micros(value):
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + \
+        delta.microseconds
+
+
+def from_micros(value):
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+
+def write_segment(path, rows):
+    """Write ``rows``, dicts of COLUMNS values, to a segment at ``path``.
+
+    ``rows`` may be any iterable; values are appended to typed arrays as
+    they come, so only the encoded columns are held in memory. The file is
+    written under a temporary name and renamed, so readers never see a
+    partial segment. Returns the number of rows written.
+    """
+    arrays = {name: array.array(typecode or 'I')
+              for name, typecode in COLUMNS.items()}
+    tables = {name: {} for name, typecode in COLUMNS.items()
+              if typecode is None}
+    count = 0
+    for row in rows:
+        for name, values in arrays.items():
+            value = row[name]
+            if name in tables:
+                value = tables[name].setdefault(value, len(tables[name]))
+            values.append(value)
+        count += 1
+
+    header = {'rows': count, 'byteorder': sys.byteorder, 'columns': {}}
+    blobs, offset = [], 0
+    for name, typecode in COLUMNS.items():
+        column = {'type': typecode}
+        if typecode is None:
+            table = zlib.compress(json.dumps(list(tables[name])).encode())
+            column['strings'] = [offset, len(table)]
+            blobs.append(table)
+            offset += len(table)
+        data = zlib.compress(arrays[name].tobytes())
+        column['data'] = [offset, len(data)]
+        blobs.append(data)
+        offset += len(data)
+        header['columns'][name] = column
+
+    header = json.dumps(header).encode()
+    partial = f'{path}.partial'
+    with open(partial, 'wb') as segment:
+        segment.write(MAGIC + struct.pack('>I', len(header)) + header)
+        for blob in blobs:
+            segment.write(blob)
+    os.replace(partial, path)
+    return count
+
+
+class Segment:
+    """Read only, memory mapped view of a segment file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as segment:
+            self._map = mmap.mmap(segment.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a page view segment')
+        start = len(MAGIC) + 4
+        length, = struct.unpack('>I', self._map[len(MAGIC):start])
+        self.header = json.loads(self._map[start:start + length])
+        if self.header['byteorder'] != sys.byteorder:
+            self._map.close()
+            raise ValueError(f'{path} was written with another byte order')
+        self._data_start = start + length
+        self._columns = {}
+
+    def __len__(self):
+        return self.header['rows']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def _read(self, offset, length):
+        start = self._data_start + offset
+        return zlib.decompress(self._map[start:start + length])
+
+    def column(self, name):
+        """Return a column as a sequence of its values."""
+        if name not in self._columns:
+            column = self.header['columns'].get(name)
+            if column is None and name in ADDED_COLUMNS:
+                self._columns[name] = [ADDED_COLUMNS[name]] * len(self)
+                return self._columns[name]
+            if column['type'] is None:
+                strings = json.loads(self._read(*column['strings']))
+                codes = memoryview(self._read(*column['data'])).cast('I')
+                values = [strings[code] for code in codes]
+            else:
+                values = memoryview(self._read(*column['data'])) \
+                    .cast(column['type'])
+            self._columns[name] = values
+        return self._columns[name]
+
+    def rows(self, *names):
+        """Yield tuples of the values of ``names`` for every row."""
+        return zip(*(self.column(name) for name in names))
+
+
+def segment_day(filename):
+    """Return the day a segment file covers or None for other files."""
+    try:
+        return datetime.date.fromisoformat(filename.split('.')[0])
+    except ValueError:
+        return None
+
+
+def segment_paths(since=None, until=None, directory=None):
+    """Return paths of segments covering days in ``[since, until)``."""
+    directory = directory or settings.ARCHIVE_DIR
+    if not os.path.isdir(directory):
+        return []
+    paths = []
+    for filename in sorted(os.listdir(directory)):
+        day = segment_day(filename)
+        if day is None or not filename.endswith('.seg'):
+            continue
+        if since and day < since.astimezone(datetime.timezone.utc).date():
+            continue
+        if until and day > until.astimezone(datetime.timezone.utc).date():
+            continue
+        paths.append(os.path.join(directory, filename))
+    return paths
+
+
+def count_views(project_id, since=None, until=None, unique=False,
+                directory=None):
+    """Count archived page views of a project in ``[since, until)``."""
+    low = to_micros(since) if since else -2 ** 63
+    high = to_micros(until) if until else 2 ** 63 - 1
+    total = 0
+    for path in segment_paths(since, until, directory):
+        with Segment(path) as segment:
+            rows = segment.rows('project_id', 'timestamp', 'unique_visit',
+                                'sample_weight')
+            total += sum(weight for pid, micros, unique_visit, weight in rows
+                         if pid == project_id and low <= micros < high
+                         and (unique_visit or not unique))
+    return total
+
+
+def project_rows(project_id, names, since=None, until=None,
+                 directory=None):
+    """Yield the ``names`` columns of a project's archived page views.
+
+    Only one day's columns are decompressed at a time. Timestamps are
+    converted back to datetimes.
+    """
+    low = to_micros(since) if since else -2 ** 63
+    high = to_micros(until) if until else 2 ** 63 - 1
+    for path in segment_paths(since, until, directory):
+        with Segment(path) as segment:
+            columns = [segment.column(name) for name in names]
+            for index, (pid, micros) in enumerate(
+                segment.rows('project_id', 'timestamp')
+            ):
+                if pid == project_id and low <= micros < high:
+                    row = dict(zip(names, (c[index] for c in columns)))
+                    if 'timestamp' in row:
+                        row['timestamp'] = from_micros(row['timestamp'])
+                    yield row
+
+
+def _rows(pageviews, chunk_size=2000):
+    fields = {name: dimension_value(name)
+              for name in ('domain', 'path', 'title', 'referer')}
+    pageviews = pageviews.annotate(**{f'{name}_value': value
+                                      for name, value in fields.items()})
+    for pageview in pageviews.iterator(chunk_size=chunk_size):
+        yield {
+            'id': pageview.id,
+            'timestamp': to_micros(pageview.timestamp),
+            'project_id': pageview.project_id,
+            'window_width': pageview.window_width,
+            'window_height': pageview.window_height,
+            'unique_visit': pageview.unique_visit,
+            'visitor_hash': pageview.visitor_hash or 0,
+            'sample_weight': pageview.sample_weight,
+            'protocol': pageview.protocol,
+            'domain': pageview.domain_value,
+            'path': pageview.path_value,
+            'title': pageview.title_value,
+            'referer': pageview.referer_value,
+            'url': pageview.url or '{}://{}{}{}'.format(
+                pageview.protocol, pageview.domain_value,
+                pageview.path_value, pageview.query),
+        }
+
+
+def _day_segments(directory, day):
+    return [path for path in segment_paths(directory=directory)
+            if segment_day(os.path.basename(path)) == day]
+
+
+def archive(before, chunk_size=10000, directory=None):
+    """Archive page views of the UTC days before the date ``before``.
+
+    Each day's rows are read in chunks of ``chunk_size`` and streamed into
+    a new segment, then the rows read are deleted in chunks as well. Rows
+    added to the day meanwhile are left for the next run. Archiving stops
+    at the first day with page views not rolled up yet. Rows already in a
+    segment of the same day, e.g. after a run interrupted before deleting,
+    are deleted without being written again. Returns a list of ``(day,
+    archived count)``.
+    """
+    directory = directory or settings.ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    last_id = RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS)
+    end = datetime.datetime.combine(before, datetime.time(),
+                                    tzinfo=datetime.timezone.utc)
+
+    archived = []
+    for day in PageView.objects.filter(timestamp__lt=end) \
+            .dates('timestamp', 'day'):
+        start = datetime.datetime.combine(day, datetime.time(),
+                                          tzinfo=datetime.timezone.utc)
+        pageviews = PageView.objects.filter(
+            timestamp__gte=start,
+            timestamp__lt=start + datetime.timedelta(days=1),
+        ).order_by('id')
+        if pageviews.filter(id__gt=last_id).exists():
+            break
+
+        segments = _day_segments(directory, day)
+        existing = set()
+        for path in segments:
+            with Segment(path) as segment:
+                existing.update(segment.column('id'))
+
+        # IDs of the rows read, written now or by an earlier run
+        ids = array.array('q')
+
+        def unarchived():
+            for row in _rows(pageviews, chunk_size):
+                ids.append(row['id'])
+                if row['id'] not in existing:
+                    yield row
+
+        rows = unarchived()
+        first = next(rows, None)
+        count = 0
+        if first is not None:
+            count = write_segment(
+                os.path.join(directory, f'{day}.{len(segments)}.seg'),
+                itertools.chain([first], rows),
+            )
+        for offset in range(0, len(ids), chunk_size):
+            with transaction.atomic():
+                PageView.objects.filter(
+                    id__in=ids[offset:offset + chunk_size]
+                ).delete()
+        archived.append((day, count))
+    return archived
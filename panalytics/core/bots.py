@@ -0,0 +1,122 @@
+"""
+Recognise crawlers, bots and headless browsers by their user agent.
+
+Patterns are matched against the lower case user agent. They are compiled
+into one regular expression, with the plain words merged into a trie so
+that a user agent is scanned once whatever the number of patterns, plus
+one for the patterns anchored at the start. Results are cached per user
+agent string since most hits come from a few thousand distinct ones.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Regular expressions found in lower case user agents not sent by people
+PATTERNS = [
+    # Generic words used by most crawlers (Cubot makes phones) and the
+    # "+http://..." info link crawlers add, browsers don't
+    r'(?<!cu)bot(?:\b|_)', r'crawl', r'spider', r'scrap', r'slurp',
+    r'archiver', r'indexer', r'scanner', r'validator', r'\+https?://',
+    # Search engines and social networks
+    r'googlebot', r'adsbot-google', r'mediapartners-google',
+    r'google-read-aloud', r'google web preview', r'feedfetcher-google',
+    r'bingbot', r'bingpreview', r'msnbot', r'yandexbot', r'baiduspider',
+    r'duckduckbot', r'duckduckgo-favicons', r'exabot',
+    r'seznambot', r'yeti/', r'petalbot', r'applebot',
+    r'facebookexternalhit', r'facebookcatalog', r'twitterbot',
+    r'linkedinbot', r'pinterestbot', r'slackbot', r'slack-imgproxy',
+    r'discordbot', r'telegrambot', r'^whatsapp/', r'skypeuripreview',
+    r'embedly', r'iframely', r'quora link preview', r'redditbot',
+    r'vkshare', r'w3c_validator', r'ia_archiver', r'archive\.org_bot',
+    # SEO tools
+    r'ahrefs', r'semrush', r'mj12bot', r'dotbot', r'rogerbot', r'blexbot',
+    r'serpstat', r'seokicks', r'dataforseo', r'screaming frog',
+    r'siteauditbot', r'megaindex', r'linkdex', r'spbot', r'ccbot',
+    r'gptbot', r'chatgpt-user', r'claudebot', r'anthropic-ai', r'bytespider',
+    r'amazonbot', r'perplexitybot', r'omgili', r'diffbot', r'cohere-ai',
+    # Uptime and performance monitoring
+    r'pingdom', r'uptimerobot', r'statuscake', r'site24x7', r'newrelic',
+    r'datadog', r'gtmetrix', r'lighthouse', r'pagespeed', r'chrome-lighthouse',
+    r'speedcurve', r'webpagetest', r'catchpoint', r'uptime-kuma',
+    r'updown\.io', r'checkly', r'w3c-checklink', r'linkchecker',
+    # Headless browsers and automation
+    r'headlesschrome', r'phantomjs', r'slimerjs',
+    r'puppeteer', r'playwright', r'selenium', r'webdriver', r'cypress',
+    r'htmlunit', r'prerender', r'rendertron',
+    # HTTP libraries and command line tools
+    r'^curl/', r'^wget/', r'^python', r'python-requests', r'python-urllib',
+    r'aiohttp', r'httpx', r'^java/', r'apache-httpclient', r'okhttp',
+    r'go-http-client', r'^ruby', r'^php', r'guzzlehttp', r'libwww-perl',
+    r'^perl', r'node-fetch', r'axios/', r'^got ', r'undici', r'^dart:',
+    r'postmanruntime', r'insomnia', r'httpie', r'^rest-client',
+    r'winhttp', r'^mozilla/\d\.\d$', r'^mozilla/4\.0 \(compatible;?\)$',
+]
+
+
+def _trie(words):
+    """Return a regular expression matching any of ``words``, with common
+    prefixes factored out so the regex engine doesn't backtrack over
+    every word at every position."""
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def pattern(node):
+        alternatives = [re.escape(char) + pattern(child)
+                        for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        if len(alternatives) == 1 and '' not in node:
+            return alternatives[0]
+        group = '(?:' + '|'.join(alternatives) + ')'
+        return group + '?' if '' in node else group
+
+    return pattern(root)
+
+
+@lru_cache(maxsize=1)
+def matchers():
+    """Return the regular expressions for the start of bot user agents
+    and for anywhere in them."""
+    patterns = PATTERNS + list(settings.BOT_PATTERNS)
+    prefixes = [pattern[1:] for pattern in patterns
+                if pattern.startswith('^')]
+    patterns = [pattern for pattern in patterns
+                if not pattern.startswith('^')]
+    words = [pattern for pattern in patterns
+             if not re.search(r'[\\^$.|?*+()[\]{}]', pattern)]
+    expressions = [pattern for pattern in patterns if pattern not in words]
+    return (re.compile('|'.join(prefixes)),
+            re.compile('|'.join([_trie(words), *expressions])))
+
+
+@lru_cache(maxsize=8192)
+def is_bot(user_agent):
+    """Whether ``user_agent`` is a crawler, bot or headless browser.
+
+    A missing user agent isn't taken for a bot: privacy tools strip it.
+    """
+    if not user_agent:
+        return False
+    user_agent = user_agent.lower()
+    start, anywhere = matchers()
+    return start.match(user_agent) is not None or \
+        anywhere.search(user_agent) is not None
+
+
+def is_bot_request(request):
+    return settings.BOT_FILTER and \
+        is_bot(request.META.get('HTTP_USER_AGENT', ''))
+
+
+@receiver(setting_changed)
+def clear_caches(setting, **kwargs):
+    if setting == 'BOT_PATTERNS':
+        matchers.cache_clear()
+        is_bot.cache_clear()
@@ -0,0 +1,113 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import pageview_writes, pageviews_written
+from .storage import write_pageviews
+
+logger = logging.getLogger(__name__)
+
+
+class PageViewBuffer:
+    """Collect unsaved page views in memory and write them in batches.
+
+    A batch is written to the storage backend once ``max_size`` page
+    views are pending or ``flush_interval`` seconds have passed since the
+    last write, whichever comes first. A daemon thread handles the time
+    based flush so quiet workers don't hold hits indefinitely, and anything
+    still pending is written when the interpreter exits.
+    """
+
+    def __init__(self, max_size=None, flush_interval=None):
+        if max_size is None:
+            max_size = settings.PAGEVIEW_BUFFER_SIZE
+        if flush_interval is None:
+            flush_interval = settings.PAGEVIEW_BUFFER_INTERVAL
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, pageview, block=True):
+        """Queue a page view, flushing if the batch is due.
+
+        With ``block=False`` a due batch is handed to the background thread
+        instead of being written by the caller, which keeps the event loop
+        free in async views. Without a background thread nothing is written
+        and True is returned, the caller then has to flush.
+        """
+        with self._lock:
+            self._pending.append(pageview)
+            due = (len(self._pending) >= self.max_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+            if self._thread is None and self.flush_interval > 0:
+                self._start()
+        if not due:
+            return False
+        if block:
+            self.flush()
+        elif self._thread is not None:
+            self._wake.set()
+        else:
+            return True
+        return False
+
+    def flush(self):
+        """Write all pending page views, returning how many were saved."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+            return self._write(batch)
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def _write(self, batch):
+        with pageview_writes.time('buffer'):
+            saved = write_pageviews(batch)
+        pageviews_written.inc('buffer', amount=saved)
+        return saved
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name='pageview-buffer',
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            woken = self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if (not woken and
+                    time.monotonic() - self._last_flush < self.flush_interval):
+                continue
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Background page view flush failed')
+
+
+pageview_buffer = PageViewBuffer()
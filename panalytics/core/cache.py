@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+# Project fields read at ingest and their defaults. Values other than the
+# default are cached along with the tracking IDs.
+PROJECT_OPTIONS = {
+    'sample_every': 1,
+    'rate_limit': None,
+}
+
+
+class TrackingIdCache:
+    """Bounded, time limited map of tracking IDs to project primary keys.
+
+    Lookups for tracking IDs that don't belong to a project are cached too
+    (as ``None``) with a shorter lifetime, so requests spraying made up IDs
+    don't reach the database either. Entries are dropped in least recently
+    used order once ``max_size`` is reached.
+
+    Saving or deleting a project invalidates its entries in the current
+    process through signals, other processes see the change once the entry
+    expires after ``ttl`` seconds.
+
+    Project settings that apply to hits, listed in PROJECT_OPTIONS, are
+    kept alongside for ``option`` when they aren't the default, and
+    refreshed whenever their tracking ID is loaded.
+    """
+
+    def __init__(self, max_size=None, ttl=None, negative_ttl=None):
+        if max_size is None:
+            max_size = settings.TRACKING_ID_CACHE_SIZE
+        if ttl is None:
+            ttl = settings.TRACKING_ID_CACHE_TTL
+        if negative_ttl is None:
+            negative_ttl = settings.TRACKING_ID_NEGATIVE_CACHE_TTL
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._options = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, tid):
+        return self.lookup(tid)[0]
+
+    def lookup(self, tid):
+        """Return ``(found, project_id)`` without touching the database."""
+        with self._lock:
+            try:
+                project_id, expires = self._entries[tid]
+            except KeyError:
+                return False, None
+            if expires <= time.monotonic():
+                del self._entries[tid]
+                return False, None
+            self._entries.move_to_end(tid)
+            return True, project_id
+
+    def get(self, tid):
+        """Return the project primary key for ``tid`` or None."""
+        found, project_id = self.lookup(tid)
+        if found:
+            return project_id
+
+        from .models import Project
+        project = Project.objects.filter(tid=tid) \
+            .values_list('pk', *PROJECT_OPTIONS).first()
+        project_id, *options = project or (None,)
+        self.set(tid, project_id, **dict(zip(PROJECT_OPTIONS, options)))
+        return project_id
+
+    def get_many(self, tids):
+        """Return a dict of tracking IDs to project primary keys (or None).
+
+        Tracking IDs missing from the cache are loaded with one query.
+        """
+        result, missing = {}, []
+        for tid in tids:
+            found, project_id = self.lookup(tid)
+            if found:
+                result[tid] = project_id
+            else:
+                missing.append(tid)
+
+        if missing:
+            from .models import Project
+            loaded = {tid: (project_id, options)
+                      for tid, project_id, *options in
+                      Project.objects.filter(tid__in=missing)
+                      .values_list('tid', 'pk', *PROJECT_OPTIONS)}
+            for tid in missing:
+                project_id, options = loaded.get(tid, (None, ()))
+                result[tid] = project_id
+                self.set(tid, project_id,
+                         **dict(zip(PROJECT_OPTIONS, options)))
+        return result
+
+    async def aget(self, tid):
+        """Async version of get, only leaving the event loop on a miss."""
+        found, project_id = self.lookup(tid)
+        if found:
+            return project_id
+        return await sync_to_async(self.get)(tid)
+
+    def option(self, tid, name):
+        """Return a PROJECT_OPTIONS field of the project of a tracking ID
+        looked up through this cache, the default for any other."""
+        try:
+            return self._options[tid][1][name]
+        except KeyError:
+            return PROJECT_OPTIONS[name]
+
+    def sample_every(self, tid):
+        return self.option(tid, 'sample_every')
+
+    def set(self, tid, project_id, **options):
+        options = {name: value for name, value in options.items()
+                   if value != PROJECT_OPTIONS[name]}
+        with self._lock:
+            if options:
+                self._options[tid] = (project_id, options)
+            else:
+                self._options.pop(tid, None)
+        ttl = self.ttl if project_id is not None else self.negative_ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[tid] = (project_id, time.monotonic() + ttl)
+            self._entries.move_to_end(tid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_project(self, project_id):
+        with self._lock:
+            stale = [tid for tid, (pk, _) in self._entries.items()
+                     if pk == project_id]
+            for tid in stale:
+                del self._entries[tid]
+            for tid in [tid for tid, (pk, _) in self._options.items()
+                        if pk == project_id]:
+                del self._options[tid]
+
+    def invalidate(self, tid):
+        with self._lock:
+            self._entries.pop(tid, None)
+            self._options.pop(tid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._options.clear()
+
+    def warm(self):
+        """Load the tracking IDs of existing projects, up to ``max_size``."""
+        from .models import Project
+        projects = Project.objects.exclude(tid=None) \
+            .values_list('tid', 'pk', *PROJECT_OPTIONS)[:self.max_size]
+        for tid, project_id, *options in projects:
+            self.set(tid, project_id, **dict(zip(PROJECT_OPTIONS, options)))
+
+
+tracking_ids = TrackingIdCache()
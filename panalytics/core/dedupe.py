@@ -0,0 +1,133 @@
+"""
+Drop repeated hits at ingest.
+
+Reloads, snippets included twice and prefetching send the same hit
+several times within seconds. With DEDUPE_WINDOW set, a hit with the same
+tracking ID, URL, referrer, viewport, client IP and user agent as one
+seen in the last DEDUPE_WINDOW seconds is dropped before it is written.
+
+Recent hits are remembered in two Bloom filters, the current and the
+previous generation, sized for DEDUPE_CAPACITY hits each with a false
+positive rate of DEDUPE_ERROR_RATE, so memory use is fixed whatever the
+traffic. The current filter becomes the previous one once it is
+DEDUPE_WINDOW seconds old or holds DEDUPE_CAPACITY hits. Hits are thus
+remembered for at least a window unless traffic exceeds the capacity,
+and a unique hit is only dropped with the false positive probability.
+Filters are kept per process.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .utils import client_ip
+
+# Hit parameters that make hits duplicates of each other
+KEY_PARAMETERS = ('tid', 'url', 'ref', 'wiw', 'wih')
+
+
+def hit_key(hit, request):
+    """Return what identifies a hit, given its collect parameters."""
+    values = [str(hit.get(name) or '') for name in KEY_PARAMETERS]
+    values += [client_ip(request), request.META.get('HTTP_USER_AGENT', '')]
+    return '\x1f'.join(values).encode('utf-8', 'surrogatepass')
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(bits, 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from two 64 bit hashes
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def contains(self, positions):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, positions):
+        bits = self.bits
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class DuplicateFilter:
+    """Remember hits for DEDUPE_WINDOW seconds in rotating Bloom filters."""
+
+    def __init__(self, window=None, capacity=None, error_rate=None):
+        # Settings are read when used unless given here
+        self._window = window
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._lock = threading.Lock()
+        self._current = self._previous = None
+
+    @property
+    def window(self):
+        return settings.DEDUPE_WINDOW if self._window is None \
+            else self._window
+
+    @property
+    def capacity(self):
+        return settings.DEDUPE_CAPACITY if self._capacity is None \
+            else self._capacity
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def _new_filter(self):
+        error_rate = settings.DEDUPE_ERROR_RATE if self._error_rate is None \
+            else self._error_rate
+        self._started = time.monotonic()
+        return BloomFilter(self.capacity, error_rate)
+
+    def seen(self, key):
+        """Whether ``key`` was seen recently, remembering it if not."""
+        with self._lock:
+            # The current filter only has hits from its first window
+            age = time.monotonic() - self._started \
+                if self._current is not None else None
+            if age is None or age >= 2 * self.window:
+                self._previous = None
+                self._current = self._new_filter()
+            elif age >= self.window or self._current.count >= self.capacity:
+                self._previous = self._current
+                self._current = self._new_filter()
+
+            positions = self._current.positions(key)
+            if self._current.contains(positions) or (
+                self._previous is not None and
+                self._previous.contains(positions)
+            ):
+                return True
+            self._current.add(positions)
+            return False
+
+    def seen_hit(self, hit, request):
+        return self.seen(hit_key(hit, request))
+
+    def reset(self):
+        with self._lock:
+            self._current = self._previous = None
+
+
+duplicate_hits = DuplicateFilter()
+
+
+@receiver(setting_changed)
+def reset_duplicate_filter(setting, **kwargs):
+    if setting.startswith('DEDUPE_'):
+        duplicate_hits.reset()
@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def digest(value):
+    """Return the key a dimension value is unique on.
+
+    Titles and referers can be longer than PostgreSQL allows in a btree
+    index entry, so lookup tables are unique on a hash of the value.
+    """
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+class DimensionCache:
+    """Bounded map of dimension values to the IDs of their lookup rows.
+
+    Lookup rows are never changed or deleted once created, so entries
+    don't expire and are only dropped in least recently used order once
+    ``max_size`` is reached.
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = settings.DIMENSION_CACHE_SIZE
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, model, values):
+        """Return a dict of ``values`` to the IDs of their ``model`` rows.
+
+        Values missing from the cache are looked up with one query and
+        the ones the table doesn't have yet are inserted with another.
+        """
+        result, missing = {}, set()
+        with self._lock:
+            for value in values:
+                try:
+                    result[value] = self._entries[(model, value)]
+                    self._entries.move_to_end((model, value))
+                except KeyError:
+                    missing.add(value)
+
+        if missing:
+            digests = {digest(value): value for value in missing}
+            loaded = self._load(model, digests)
+            if len(loaded) < len(digests):
+                # Concurrent writers may insert the same value, which
+                # ignore_conflicts turns into a no-op before reloading.
+                model.objects.bulk_create(
+                    (model(value=value, digest=key)
+                     for key, value in digests.items() if key not in loaded),
+                    ignore_conflicts=True,
+                )
+                loaded = self._load(model, digests)
+            for key, pk in loaded.items():
+                result[digests[key]] = pk
+                self.set(model, digests[key], pk)
+        return result
+
+    def _load(self, model, digests):
+        return dict(model.objects.filter(digest__in=list(digests))
+                    .values_list('digest', 'pk'))
+
+    def set(self, model, value, pk):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[(model, value)] = pk
+            self._entries.move_to_end((model, value))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+dimensions = DimensionCache()
@@ -0,0 +1,111 @@
+"""
+Streaming exports of a project's page views as CSV or NDJSON.
+
+Rows are produced one at a time, from the archive segments first and then
+from the database through a server side cursor, so memory use doesn't
+depend on the number of page views exported.
+"""
+import csv
+import datetime
+import json
+
+from django.conf import settings
+
+from . import archive
+from .models import PageView, dimension_value
+
+FIELDS = ['timestamp', 'protocol', 'domain', 'path', 'url', 'title',
+          'referer', 'window_width', 'window_height', 'unique_visit',
+          'sample_weight']
+
+# First characters that make spreadsheets evaluate a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(project_id, since=None, until=None, chunk_size=None):
+    """Yield a project's page views in ``[since, until)`` as dicts."""
+    for row in archive.project_rows(project_id, FIELDS, since, until):
+        row['unique_visit'] = bool(row['unique_visit'])
+        yield row
+
+    pageviews = PageView.objects.filter(project_id=project_id)
+    if since:
+        pageviews = pageviews.filter(timestamp__gte=since)
+    if until:
+        pageviews = pageviews.filter(timestamp__lt=until)
+    pageviews = pageviews.order_by('timestamp', 'id').values_list(
+        'timestamp', 'protocol', dimension_value('domain'),
+        dimension_value('path'), 'url', 'query', dimension_value('title'),
+        dimension_value('referer'), 'window_width', 'window_height',
+        'unique_visit', 'sample_weight',
+    )
+    for (timestamp, protocol, domain, path, url, query, title, referer,
+         width, height, unique_visit, sample_weight) in pageviews.iterator(
+            chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE):
+        yield {
+            'timestamp': timestamp,
+            'protocol': protocol,
+            'domain': domain,
+            'path': path,
+            'url': url or f'{protocol}://{domain}{path}{query}',
+            'title': title,
+            'referer': referer,
+            'window_width': width,
+            'window_height': height,
+            'unique_visit': bool(unique_visit),
+            'sample_weight': sample_weight,
+        }
+
+
+class _Line:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    """Quote a string a spreadsheet would run as a formula.
+
+    Titles, paths and referrers come from untrusted hits.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        row['timestamp'] = row['timestamp'].isoformat()
+        yield writer.writerow([_cell(row[field]) for field in FIELDS])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        row['timestamp'] = row['timestamp'].isoformat()
+        yield json.dumps(row) + '\n'
+
+
+def parse_day(value):
+    """Return midnight UTC of a ``YYYY-MM-DD`` date, None if empty.
+
+    Raises ValueError for anything else.
+    """
+    if not value:
+        return None
+    day = datetime.date.fromisoformat(value)
+    return datetime.datetime.combine(day, datetime.time(),
+                                     tzinfo=datetime.timezone.utc)
+
+
+def export_lines(export_format, rows):
+    if export_format == 'csv':
+        return csv_lines(rows)
+    return ndjson_lines(rows)
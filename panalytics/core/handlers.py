@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import response_for_exception
+from django.urls import reverse, set_script_prefix
+
+from . import views
+from .metrics import requests
+
+
+class TrackingASGIHandler(ASGIHandler):
+    """ASGI handler calling the async tracking views without middleware.
+
+    Under ASGI every middleware hook is run through sync_to_async, costing
+    a thread switch each. The tracking script and pixel don't use sessions,
+    auth, CSRF or messages, so requests for them go straight to
+    script_async and collect_async, with the host validated, exceptions
+    turned into responses and timings recorded as the middleware would.
+    Everything else, and every request while QUERY_PROFILING is set, is
+    handled as usual.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._tracking_views = None
+
+    @property
+    def tracking_views(self):
+        if self._tracking_views is None:
+            self._tracking_views = {
+                reverse('script'): ('script', views.script_async),
+                reverse('collect'): ('collect', views.collect_async),
+            }
+        return self._tracking_views
+
+    async def __call__(self, scope, receive, send):
+        name, view = self.tracking_views.get(scope.get('path'), (None, None))
+        if scope['type'] != 'http' or view is None or \
+                settings.QUERY_PROFILING:
+            return await super().__call__(scope, receive, send)
+
+        body_file = await self.read_body(receive)
+        set_script_prefix(self.get_script_prefix(scope))
+        await sync_to_async(signals.request_started.send,
+                            thread_sensitive=True)(sender=self.__class__,
+                                                   scope=scope)
+        request, error_response = self.create_request(scope, body_file)
+        if request is None:
+            return await self.send_response(error_response, send)
+
+        start = time.perf_counter()
+        try:
+            # Raises DisallowedHost unless the host is in ALLOWED_HOSTS
+            request.get_host()
+            response = await view(request)
+        except Exception as exc:
+            response = await sync_to_async(
+                response_for_exception, thread_sensitive=True
+            )(request, exc)
+        requests.observe(time.perf_counter() - start, name,
+                         str(response.status_code))
+        response['Content-Length'] = len(response.content)
+        response._handler_class = self.__class__
+        await self.send_response(response, send)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.utils import timezone
+
+from ...archive import archive
+from ...profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = ('Move page views of old days out of the database into archive '
+            'segments in ARCHIVE_DIR.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int,
+            default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive days that ended at least this many days ago.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of page views read or deleted per '
+                                 'query.')
+
+    def handle(self, *args, **options):
+        before = timezone.now().date() - \
+            timezone.timedelta(days=options['older_than_days'])
+        archived = archive(before, chunk_size=options['chunk_size'])
+        for day, count in archived:
+            self.stdout.write(f'Archived {count} page views of {day}.')
+        if not archived:
+            self.stdout.write('Nothing to archive.')
@@ -0,0 +1,38 @@
+import time
+
+from django.db import DatabaseError, close_old_connections
+
+from ...profiling import ProfiledCommand
+from ...spool import drain
+
+
+class Command(ProfiledCommand):
+    help = ('Load page views spooled by the collect views into storage. '
+            'Runs until interrupted unless --once is given; run a single '
+            'drainer per spool directory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the spool once and exit.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the spool is empty.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Page views written per transaction.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                loaded = drain(batch_size=options['batch_size'])
+            except DatabaseError as error:
+                if options['once']:
+                    raise
+                # Hits stay spooled until the database is back
+                self.stderr.write(f'Drain failed: {error}')
+                close_old_connections()
+                loaded = 0
+            if loaded or options['once']:
+                self.stdout.write(f'Loaded {loaded} page views.')
+            if options['once']:
+                break
+            if not loaded:
+                time.sleep(options['interval'])
@@ -0,0 +1,63 @@
+import functools
+import time
+
+from django.core.management.base import CommandError
+
+from ...export import FORMATS, export_lines, export_rows, parse_day
+from ...models import Project
+from ...profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = "Stream a project's page views as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tid', help='Tracking ID of the project.')
+        parser.add_argument('--format', choices=list(FORMATS),
+                            default='csv')
+        parser.add_argument('--since', help='First day (YYYY-MM-DD).')
+        parser.add_argument('--until',
+                            help='Day after the last day (YYYY-MM-DD).')
+        parser.add_argument('--output', '-o',
+                            help='File to write to instead of stdout.')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Page views fetched per round trip.')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(tid=options['tid']).first()
+        if project is None:
+            raise CommandError(f'No project with tracking ID '
+                               f'{options["tid"]}.')
+        try:
+            since = parse_day(options['since'])
+            until = parse_day(options['until'])
+        except ValueError:
+            raise CommandError('Dates must be YYYY-MM-DD.')
+
+        if options['output']:
+            output = open(options['output'], 'w', newline='')
+            write = output.write
+        else:
+            output = None
+            write = functools.partial(self.stdout.write, ending='')
+
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for count, row in enumerate(rows, 1):
+                yield row
+
+        start = time.perf_counter()
+        try:
+            rows = export_rows(project.pk, since, until,
+                               options['chunk_size'])
+            for line in export_lines(options['format'], counted(rows)):
+                write(line)
+        finally:
+            if output:
+                output.close()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(f'Exported {count} page views in {elapsed:.2f}s '
+                          f'({count / elapsed:.0f} rows/sec).')
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import CommandError
+
+from ...access_log import import_log, open_log
+from ...models import Project
+from ...profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = ('Import page views from nginx/Apache access logs in the '
+            'combined format, plain or gzipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('tid', help='Tracking ID of the project.')
+        parser.add_argument('log', help='Path of the access log.')
+        parser.add_argument('--site', required=True,
+                            help='Scheme and host of the logged site, '
+                                 'e.g. https://example.com.')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Byte offset to resume from (uncompressed '
+                                 'for gzipped logs).')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Page views written per batch.')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(tid=options['tid']).first()
+        if project is None:
+            raise CommandError(f'No project with tracking ID '
+                               f'{options["tid"]}.')
+
+        start = time.perf_counter()
+        total = 0
+        with open_log(options['log']) as log:
+            for count, offset in import_log(log, options['site'],
+                                            project.pk,
+                                            offset=options['offset'],
+                                            batch_size=options['batch_size']):
+                total += count
+                self.stdout.write(f'Imported {total} page views, resume '
+                                  f'with --offset {offset}.')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Imported {total} page views in {elapsed:.2f}s '
+                          f'({total / elapsed:.0f} rows/sec).')
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+
+from ... import partitions
+from ...profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = ('Create upcoming monthly page view partitions and drop the ones '
+            'past the retention period (PostgreSQL only).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Rebuild the page view table as a partitioned table first.'
+        )
+        parser.add_argument(
+            '--months-ahead', type=int,
+            default=settings.PAGEVIEW_PARTITION_MONTHS_AHEAD,
+            help='Number of future months to create partitions for.'
+        )
+        parser.add_argument(
+            '--retention-months', type=int,
+            default=settings.PAGEVIEW_RETENTION_MONTHS,
+            help='Drop partitions older than this many months (0 keeps all).'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL.')
+
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                if not options['convert']:
+                    raise CommandError('The page view table is not '
+                                       'partitioned, run with --convert.')
+                partitions.convert(cursor, options['months_ahead'])
+                self.stdout.write('Converted page views to a partitioned '
+                                  'table.')
+
+            for month in partitions.create_partitions(
+                cursor, options['months_ahead']
+            ):
+                self.stdout.write(
+                    f'Created {partitions.partition_name(month)}'
+                )
+
+            if options['retention_months'] > 0:
+                for month in partitions.drop_partitions(
+                    cursor, options['retention_months']
+                ):
+                    self.stdout.write(
+                        f'Dropped {partitions.partition_name(month)}'
+                    )
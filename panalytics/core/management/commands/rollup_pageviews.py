@@ -0,0 +1,14 @@
+from ...profiling import ProfiledCommand
+from ...rollups import update_rollups
+
+
+class Command(ProfiledCommand):
+    help = 'Add page views recorded since the last run to the rollup tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Number of page view IDs read per batch.')
+
+    def handle(self, *args, **options):
+        processed = update_rollups(batch_size=options['batch_size'])
+        self.stdout.write(f'Rolled up {processed} page views.')
@@ -0,0 +1,207 @@
+"""
+In-process counters and latency histograms in the Prometheus text format.
+
+Nothing is recorded unless METRICS_ENABLED is set, in which case each
+thread updates its own shard of every metric, so recording never takes a
+lock. Rendering sums the shards of the process. With several worker
+processes each one is scraped separately.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _labels(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"'
+                             for name, value in pairs)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards = []
+        REGISTRY.append(self)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            # list.append is atomic, so threads can register concurrently
+            shard = self._local.shard = {}
+            self._shards.append(shard)
+            return shard
+
+    def clear(self):
+        self._local = threading.local()
+        self._shards = []
+
+    def collect(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.collect())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not settings.METRICS_ENABLED:
+            return
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self):
+        """Return the totals of all threads by label values."""
+        totals = {}
+        for shard in list(self._shards):
+            for labels, value in shard.copy().items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def collect(self):
+        for labels, value in sorted(self.values().items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {value}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not settings.METRICS_ENABLED:
+            return
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # counts per bucket (the last one is +Inf), then the sum
+            state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the seconds spent in a ``with`` block."""
+        if not settings.METRICS_ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def timed(self, *labels):
+        """Decorate a function to observe the seconds of every call."""
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not settings.METRICS_ENABLED:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *labels)
+            return wrapper
+        return decorator
+
+    def values(self):
+        """Return ``(bucket counts, sum)`` of all threads by label values."""
+        totals = {}
+        for shard in list(self._shards):
+            for labels, state in shard.copy().items():
+                total = totals.setdefault(labels, [0] * len(state))
+                for index, value in enumerate(list(state)):
+                    total[index] += value
+        return {labels: (state[:-1], state[-1])
+                for labels, state in totals.items()}
+
+    def collect(self):
+        for labels, (counts, total) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                yield (f'{self.name}_bucket'
+                       f'{_labels(self.labels, labels, le=le)} {cumulative}')
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {total}'
+            yield (f'{self.name}_count{_labels(self.labels, labels)} '
+                   f'{cumulative}')
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    return ''.join(metric.render() + '\n' for metric in REGISTRY)
+
+
+def clear():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+hits = Counter(
+    'panalytics_hits_total', 'Hits received by the collect endpoints.',
+    labels=('endpoint', 'outcome'),
+)
+rate_limited = Counter(
+    'panalytics_rate_limited_total',
+    'Hits and script requests dropped by the rate limiter.',
+    labels=('endpoint', 'limit'),
+)
+pageview_writes = Histogram(
+    'panalytics_pageview_write_seconds',
+    'Time spent writing page views to the storage backend.',
+    labels=('source',),
+)
+pageviews_written = Counter(
+    'panalytics_pageviews_written_total', 'Page views written to storage.',
+    labels=('source',),
+)
+reports = Histogram(
+    'panalytics_report_seconds', 'Time spent computing project reports.',
+    labels=('report',),
+)
+requests = Histogram(
+    'panalytics_request_seconds', 'Time spent handling requests.',
+    labels=('view', 'status'),
+)
+request_queries = Histogram(
+    'panalytics_request_queries', 'SQL queries run per request.',
+    labels=('view',), buckets=(0, 1, 2, 5, 10, 25, 50, 100),
+)
+request_db_time = Histogram(
+    'panalytics_request_db_seconds', 'Time spent in the database per request.',
+    labels=('view',),
+)
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import requests
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Time every request by view name and status code.
+
+    Removed from the middleware chain at startup unless METRICS_ENABLED
+    is set, so it costs nothing when metrics are off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        request._metrics_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is not None:
+            match = request.resolver_match
+            view = (match.url_name or match.view_name) if match \
+                else 'unmatched'
+            requests.observe(time.perf_counter() - start, view,
+                             str(response.status_code))
+        return response
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on PostgreSQL, a plain AddIndex on other
+    databases, e.g. SQLite for benchmarks."""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state,
+                                      to_state)
+        else:
+            migrations.AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state,
+                                       to_state)
+        else:
+            migrations.AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking the page view table against writes
+    atomic = False
+
+    dependencies = [
+        ('core', '0003_rollups'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='pageview',
+            index=models.Index(fields=['project', 'timestamp'], name='pageview_project_time_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='pageview',
+            index=models.Index(fields=['project', 'path'], name='pageview_project_path_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='pageview',
+            index=models.Index(condition=models.Q(unique_visit=True), fields=['project', 'timestamp'], name='pageview_unique_time_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageview',
+            name='visitor_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField()),
+                ('sketch', models.BinaryField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='core.project')),
+            ],
+            options={
+                'unique_together': {('project', 'bucket')},
+            },
+        ),
+    ]
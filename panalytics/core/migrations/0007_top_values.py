@@ -0,0 +1,27 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_visitor_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopValues',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('path', 'path'), ('referer', 'referer'), ('title', 'title')], max_length=10)),
+                ('bucket', models.DateField(blank=True, null=True)),
+                ('items', models.JSONField(default=list)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='top_value_summaries', to='core.project')),
+            ],
+            options={
+                'unique_together': {('project', 'dimension', 'bucket')},
+            },
+        ),
+    ]
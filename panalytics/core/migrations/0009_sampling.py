@@ -0,0 +1,29 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:39
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_spool_offsets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageview',
+            name='sample_weight',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='sample_every',
+            field=models.PositiveIntegerField(default=1, help_text='Keep the hits of one in this many visitors, to cap the writes of very busy sites. Reports are scaled back up.', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='visitorsketch',
+            name='sample_weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
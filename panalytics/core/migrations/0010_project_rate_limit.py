@@ -0,0 +1,18 @@
+# Generated by Django 3.1.13 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sampling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='rate_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='Hits per second accepted for this project when rate limiting is enabled, RATE_LIMIT_TID if empty.', null=True),
+        ),
+    ]
@@ -1,12 +1,96 @@
 import re
 
-from django.db import models
-from django.db.models import Count
+from django.conf import settings
+from django.core.validators import MinValueValidator
+from django.db import connection, models
+from django.db.models import (ExpressionWrapper, FilteredRelation,
+                              OuterRef, Q, Subquery, Sum)
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.utils import timezone
-from django.shortcuts import get_object_or_404
 from urllib.parse import urlparse
 
-from .utils import get_tracking_id
+from .cache import tracking_ids
+from .dimensions import digest, dimensions
+from .hll import HyperLogLog
+from .metrics import pageview_writes, pageviews_written, reports
+from .topk import SpaceSaving
+from .utils import get_tracking_id, visitor_hash
+
+
+TRACKING_ID_FORMAT = re.compile(r'PA-[A-Z0-9]{9}$')
+
+# PageView fields holding strings taken from hits
+TEXT_FIELDS = ('protocol', 'domain', 'path', 'url', 'title', 'referer')
+
+# Largest delay accepted between a batched hit and its request (one hour)
+MAX_HIT_AGE_MS = 60 * 60 * 1000
+
+
+def _dimension(value):
+    """Clamp a window dimension to the range of a PositiveIntegerField."""
+    return min(max(int(value), 0), 2147483647)
+
+
+def _text(value, max_length=None):
+    """Drop what databases can't store from a string, lone surrogates and
+    NUL characters, and cut it to ``max_length``."""
+    value = value.encode('utf-8', 'ignore').decode('utf-8')
+    return value.replace('\x00', '')[:max_length]
+
+
+def window_start(days):
+    """Return the start of the hour ``days`` days ago."""
+    since = timezone.now() - timezone.timedelta(days=days)
+    return since.replace(minute=0, second=0, microsecond=0)
+
+
+def rolled_up_total(model, field, **filters):
+    """Subquery summing ``field`` of a project's ``model`` rollups."""
+    rollups = model.objects.filter(project=OuterRef('pk'), **filters) \
+        .order_by().values('project').annotate(total=Sum(field))
+    return Coalesce(Subquery(rollups.values('total')), 0)
+
+
+class ProjectQuerySet(models.QuerySet):
+    def with_view_counts(self, days=(1, 7, 30)):
+        """Annotate each project's view counts in a single query.
+
+        Adds ``total_views``, ``total_unique_views`` and ``views_<n>d`` for
+        each window in ``days``, matching what view_count and
+        unique_view_count return. Rollups are summed in subqueries while
+        page views not yet rolled up are counted with conditional
+        aggregation over a join restricted to those rows.
+        """
+        last_id = RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS)
+        pending = FilteredRelation('pageviews',
+                                   condition=Q(pageviews__id__gt=last_id))
+
+        def total(rolled_up, **filters):
+            # Sampled page views count as many as they stand for
+            pending_count = Coalesce(
+                Sum('pending_views__sample_weight',
+                    filter=Q(**{f'pending_views__{k}': v
+                                for k, v in filters.items()})),
+                0,
+            )
+            return ExpressionWrapper(rolled_up + pending_count,
+                                     output_field=models.BigIntegerField())
+
+        annotations = {
+            'total_views': total(rolled_up_total(DailyRollup, 'views')),
+            'total_unique_views': total(
+                rolled_up_total(DailyRollup, 'unique_views'),
+                unique_visit=True,
+            ),
+        }
+        for n in days:
+            since = window_start(n)
+            annotations[f'views_{n}d'] = total(
+                rolled_up_total(HourlyRollup, 'views', bucket__gte=since),
+                timestamp__gte=since,
+            )
+        return self.annotate(pending_views=pending).annotate(**annotations)
 
 
 class Project(models.Model):
@@ -18,6 +102,20 @@ class Project(models.Model):
         blank=True,
         unique=True
     )
+    sample_every = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text='Keep the hits of one in this many visitors, to cap the '
+                  'writes of very busy sites. Reports are scaled back up.',
+    )
+    rate_limit = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Hits per second accepted for this project when rate '
+                  'limiting is enabled, RATE_LIMIT_TID if empty.',
+    )
+
+    objects = ProjectQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
         if not self.tid:
@@ -26,46 +124,227 @@ class Project(models.Model):
                 self.tid = get_tracking_id()
         super().save(*args, **kwargs)
 
+    @reports.timed('view_count')
     def view_count(self, days=None):
-        q = PageView.objects.filter(project=self)
-        if days:
-            days_ago = timezone.now() - timezone.timedelta(days=days)
-            q = q.filter(timestamp__gte=days_ago)
-        return q.count()
+        return self._view_count(days)
 
+    @reports.timed('unique_view_count')
     def unique_view_count(self, days=None):
-        q = PageView.objects.filter(project=self, unique_visit=True)
-        if days:
-            days_ago = timezone.now() - timezone.timedelta(days=days)
-            q = q.filter(timestamp__gte=days_ago)
-        return q.count()
+        return self._view_count(days, unique=True)
+
+    def _view_count(self, days=None, unique=False):
+        """Count views from the storage backend.
+
+        Windows of ``days`` start on the hour so they line up with the
+        hourly rollups.
+        """
+        from .storage import get_storage
+        since = window_start(days) if days else None
+        return get_storage().count(self.pk, since=since, unique=unique)
+
+    @reports.timed('views_between')
+    def views_between(self, since, until, unique=False):
+        """Count page views in ``[since, until)``, including archived ones.
 
+        Unlike view_count this isn't limited to hourly windows, so it
+        reads the raw page views and the archive segments.
+        """
+        from . import archive
+        pageviews = self.pageviews.filter(timestamp__gte=since,
+                                          timestamp__lt=until)
+        if unique:
+            pageviews = pageviews.filter(unique_visit=True)
+        views = pageviews.aggregate(views=Sum('sample_weight'))['views']
+        return (views or 0) + archive.count_views(self.pk, since, until,
+                                                  unique=unique)
+
+    @reports.timed('top_paths')
     def top_paths(self):
         """Return top five visited paths determined by total view count."""
-        path_values = PageView.objects.filter(project=self.pk).values('path')
-        q = path_values.annotate(count=Count('path')).order_by('-count')
-        path_list = [(x['count'], x['path']) for x in q]
-        return path_list[:5]
+        from .storage import get_storage
+        return get_storage().top(self.pk, 'path')
+
+    @reports.timed('unique_visitor_count')
+    def unique_visitor_count(self, days=None):
+        return Project.unique_visitor_counts([self.pk], days)[self.pk]
 
     @staticmethod
-    def is_valid_tracking_id(tid):
-        if not tid:
-            return False
+    def unique_visitor_counts(project_ids, days=None):
+        """Return the approximate sum of the daily unique visitors of
+        several projects.
 
-        if not re.match(r'PA-[A-Z0-9]{9}$', tid):
-            return False
+        Visitor hashes are salted per day (see utils.visitor_hash), so
+        someone visiting on three days counts three times: over several
+        days this is the number of visitor days, not of distinct people.
+        Daily HyperLogLog sketches are merged with the visitors of page
+        views not yet rolled up, so counts are typically within 1.6% of
+        the exact number (see hll). ``days`` counts today as the first
+        day, since sketches cover whole UTC days.
+
+        Sampled projects only keep one in ``sample_every`` visitors, so
+        the estimate is multiplied by the largest sample weight in range.
+        That is exact while the rate doesn't change within the range.
+        """
+        project_ids = list(project_ids)
+        last_id = RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS)
+        sketches = VisitorSketch.objects.filter(project__in=project_ids)
+        pending = PageView.objects.filter(project__in=project_ids,
+                                          id__gt=last_id) \
+            .exclude(visitor_hash=None)
+        if days:
+            since = timezone.now().date() - timezone.timedelta(days=days - 1)
+            sketches = sketches.filter(bucket__gte=since)
+            pending = pending.filter(timestamp__date__gte=since)
+
+        visitors = {project_id: HyperLogLog() for project_id in project_ids}
+        weights = dict.fromkeys(project_ids, 1)
+        for project_id, sketch, weight in sketches.values_list(
+            'project_id', 'sketch', 'sample_weight'
+        ):
+            visitors[project_id].merge(HyperLogLog.from_bytes(sketch))
+            weights[project_id] = max(weights[project_id], weight)
+        for project_id, value, weight in pending.values_list(
+            'project_id', 'visitor_hash', 'sample_weight'
+        ):
+            visitors[project_id].add(value)
+            weights[project_id] = max(weights[project_id], weight)
+        return {project_id: sketch.count() * weights[project_id]
+                for project_id, sketch in visitors.items()}
+
+    @reports.timed('top_values')
+    def top_values(self, dimension, days=None, limit=5):
+        """Return the most frequent values of a page view dimension.
 
-        if not Project.objects.filter(tid=tid).exists():
+        Reads the Space-Saving summaries kept by update_rollups, so the
+        cost doesn't grow with the number of page views and page views
+        not yet rolled up aren't included. Counts are ``(count, value)``
+        upper bounds, see topk. ``days`` counts today as the first day.
+        """
+        summaries = self.top_value_summaries.filter(dimension=dimension)
+        if days:
+            since = timezone.now().date() - timezone.timedelta(days=days - 1)
+            summaries = summaries.filter(bucket__gte=since)
+        else:
+            summaries = summaries.filter(bucket=None)
+
+        top = SpaceSaving(settings.TOP_VALUES_CAPACITY)
+        for items in summaries.values_list('items', flat=True):
+            top.merge(SpaceSaving.from_list(top.capacity, items))
+        return top.top(limit)
+
+    def top_referers(self, days=None, limit=5):
+        return self.top_values(TopValues.REFERER, days, limit)
+
+    def top_titles(self, days=None, limit=5):
+        return self.top_values(TopValues.TITLE, days, limit)
+
+    @staticmethod
+    def top_paths_for(project_ids, limit=5):
+        """Return the top paths of several projects with a single query.
+
+        Rolled up and pending path counts are combined and ranked per
+        project in SQL so only ``limit`` rows per project are returned.
+        The result maps project IDs to lists of ``(count, path)``.
+        """
+        project_ids = list(project_ids)
+        if not project_ids:
+            return {}
+
+        last_id = RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS)
+        placeholders = ', '.join(['%s'] * len(project_ids))
+        sql = f"""
+            SELECT project_id, path, views FROM (
+                SELECT project_id, path, CAST(SUM(views) AS BIGINT) AS views,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY project_id
+                           ORDER BY SUM(views) DESC, path
+                       ) AS path_rank
+                FROM (
+                    SELECT project_id, path, views
+                    FROM {PathRollup._meta.db_table}
+                    WHERE project_id IN ({placeholders})
+                    UNION ALL
+                    SELECT pageview.project_id,
+                           COALESCE(interned.value, pageview.path),
+                           pageview.sample_weight
+                    FROM {PageView._meta.db_table} AS pageview
+                    LEFT JOIN {Path._meta.db_table} AS interned
+                        ON interned.id = pageview.path_key_id
+                    WHERE pageview.project_id IN ({placeholders})
+                          AND pageview.id > %s
+                ) AS path_counts
+                GROUP BY project_id, path
+            ) AS ranked_paths
+            WHERE path_rank <= %s
+            ORDER BY project_id, path_rank
+        """
+        params = project_ids + project_ids + [last_id, limit]
+
+        top_paths = {}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for project_id, path, views in cursor.fetchall():
+                top_paths.setdefault(project_id, []).append((views, path))
+        return top_paths
+
+    @staticmethod
+    def is_tracking_id_format(tid):
+        return isinstance(tid, str) and \
+            TRACKING_ID_FORMAT.match(tid) is not None
+
+    @staticmethod
+    def is_valid_tracking_id(tid):
+        if not Project.is_tracking_id_format(tid):
             return False
 
-        return True
+        return tracking_ids.get(tid) is not None
 
     def __str__(self):
         return self.name
 
 
+class Dimension(models.Model):
+    """A distinct string repeated across page views, stored once."""
+    value = models.TextField()
+    digest = models.CharField(max_length=40, unique=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.digest = digest(self.value)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.value
+
+
+class Domain(Dimension):
+    pass
+
+
+class Path(Dimension):
+    pass
+
+
+class Title(Dimension):
+    pass
+
+
+class Referer(Dimension):
+    pass
+
+
+def dimension_key(model):
+    # Lookup rows are never deleted and the column is only read through
+    # joins from page views, so it doesn't need an index of its own.
+    return models.ForeignKey(model, null=True, blank=True, editable=False,
+                             db_index=False, on_delete=models.PROTECT,
+                             related_name='+')
+
+
 class PageView(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     project = models.ForeignKey(Project,
                                 on_delete=models.CASCADE,
                                 related_name='pageviews')
@@ -78,12 +357,79 @@ class PageView(models.Model):
     window_height = models.PositiveIntegerField()
     referer = models.TextField(blank=True)
     unique_visit = models.BooleanField()
+    visitor_hash = models.BigIntegerField(null=True, blank=True,
+                                          editable=False)
+    # How many page views this one stands for: the project's sample_every
+    # when it was recorded
+    sample_weight = models.PositiveIntegerField(default=1, editable=False)
+
+    # With INTERN_DIMENSIONS the strings above are left empty and these
+    # point to lookup tables instead, while ``query`` keeps what follows
+    # the path so ``url`` can be rebuilt.
+    query = models.TextField(blank=True, default='')
+    domain_key = dimension_key(Domain)
+    path_key = dimension_key(Path)
+    title_key = dimension_key(Title)
+    referer_key = dimension_key(Referer)
+
+    class Meta:
+        indexes = [
+            # Windowed counts and the admin's per project listing
+            models.Index(fields=['project', 'timestamp'],
+                         name='pageview_project_time_idx'),
+            # Grouping a project's page views by path
+            models.Index(fields=['project', 'path'],
+                         name='pageview_project_path_idx'),
+            # Windowed unique visit counts
+            models.Index(fields=['project', 'timestamp'],
+                         condition=Q(unique_visit=True),
+                         name='pageview_unique_time_idx'),
+        ]
 
     @staticmethod
-    def create_from_request(request):
-        project = get_object_or_404(Project, tid=request.GET.get('tid'))
-        parsed_url = urlparse(request.GET.get('url'))
-        ref = request.GET.get('ref')
+    def parse_request(request, project_id=None):
+        """Return PageView field values parsed from a collect request.
+
+        The project is looked up from the request's tid unless its
+        ``project_id`` is already known.
+        """
+        if project_id is None:
+            project_id = tracking_ids.get(request.GET.get('tid'))
+        if project_id is None:
+            raise Http404
+        fields = PageView.parse_hit(request.GET, project_id)
+        fields['visitor_hash'] = visitor_hash(request, project_id)
+        fields['sample_weight'] = \
+            tracking_ids.sample_every(request.GET.get('tid'))
+        return fields
+
+    @staticmethod
+    def request_sampled_out(request, project_id=None):
+        """Whether the visitor making a collect request is left out of
+        its project's sample, see sampled_out."""
+        tid = request.GET.get('tid')
+        sample_every = tracking_ids.sample_every(tid)
+        if sample_every == 1:
+            return False
+        if project_id is None:
+            project_id = tracking_ids.get(tid)
+        return visitor_hash(request, project_id) % sample_every != 0
+
+    @staticmethod
+    def sampled_out(fields):
+        """Whether parsed page view fields fall outside the sample.
+
+        Visitors are kept or dropped as a whole, by their visitor hash,
+        which changes daily. Hits without a visitor are kept.
+        """
+        return fields.get('visitor_hash') is not None and \
+            fields['visitor_hash'] % fields.get('sample_weight', 1) != 0
+
+    @staticmethod
+    def parse_hit(hit, project_id):
+        """Return PageView field values for a hit's collect parameters."""
+        parsed_url = urlparse(hit.get('url'))
+        ref = hit.get('ref')
 
         # A unique visit is when referrer domain is not the current domain.
         # which means the user is coming from outside the site's domain
@@ -95,15 +441,241 @@ class PageView(models.Model):
             source = source.group(0)
         referer = ref or source
 
-        return PageView.objects.create(
-            project=project,
-            protocol=parsed_url.scheme,
-            domain=parsed_url.netloc,
-            path=parsed_url.path,
-            url=request.GET.get('url'),
-            title=request.GET.get('t') or '',
-            window_width=request.GET.get('wiw') or '0',
-            window_height=request.GET.get('wih') or '0',
-            referer=referer or '',
-            unique_visit=unique_visit
-        )
+        fields = {
+            'project_id': project_id,
+            'protocol': parsed_url.scheme,
+            'domain': parsed_url.netloc,
+            'path': parsed_url.path,
+            'url': hit.get('url'),
+            'title': hit.get('t') or '',
+            'window_width': hit.get('wiw') or '0',
+            'window_height': hit.get('wih') or '0',
+            'referer': referer or '',
+            'unique_visit': unique_visit,
+        }
+        # Hits are untrusted: one unstorable value would fail its batch
+        for name in TEXT_FIELDS:
+            fields[name] = _text(str(fields[name]),
+                                 PageView._meta.get_field(name).max_length)
+        return fields
+
+    @staticmethod
+    def intern(pageviews_fields):
+        """Move repeated strings of parsed page views to lookup tables.
+
+        Does nothing unless INTERN_DIMENSIONS is enabled and page views are
+        stored in the database. Each dict of field values is updated in
+        place to reference the interned strings by ID, with one query per
+        lookup table for values not yet cached.
+        """
+        from .storage import get_storage
+        if not settings.INTERN_DIMENSIONS or not get_storage().uses_orm:
+            return pageviews_fields
+
+        for fields in pageviews_fields:
+            prefix = '{}://{}{}'.format(fields['protocol'], fields['domain'],
+                                        fields['path'])
+            if fields['url'].startswith(prefix):
+                fields['query'] = fields['url'][len(prefix):]
+                fields['url'] = ''
+
+        for name, model in DIMENSIONS.items():
+            ids = dimensions.get_many(
+                model, {fields[name] for fields in pageviews_fields}
+            )
+            for fields in pageviews_fields:
+                fields[f'{name}_key_id'] = ids[fields[name]]
+                fields[name] = ''
+        return pageviews_fields
+
+    @staticmethod
+    def from_hits(hits, received_at=None, request=None):
+        """Return unsaved PageViews for a batch of hits."""
+        parsed = PageView.parse_hits(hits, received_at, request)
+        return [PageView(**fields) for fields in PageView.intern(parsed)]
+
+    @staticmethod
+    def parse_hits(hits, received_at=None, request=None):
+        """Return PageView field values for a batch of hits.
+
+        Hits are dicts of the collect parameters plus ``a``, the number of
+        milliseconds the hit waited in the browser before being sent. All
+        tracking IDs are resolved together and malformed hits or hits for
+        unknown projects are skipped. Visitors are identified from the
+        ``request`` that sent the batch, if given, in which case the hits
+        are weighted by their project's sampling rate.
+        """
+        received_at = received_at or timezone.now()
+        hits = [hit for hit in hits
+                if isinstance(hit, dict) and
+                isinstance(hit.get('url'), str) and
+                Project.is_tracking_id_format(hit.get('tid'))]
+        project_ids = tracking_ids.get_many({hit['tid'] for hit in hits})
+
+        parsed = []
+        for hit in hits:
+            project_id = project_ids.get(hit['tid'])
+            if project_id is None:
+                continue
+            try:
+                fields = PageView.parse_hit(hit, project_id)
+                fields['window_width'] = _dimension(fields['window_width'])
+                fields['window_height'] = _dimension(fields['window_height'])
+                age = min(max(int(hit.get('a') or 0), 0), MAX_HIT_AGE_MS)
+            except (TypeError, ValueError, AttributeError, OverflowError):
+                continue
+            fields['timestamp'] = received_at - \
+                timezone.timedelta(milliseconds=age)
+            if request is not None:
+                fields['visitor_hash'] = visitor_hash(request, project_id,
+                                                      received_at.date())
+                fields['sample_weight'] = tracking_ids.sample_every(hit['tid'])
+            parsed.append(fields)
+        return parsed
+
+    @staticmethod
+    def from_request(request, project_id=None):
+        """Return an unsaved PageView for a collect request."""
+        fields = PageView.parse_request(request, project_id)
+        return PageView(**PageView.intern([fields])[0])
+
+    @staticmethod
+    def create_from_request(request):
+        from .storage import get_storage
+        pageview = PageView.from_request(request)
+        with pageview_writes.time('direct'):
+            get_storage().write([pageview])
+        pageviews_written.inc('direct')
+        return pageview
+
+    def get_dimension(self, name):
+        """Return the value of a dimension, whether interned or not."""
+        key = getattr(self, f'{name}_key')
+        return key.value if key is not None else getattr(self, name)
+
+    def get_url(self):
+        if self.url or self.domain_key_id is None:
+            return self.url
+        return '{}://{}{}{}'.format(self.protocol,
+                                    self.get_dimension('domain'),
+                                    self.get_dimension('path'),
+                                    self.query)
+
+
+# PageView fields that can be interned and their lookup tables
+DIMENSIONS = {
+    'domain': Domain,
+    'path': Path,
+    'title': Title,
+    'referer': Referer,
+}
+
+
+def dimension_value(name):
+    """Expression for a page view dimension, whether interned or not."""
+    return Coalesce(f'{name}_key__value', name,
+                    output_field=models.TextField())
+
+
+class HourlyRollup(models.Model):
+    project = models.ForeignKey(Project,
+                                on_delete=models.CASCADE,
+                                related_name='hourly_rollups')
+    bucket = models.DateTimeField()
+    views = models.PositiveBigIntegerField(default=0)
+    unique_views = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('project', 'bucket')
+
+
+class DailyRollup(models.Model):
+    project = models.ForeignKey(Project,
+                                on_delete=models.CASCADE,
+                                related_name='daily_rollups')
+    bucket = models.DateField()
+    views = models.PositiveBigIntegerField(default=0)
+    unique_views = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('project', 'bucket')
+
+
+class PathRollup(models.Model):
+    project = models.ForeignKey(Project,
+                                on_delete=models.CASCADE,
+                                related_name='path_rollups')
+    bucket = models.DateField()
+    path = models.CharField(max_length=255, blank=True)
+    views = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('project', 'bucket', 'path')
+
+
+class VisitorSketch(models.Model):
+    """HyperLogLog sketch of the visitors of a project on one day."""
+    project = models.ForeignKey(Project,
+                                on_delete=models.CASCADE,
+                                related_name='visitor_sketches')
+    bucket = models.DateField()
+    sketch = models.BinaryField()
+    # Largest sample weight of the visitors added, see Project.sample_every
+    sample_weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('project', 'bucket')
+
+
+class TopValues(models.Model):
+    """Space-Saving summary of a project's most frequent values.
+
+    Kept per page view dimension for each day and, with a null bucket,
+    for all time.
+    """
+    PATH = 'path'
+    REFERER = 'referer'
+    TITLE = 'title'
+    DIMENSIONS = [PATH, REFERER, TITLE]
+
+    project = models.ForeignKey(Project,
+                                on_delete=models.CASCADE,
+                                related_name='top_value_summaries')
+    dimension = models.CharField(max_length=10,
+                                 choices=[(d, d) for d in DIMENSIONS])
+    bucket = models.DateField(null=True, blank=True)
+    items = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ('project', 'dimension', 'bucket')
+
+
+class RollupWatermark(models.Model):
+    """Highest page view ID folded into the rollup tables."""
+    PAGEVIEWS = 'pageviews'
+
+    name = models.CharField(max_length=30, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # Highest ID when last checked, rolled up once ROLLUP_LAG has passed
+    seen_id = models.BigIntegerField(default=0)
+    seen_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def last_id_for(name):
+        last_id = RollupWatermark.objects.filter(name=name) \
+            .values_list('last_id', flat=True).first()
+        return last_id or 0
+
+    def __str__(self):
+        return f'{self.name} ({self.last_id})'
+
+
+class SpoolOffset(models.Model):
+    """Bytes of a spool segment already loaded into storage."""
+    segment = models.CharField(max_length=64, unique=True)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.segment} ({self.offset})'
@@ -0,0 +1,164 @@
+"""
+Monthly range partitioning of the page view table on PostgreSQL.
+
+``convert`` turns the regular ``core_pageview`` table into a table
+partitioned by month on ``timestamp``. Afterwards ``create_partitions``
+keeps partitions ready ahead of time and ``drop_partitions`` detaches and
+drops months past the retention period, which replaces a mass DELETE.
+Rows outside every monthly partition land in a default partition.
+"""
+import datetime
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PageView
+
+TABLE = PageView._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def month_start(value):
+    """Return midnight UTC on the first day of ``value``'s month."""
+    value = value.astimezone(datetime.timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def partition_month(name):
+    """Return the month a partition covers or None for other tables."""
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return datetime.datetime(int(match.group(1)), int(match.group(2)), 1,
+                             tzinfo=datetime.timezone.utc)
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table '
+                   'WHERE partrelid = %s::regclass', [TABLE])
+    return cursor.fetchone() is not None
+
+
+def partitions(cursor):
+    """Return the months that have a partition, oldest first."""
+    cursor.execute('SELECT child.relname FROM pg_inherits '
+                   'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                   'WHERE pg_inherits.inhparent = %s::regclass', [TABLE])
+    months = (partition_month(row[0]) for row in cursor.fetchall())
+    return sorted(month for month in months if month)
+
+
+def create_partition(cursor, month):
+    """Create the partition for ``month``.
+
+    Rows of that month already in the default partition are moved into
+    the new partition, since PostgreSQL refuses to attach a range that
+    overlaps rows in the default partition.
+    """
+    name = connection.ops.quote_name(partition_name(month))
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic():
+        cursor.execute(
+            'CREATE TEMPORARY TABLE pageview_moved AS '
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+            'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            'SELECT * FROM moved', bounds
+        )
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {TABLE} '
+                       'FOR VALUES FROM (%s) TO (%s)', bounds)
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM pageview_moved')
+        cursor.execute('DROP TABLE pageview_moved')
+
+
+def create_partitions(cursor, months_ahead, now=None):
+    """Create missing partitions from this month to ``months_ahead``."""
+    current = month_start(now or timezone.now())
+    existing = set(partitions(cursor))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_partition(cursor, month)
+            created.append(month)
+    return created
+
+
+def drop_partitions(cursor, retention_months, now=None):
+    """Detach and drop partitions entirely older than the retention."""
+    cutoff = add_months(month_start(now or timezone.now()),
+                        -retention_months)
+    dropped = []
+    for month in partitions(cursor):
+        if add_months(month, 1) > cutoff:
+            break
+        name = connection.ops.quote_name(partition_name(month))
+        with transaction.atomic():
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            cursor.execute(f'DROP TABLE {name}')
+        dropped.append(month)
+    return dropped
+
+
+def convert(cursor, months_ahead, now=None):
+    """Rebuild the page view table as a partitioned table.
+
+    Existing rows are copied into monthly partitions, indexes and foreign
+    keys are recreated and the ID sequence carries over. The table is
+    locked for the duration, so run this during a maintenance window.
+    """
+    legacy = f'{TABLE}_unpartitioned'
+    with transaction.atomic():
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute('SELECT indexname, indexdef FROM pg_indexes '
+                       'WHERE tablename = %s AND indexname != %s',
+                       [TABLE, f'{TABLE}_pkey'])
+        indexes = cursor.fetchall()
+        cursor.execute('SELECT conname, pg_get_constraintdef(oid) '
+                       'FROM pg_constraint '
+                       "WHERE conrelid = %s::regclass AND contype = 'f'",
+                       [TABLE])
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN("timestamp") FROM {TABLE}')
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {legacy}')
+        cursor.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT '
+                       f'{TABLE}_pkey TO {legacy}_pkey')
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {legacy} '
+                       'INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                       'PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey '
+                       'PRIMARY KEY (id, "timestamp")')
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} '
+                       f'PARTITION OF {TABLE} DEFAULT')
+
+        current = month_start(now or timezone.now())
+        month = month_start(oldest) if oldest else current
+        while month <= add_months(current, months_ahead):
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {legacy}')
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT '
+                           f'{connection.ops.quote_name(name)} {definition}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id')
+        cursor.execute(f'DROP TABLE {legacy}')
@@ -0,0 +1,92 @@
+"""
+Count SQL queries and time spent in the database.
+
+``QueryProfile`` wraps query execution on every database connection of
+the current thread. With QUERY_PROFILING set, ``QueryProfileMiddleware``
+profiles each request and management commands based on
+``ProfiledCommand`` profile each run. Results are logged, sent to
+browsers in a Server-Timing header and recorded as metrics. Tests use the
+same profile to hold hot paths to a query budget.
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from .metrics import request_db_time, request_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfile:
+    """Context manager counting the queries run while it is active.
+
+    With ``record`` the SQL of every query is kept in ``statements``.
+    """
+
+    def __init__(self, record=False):
+        self.record = record
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+            if self.record:
+                self.statements.append(sql)
+
+    def __str__(self):
+        return f'{self.count} queries, {self.seconds * 1000:.1f} ms'
+
+
+class QueryProfileMiddleware:
+    """Profile the queries of every request when QUERY_PROFILING is set."""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryProfile() as profile:
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        logger.info('%s %s: %s', request.method, request.path, profile)
+        request_queries.observe(profile.count, view)
+        request_db_time.observe(profile.seconds, view)
+        response['Server-Timing'] = 'db;dur={:.1f};desc="{} queries"'.format(
+            profile.seconds * 1000, profile.count)
+        return response
+
+
+class ProfiledCommand(BaseCommand):
+    """Command reporting its queries on stderr when QUERY_PROFILING is set."""
+
+    def execute(self, *args, **options):
+        if not settings.QUERY_PROFILING:
+            return super().execute(*args, **options)
+        with QueryProfile() as profile:
+            output = super().execute(*args, **options)
+        logger.info('%s: %s', type(self).__module__, profile)
+        self.stderr.write(f'Database: {profile}')
+        return output
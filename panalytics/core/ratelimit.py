@@ -0,0 +1,189 @@
+"""
+Token bucket rate limiting of hits and script requests.
+
+With RATE_LIMIT_ENABLED every client IP and every tracking ID gets a
+bucket refilled at its rate (RATE_LIMIT_IP and RATE_LIMIT_TID, or the
+project's ``rate_limit``, in hits per second) that holds RATE_LIMIT_BURST
+seconds worth of hits. A request takes a token from both buckets and is
+dropped when either is empty, so a runaway client can't flood the
+database, nor can a misbehaving page flood one project. A batch takes a
+token per hit from the client IP's bucket and from the bucket of each
+hit's tracking ID.
+
+Buckets are kept in process memory by default. Each worker then allows
+the full rate, so with several workers RATE_LIMIT_CACHE names a Django
+cache to share them. Since the cache API has no atomic read-modify-write
+beyond ``incr``, shared buckets are approximated by counting hits in
+windows of RATE_LIMIT_BURST seconds.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .cache import tracking_ids
+from .metrics import rate_limited
+from .models import Project
+from .utils import client_ip
+
+
+class Buckets:
+    def take(self, key, rate, burst, cost=1):
+        """Take ``cost`` tokens, returning whether there were enough."""
+        return self.take_all([(key, rate, burst, cost)]) is None
+
+    def take_all(self, limits):
+        """Take tokens from several buckets, all or none.
+
+        ``limits`` are ``(key, rate, burst, cost)`` tuples. Returns the key
+        of the first bucket without enough tokens, in which case none are
+        taken, or None.
+        """
+        raise NotImplementedError
+
+
+class MemoryBuckets(Buckets):
+    """Token buckets of this process, the least recently used dropped
+    once there are more than ``max_keys``.
+
+    A cost above ``burst`` is allowed on a full bucket and leaves it in
+    debt.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take_all(self, limits):
+        now = time.monotonic()
+        with self._lock:
+            remaining = []
+            for key, rate, burst, cost in limits:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens < min(cost, burst):
+                    return key
+                remaining.append((key, tokens - cost))
+            for key, tokens in remaining:
+                self._buckets.pop(key, None)
+                self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return None
+
+
+class CacheBuckets(Buckets):
+    """Buckets shared through the Django cache named ``alias``.
+
+    Buckets are checked before any is counted against, so concurrent
+    requests may slightly exceed the burst. Like in MemoryBuckets, a cost
+    above ``burst`` is only allowed in an unused window.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take_all(self, limits):
+        cache = caches[self.alias]
+        windows = []
+        for key, rate, burst, cost in limits:
+            window = max(burst / rate, 1)
+            windows.append((f'ratelimit:{key}:{int(time.time() // window)}',
+                            math.ceil(window) + 1))
+        used = cache.get_many([window_key for window_key, _ in windows])
+        for (key, _, burst, cost), (window_key, _) in zip(limits, windows):
+            if used.get(window_key, 0) + min(cost, burst) > burst:
+                return key
+
+        for (_, _, _, cost), (window_key, timeout) in zip(limits, windows):
+            cache.add(window_key, 0, timeout=timeout)
+            try:
+                cache.incr(window_key, cost)
+            except ValueError:
+                # Evicted since it was added
+                cache.set(window_key, cost, timeout=timeout)
+        return None
+
+
+class RateLimiter:
+    def __init__(self):
+        self._buckets = None
+
+    @property
+    def enabled(self):
+        return settings.RATE_LIMIT_ENABLED
+
+    @property
+    def buckets(self):
+        if self._buckets is None:
+            if settings.RATE_LIMIT_CACHE:
+                self._buckets = CacheBuckets(settings.RATE_LIMIT_CACHE)
+            else:
+                self._buckets = MemoryBuckets(settings.RATE_LIMIT_MAX_KEYS)
+        return self._buckets
+
+    def reset(self):
+        self._buckets = None
+
+    def exceeded(self, request, tids, cost=1):
+        """Return the limit a request exceeds, ``ip`` or ``tid``, or None.
+
+        ``tids`` maps the tracking IDs of the request's hits to their
+        number and ``cost`` is the number of hits. Tokens are only taken
+        when the client IP and every tracking ID have enough. Tracking IDs
+        that can't be valid aren't limited, those hits are dropped anyway.
+        """
+        burst = settings.RATE_LIMIT_BURST
+        limits = []
+        rate = settings.RATE_LIMIT_IP
+        if rate:
+            limits.append((f'ip:{client_ip(request)}', rate, rate * burst,
+                           cost))
+        for tid, hits in tids.items():
+            if not Project.is_tracking_id_format(tid):
+                continue
+            rate = tracking_ids.option(tid, 'rate_limit') or \
+                settings.RATE_LIMIT_TID
+            if rate:
+                limits.append((f'tid:{tid}', rate, rate * burst, hits))
+        key = self.buckets.take_all(limits) if limits else None
+        return key.partition(':')[0] if key else None
+
+    def allow(self, request, endpoint, tid, cost=1):
+        """Whether to handle a request of ``cost`` hits for ``tid``,
+        counting it as dropped if not."""
+        return self.allow_many(request, endpoint, {tid: cost}, cost)
+
+    async def aallow(self, request, endpoint, tid, cost=1):
+        """Async version of allow, only leaving the event loop when the
+        buckets are in a cache."""
+        if not self.enabled or isinstance(self.buckets, MemoryBuckets):
+            return self.allow(request, endpoint, tid, cost)
+        return await sync_to_async(self.allow)(request, endpoint, tid, cost)
+
+    def allow_many(self, request, endpoint, tids, cost):
+        """Whether to handle a request of ``cost`` hits, ``tids`` mapping
+        tracking IDs to their hits, counting it as dropped if not."""
+        if not self.enabled:
+            return True
+        limit = self.exceeded(request, tids, cost)
+        if limit is None:
+            return True
+        rate_limited.inc(endpoint, limit, amount=cost)
+        return False
+
+
+rate_limiter = RateLimiter()
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    if setting.startswith('RATE_LIMIT_'):
+        rate_limiter.reset()
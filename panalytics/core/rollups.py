@@ -0,0 +1,240 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import (DailyRollup, HourlyRollup, PageView, Path, PathRollup,
+                     RollupWatermark, TopValues, VisitorSketch,
+                     dimension_value)
+from .topk import SpaceSaving
+
+
+def update_rollups(batch_size=50000, lag=None):
+    """Fold page views added since the last run into the rollup tables.
+
+    Page views are read in ID ranges of ``batch_size`` starting after the
+    stored watermark, up to the highest ID seen ``lag`` seconds
+    (ROLLUP_LAG by default) ago. Each range is aggregated and added to the
+    existing rollups in the same transaction that advances the watermark,
+    so an interrupted run never counts a page view twice. Returns the
+    number of views rolled up, sampled page views counting for their
+    sample weight.
+    """
+    max_id = _settled_max_id(settings.ROLLUP_LAG if lag is None else lag)
+    processed = 0
+
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update() \
+                .get_or_create(name=RollupWatermark.PAGEVIEWS)
+            if watermark.last_id >= max_id:
+                return processed
+
+            upper = min(watermark.last_id + batch_size, max_id)
+            pageviews = PageView.objects.filter(id__gt=watermark.last_id,
+                                                id__lte=upper).order_by()
+            processed += _rollup_views(pageviews)
+            _rollup_paths(pageviews)
+            _rollup_visitors(pageviews)
+            _rollup_top_values(pageviews)
+
+            watermark.last_id = upper
+            watermark.save()
+
+
+def _settled_max_id(lag):
+    """Return the highest page view ID that is safe to roll up.
+
+    A transaction may get an ID below one already committed and commit
+    after it, so the latest IDs can have gaps that fill in later. Each
+    call records the current highest ID and the time, and the one recorded
+    at least ``lag`` seconds earlier is returned, by when the inserts that
+    were under way have finished.
+    """
+    max_id = PageView.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    if lag <= 0:
+        return max_id
+
+    now = timezone.now()
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update() \
+            .get_or_create(name=RollupWatermark.PAGEVIEWS)
+        settled = watermark.last_id
+        if watermark.seen_at is None or \
+                watermark.seen_at <= now - timezone.timedelta(seconds=lag):
+            settled = max(settled, watermark.seen_id)
+            watermark.seen_id = max_id
+            watermark.seen_at = now
+            watermark.save()
+    return settled
+
+
+def _rollup_views(pageviews):
+    hours = pageviews.annotate(bucket=TruncHour('timestamp')) \
+        .values('project_id', 'bucket') \
+        .annotate(views=Sum('sample_weight'),
+                  unique_views=Sum('sample_weight',
+                                   filter=Q(unique_visit=True)))
+
+    hourly = defaultdict(Counter)
+    daily = defaultdict(Counter)
+    for row in hours:
+        counts = {'views': row['views'],
+                  'unique_views': row['unique_views'] or 0}
+        hourly[(row['project_id'], row['bucket'])].update(counts)
+        daily[(row['project_id'], row['bucket'].date())].update(counts)
+
+    processed = sum(counts['views'] for counts in daily.values())
+    _merge(HourlyRollup, ('project_id', 'bucket'), hourly)
+    _merge(DailyRollup, ('project_id', 'bucket'), daily)
+    return processed
+
+
+def _rollup_paths(pageviews):
+    # Interned paths are grouped by their ID and resolved afterwards.
+    paths = pageviews.annotate(bucket=TruncDate('timestamp')) \
+        .values('project_id', 'bucket', 'path', 'path_key') \
+        .annotate(views=Sum('sample_weight'))
+    paths = list(paths)
+    interned = dict(Path.objects.filter(
+        pk__in={row['path_key'] for row in paths if row['path_key']}
+    ).values_list('pk', 'value'))
+
+    # Interned paths aren't limited in length, rolled up ones are
+    max_length = PathRollup._meta.get_field('path').max_length
+    daily = defaultdict(Counter)
+    for row in paths:
+        path = interned.get(row['path_key'], row['path'])[:max_length]
+        daily[(row['project_id'], row['bucket'], path)]['views'] += \
+            row['views']
+
+    _merge(PathRollup, ('project_id', 'bucket', 'path'), daily)
+
+
+def _rollup_visitors(pageviews):
+    visitors = pageviews.exclude(visitor_hash=None) \
+        .annotate(bucket=TruncDate('timestamp')) \
+        .values_list('project_id', 'bucket', 'visitor_hash',
+                     'sample_weight').distinct()
+
+    sketches = defaultdict(HyperLogLog)
+    weights = defaultdict(lambda: 1)
+    for project_id, bucket, value, weight in visitors:
+        sketches[(project_id, bucket)].add(value)
+        weights[(project_id, bucket)] = max(weights[(project_id, bucket)],
+                                            weight)
+    if not sketches:
+        return
+
+    buckets = [key[1] for key in sketches]
+    existing = VisitorSketch.objects.filter(
+        project_id__in={key[0] for key in sketches},
+        bucket__range=(min(buckets), max(buckets)),
+    )
+    to_update = []
+    for rollup in existing:
+        key = (rollup.project_id, rollup.bucket)
+        sketch = sketches.pop(key, None)
+        if sketch is None:
+            continue
+        sketch.merge(HyperLogLog.from_bytes(rollup.sketch))
+        rollup.sketch = sketch.to_bytes()
+        rollup.sample_weight = max(rollup.sample_weight, weights[key])
+        to_update.append(rollup)
+
+    VisitorSketch.objects.bulk_update(to_update, ['sketch', 'sample_weight'])
+    VisitorSketch.objects.bulk_create(
+        VisitorSketch(project_id=project_id, bucket=bucket,
+                      sketch=sketch.to_bytes(),
+                      sample_weight=weights[(project_id, bucket)])
+        for (project_id, bucket), sketch in sketches.items()
+    )
+
+
+def _rollup_top_values(pageviews):
+    """Add the batch's counts to the daily and all time summaries."""
+    for dimension in TopValues.DIMENSIONS:
+        counts = pageviews.annotate(bucket=TruncDate('timestamp'),
+                                    value=dimension_value(dimension)) \
+            .exclude(value='') \
+            .values_list('project_id', 'bucket', 'value') \
+            .annotate(views=Sum('sample_weight'))
+        counts = list(counts)
+        if not counts:
+            continue
+
+        project_ids = {row[0] for row in counts}
+        buckets = {row[1] for row in counts}
+        summaries = {
+            (summary.project_id, summary.bucket): summary
+            for summary in TopValues.objects.filter(
+                Q(bucket__in=buckets) | Q(bucket=None),
+                project_id__in=project_ids,
+                dimension=dimension,
+            )
+        }
+        tops = {key: SpaceSaving.from_list(settings.TOP_VALUES_CAPACITY,
+                                           summary.items)
+                for key, summary in summaries.items()}
+
+        for project_id, bucket, value, views in counts:
+            for key in ((project_id, bucket), (project_id, None)):
+                if key not in tops:
+                    tops[key] = SpaceSaving(settings.TOP_VALUES_CAPACITY)
+                tops[key].add(value, views)
+
+        to_update, to_create = [], []
+        for (project_id, bucket), top in tops.items():
+            summary = summaries.get((project_id, bucket))
+            if summary is None:
+                to_create.append(TopValues(project_id=project_id,
+                                           dimension=dimension,
+                                           bucket=bucket,
+                                           items=top.to_list()))
+            else:
+                summary.items = top.to_list()
+                to_update.append(summary)
+        TopValues.objects.bulk_update(to_update, ['items'])
+        TopValues.objects.bulk_create(to_create)
+
+
+def _merge(model, key_fields, rows):
+    """Add the counts in ``rows`` to the matching rollups of ``model``.
+
+    ``rows`` maps a tuple of ``key_fields`` values to a Counter of fields
+    to increment, and is consumed. Existing rollups are loaded and updated
+    in bulk, the rest are created.
+    """
+    if not rows:
+        return
+
+    buckets = [key[1] for key in rows]
+    existing = model.objects.filter(
+        project_id__in={key[0] for key in rows},
+        bucket__range=(min(buckets), max(buckets)),
+    )
+    if 'path' in key_fields:
+        existing = existing.filter(path__in={key[2] for key in rows})
+
+    to_update = []
+    for rollup in existing:
+        key = tuple(getattr(rollup, field) for field in key_fields)
+        counts = rows.pop(key, None)
+        if counts is None:
+            continue
+        for field, value in counts.items():
+            setattr(rollup, field, getattr(rollup, field) + value)
+        to_update.append(rollup)
+
+    if to_update:
+        count_fields = [field.name for field in model._meta.concrete_fields
+                        if field.name in ('views', 'unique_views')]
+        model.objects.bulk_update(to_update, count_fields)
+    model.objects.bulk_create(
+        model(**dict(zip(key_fields, key)), **counts)
+        for key, counts in rows.items()
+    )
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import PROJECT_OPTIONS, tracking_ids
+from .models import Project
+
+
+@receiver(post_save, sender=Project)
+def cache_project_tracking_id(sender, instance, **kwargs):
+    # The tid may have changed, so drop whatever was cached for the project
+    tracking_ids.invalidate_project(instance.pk)
+    tracking_ids.set(instance.tid, instance.pk,
+                     **{name: getattr(instance, name)
+                        for name in PROJECT_OPTIONS})
+
+
+@receiver(post_delete, sender=Project)
+def uncache_project_tracking_id(sender, instance, **kwargs):
+    tracking_ids.invalidate_project(instance.pk)
+    tracking_ids.invalidate(instance.tid)
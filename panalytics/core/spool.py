@@ -0,0 +1,294 @@
+"""
+Durable local spool of parsed hits.
+
+With SPOOL_ENABLED the collect views append each hit to a spool file
+instead of writing it to the database, and the ``drain_spool`` command
+loads spooled hits into storage in bulk. Hits are kept while the database
+is slow or down instead of blocking requests or being dropped.
+
+Every process writes its own segments, files of SPOOL_SEGMENT_SIZE bytes
+allocated up front and written through a memory map. Segments are named
+``<creation time in ns>-<pid>.spool`` so they sort in creation order. A
+record is a little endian header of the payload length and its CRC-32
+followed by the payload, the hit's field values as JSON. The length is
+written last, so a zero length marks the end of the written records and
+readers never see a partial record. A segment closed by its writer ends
+with a length of ``SEALED``.
+
+SPOOL_FSYNC controls when segments are flushed to disk: after every hit
+(``always``), at most every SPOOL_FSYNC_INTERVAL seconds (``interval``)
+or when the operating system decides (``never``). The spool never grows
+beyond SPOOL_MAX_BYTES: once full, ``append`` returns False and the
+caller writes to the database directly, which slows requests down
+instead of losing hits.
+
+The drainer records how far it has loaded each segment in SpoolOffset,
+in the same transaction as the page views when storage is the database,
+so a crashed drainer resumes where it stopped without duplicates. Fully
+loaded segments are deleted once sealed or once their writer process has
+exited. Writers hold an advisory lock (flock) on their open segment, which
+the kernel releases however the process ends, so that drainers can tell
+without relying on process IDs, which don't carry across containers and
+get reused.
+"""
+import atexit
+import datetime
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+
+from .archive import from_micros, to_micros
+from .models import PageView, Project, SpoolOffset
+from .storage import write_pageviews
+from .timeseries import forget_buckets
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<II')
+SEALED = 0xFFFFFFFF
+SUFFIX = '.spool'
+
+
+def _encode(fields):
+    fields = dict(fields)
+    fields['timestamp'] = to_micros(fields.get('timestamp') or
+                                    datetime.datetime.now(
+                                        datetime.timezone.utc))
+    return json.dumps(fields, separators=(',', ':')).encode()
+
+
+def _decode(payload):
+    fields = json.loads(payload)
+    fields['timestamp'] = from_micros(fields['timestamp'])
+    return fields
+
+
+class SpoolWriter:
+    """Append records to this process's current spool segment."""
+
+    def __init__(self, directory=None, segment_size=None, max_bytes=None,
+                 fsync=None, fsync_interval=None):
+        # Settings are read when used unless given here
+        self._settings = {
+            'SPOOL_DIR': directory,
+            'SPOOL_SEGMENT_SIZE': segment_size,
+            'SPOOL_MAX_BYTES': max_bytes,
+            'SPOOL_FSYNC': fsync,
+            'SPOOL_FSYNC_INTERVAL': fsync_interval,
+        }
+        self._lock = threading.Lock()
+        self._map = None
+        self._file = None
+        self._pid = None
+        self._full_until = 0
+        self._closing = False
+
+    def _setting(self, name):
+        value = self._settings[name]
+        return getattr(settings, name) if value is None else value
+
+    @property
+    def enabled(self):
+        return settings.SPOOL_ENABLED
+
+    @property
+    def directory(self):
+        return self._setting('SPOOL_DIR')
+
+    @property
+    def segment_size(self):
+        return self._setting('SPOOL_SEGMENT_SIZE')
+
+    def append(self, fields):
+        """Spool a hit's PageView field values.
+
+        Returns False without spooling if the spool is full.
+        """
+        record = _encode(fields)
+        size = HEADER.size + len(record)
+        if size + HEADER.size > self.segment_size:
+            raise ValueError('Hit too large for a spool segment')
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's segment and lock belong to the
+                # parent, so drop this process's copies
+                if self._map is not None:
+                    self._map.close()
+                    self._file.close()
+                self._map = self._file = None
+                self._pid = os.getpid()
+            if self._map is None or \
+                    self._offset + size + HEADER.size > self.segment_size:
+                if not self._rotate():
+                    return False
+            offset = self._offset
+            self._map[offset + HEADER.size:offset + size] = record
+            self._map[offset:offset + HEADER.size] = HEADER.pack(
+                len(record), zlib.crc32(record))
+            self._offset += size
+            self._sync()
+        return True
+
+    def close(self):
+        """Seal the current segment."""
+        with self._lock:
+            if self._map is not None and self._pid == os.getpid():
+                self._seal()
+            self._full_until = 0
+
+    def _rotate(self):
+        if self._map is not None:
+            self._seal()
+        now = time.monotonic()
+        if now < self._full_until:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        if spool_size(self.directory) + self.segment_size > \
+                self._setting('SPOOL_MAX_BYTES'):
+            logger.warning('Spool in %s is full', self.directory)
+            # Don't list the directory on every hit while full
+            self._full_until = now + 1
+            return False
+
+        name = f'{time.time_ns():020d}-{os.getpid()}{SUFFIX}'
+        self._file = open(os.path.join(self.directory, name), 'xb+')
+        # Held until sealed, see writer_exited
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._file.truncate(self.segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._offset = 0
+        self._synced_at = now
+        if not self._closing:
+            atexit.register(self.close)
+            self._closing = True
+        return True
+
+    def _seal(self):
+        self._map[self._offset:self._offset + HEADER.size] = \
+            HEADER.pack(SEALED, 0)
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+        self._map = self._file = None
+
+    def _sync(self):
+        fsync = self._setting('SPOOL_FSYNC')
+        if fsync == 'always':
+            self._map.flush()
+        elif fsync == 'interval':
+            now = time.monotonic()
+            if now - self._synced_at >= self._setting('SPOOL_FSYNC_INTERVAL'):
+                self._map.flush()
+                self._synced_at = now
+
+
+def segment_paths(directory=None):
+    """Return paths of the spool segments, oldest first."""
+    directory = directory or settings.SPOOL_DIR
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name)
+            for name in sorted(os.listdir(directory))
+            if name.endswith(SUFFIX)]
+
+
+def spool_size(directory=None):
+    return sum(os.path.getsize(path) for path in segment_paths(directory))
+
+
+def read_records(path, offset=0, limit=None):
+    """Read records of a segment from ``offset``.
+
+    Returns the records' field values, the offset after them and whether
+    the segment is sealed and has no records left. Reading stops at the
+    first unwritten or damaged record.
+    """
+    records, sealed = [], False
+    with open(path, 'rb') as segment:
+        data = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+    with data:
+        while limit is None or len(records) < limit:
+            if offset + HEADER.size > len(data):
+                break
+            length, crc = HEADER.unpack_from(data, offset)
+            if length == SEALED:
+                sealed = True
+                break
+            start = offset + HEADER.size
+            payload = data[start:start + length]
+            if length == 0 or len(payload) != length or \
+                    zlib.crc32(payload) != crc:
+                break
+            records.append(_decode(payload))
+            offset = start + length
+    return records, offset, sealed
+
+
+def writer_exited(path):
+    """Whether the process that wrote a segment is gone, i.e. its lock on
+    the segment was released."""
+    with open(path, 'rb') as segment:
+        try:
+            fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        fcntl.flock(segment, fcntl.LOCK_UN)
+    return True
+
+
+def drain_segment(path, batch_size=5000):
+    """Load a segment's unloaded records into storage.
+
+    Returns the number of page views loaded. The segment is deleted when
+    its writer is done with it and every record has been loaded.
+    """
+    name = os.path.basename(path)
+    state, _ = SpoolOffset.objects.get_or_create(segment=name)
+    loaded = 0
+    while True:
+        records, offset, sealed = read_records(path, state.offset,
+                                               batch_size)
+        if records:
+            # Hits of projects deleted since they were spooled
+            project_ids = set(Project.objects.filter(
+                pk__in={fields['project_id'] for fields in records}
+            ).values_list('pk', flat=True))
+            known = [fields for fields in records
+                     if fields['project_id'] in project_ids]
+            pageviews = [PageView(**fields)
+                         for fields in PageView.intern(known)]
+            with transaction.atomic():
+                loaded += write_pageviews(pageviews)
+                SpoolOffset.objects.filter(pk=state.pk).update(offset=offset)
+            state.offset = offset
+            forget_buckets({(pageview.project_id, pageview.timestamp)
+                            for pageview in pageviews})
+        if len(records) < batch_size:
+            break
+
+    if sealed or writer_exited(path):
+        # Delete the file first: a leftover offset without its file is
+        # harmless, a file without its offset would be loaded again.
+        os.remove(path)
+        state.delete()
+    return loaded
+
+
+def drain(directory=None, batch_size=5000):
+    """Drain every segment, returning the number of page views loaded."""
+    paths = segment_paths(directory)
+    names = {os.path.basename(path) for path in paths}
+    SpoolOffset.objects.exclude(segment__in=names).delete()
+    return sum(drain_segment(path, batch_size) for path in paths)
+
+
+spool = SpoolWriter()
@@ -0,0 +1,351 @@
+"""
+Storage backends for page views.
+
+Every recorded page view is handed to the backend named by the
+PAGEVIEW_STORAGE setting, which also answers the Project report methods:
+
+- ``ORMStorage`` (default) keeps page views in the PageView table and
+  reads the rollups where it can. The admin, rollups, archive and export
+  work on this table, so they only see page views stored by this backend.
+- ``SQLiteStorage`` keeps them in a standalone SQLite file.
+- ``FileStorage`` appends them to one JSON lines file per project and day,
+  which makes writes cheap and reads full scans.
+
+Backends receive unsaved PageView instances, so the collect views don't
+depend on the backend.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, transaction
+from django.db.models import Sum
+from django.dispatch import receiver
+
+from django.utils.module_loading import import_string
+from .archive import to_micros
+from .models import (DailyRollup, HourlyRollup, PageView, Project,
+                     RollupWatermark, dimension_value)
+
+# Fields page views can be grouped by
+GROUP_FIELDS = ('protocol', 'domain', 'path', 'title', 'referer')
+
+# Errors a backend may raise for a page view it can't store
+WRITE_ERRORS = (DatabaseError, ValueError, OSError, sqlite3.Error)
+
+logger = logging.getLogger(__name__)
+
+
+class BaseStorage:
+    #: Whether page views end up in the PageView table
+    uses_orm = False
+
+    def write(self, pageviews):
+        """Store unsaved PageViews, returning how many were stored."""
+        raise NotImplementedError
+
+    def count(self, project_id, since=None, until=None, unique=False):
+        """Count a project's page views in ``[since, until)``."""
+        raise NotImplementedError
+
+    def group_by(self, project_id, field, since=None, until=None):
+        """Return a dict of the values of ``field`` to their view counts."""
+        raise NotImplementedError
+
+    def top(self, project_id, field, limit=5, since=None, until=None):
+        """Return ``(count, value)`` of the most viewed values of ``field``."""
+        counts = self.group_by(project_id, field, since, until)
+        ranked = sorted(((count, value) for value, count in counts.items()),
+                        key=lambda item: (-item[0], item[1]))
+        return ranked[:limit]
+
+    def _check_field(self, field):
+        if field not in GROUP_FIELDS:
+            raise ValueError(f'Cannot group page views by {field!r}')
+
+    @staticmethod
+    def event(pageview):
+        """Return the values of a PageView stored by non ORM backends."""
+        return {
+            'timestamp': to_micros(pageview.timestamp),
+            'project_id': pageview.project_id,
+            'protocol': pageview.protocol,
+            'domain': pageview.domain,
+            'path': pageview.path,
+            'url': pageview.url,
+            'title': pageview.title,
+            'referer': pageview.referer,
+            'window_width': int(pageview.window_width),
+            'window_height': int(pageview.window_height),
+            'unique_visit': bool(pageview.unique_visit),
+            'visitor_hash': pageview.visitor_hash,
+            'sample_weight': pageview.sample_weight,
+        }
+
+
+class ORMStorage(BaseStorage):
+    uses_orm = True
+
+    def write(self, pageviews):
+        if len(pageviews) == 1:
+            pageviews[0].save(force_insert=True)
+        else:
+            PageView.objects.bulk_create(pageviews)
+        return len(pageviews)
+
+    def count(self, project_id, since=None, until=None, unique=False):
+        """Count page views, from the rollups for windows on the hour.
+
+        Windows starting on the hour and open ended sum the hourly (or
+        daily) rollups and add the page views not rolled up yet. Other
+        windows count the page views. Sampled page views count for their
+        sample weight.
+        """
+        filters = {'unique_visit': True} if unique else {}
+        if until is not None or since is not None and \
+                since != since.replace(minute=0, second=0, microsecond=0):
+            pageviews = self._pageviews(project_id, since, until)
+            return self._weight(pageviews.filter(**filters))
+
+        last_id = RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS)
+        if since:
+            rollups = HourlyRollup.objects.filter(project_id=project_id,
+                                                  bucket__gte=since)
+            filters['timestamp__gte'] = since
+        else:
+            rollups = DailyRollup.objects.filter(project_id=project_id)
+
+        field = 'unique_views' if unique else 'views'
+        rolled_up = rollups.aggregate(total=Sum(field))['total'] or 0
+        pending = PageView.objects.filter(project_id=project_id,
+                                          id__gt=last_id,
+                                          **filters)
+        return rolled_up + self._weight(pending)
+
+    def group_by(self, project_id, field, since=None, until=None):
+        self._check_field(field)
+        value = dimension_value(field) if field != 'protocol' else field
+        rows = self._pageviews(project_id, since, until) \
+            .annotate(value=value).order_by() \
+            .values_list('value').annotate(views=Sum('sample_weight'))
+        return dict(rows)
+
+    def top(self, project_id, field, limit=5, since=None, until=None):
+        if field == 'path' and since is None and until is None:
+            top_paths = Project.top_paths_for([project_id], limit)
+            return top_paths.get(project_id, [])
+        return super().top(project_id, field, limit, since, until)
+
+    @staticmethod
+    def _weight(pageviews):
+        return pageviews.aggregate(views=Sum('sample_weight'))['views'] or 0
+
+    def _pageviews(self, project_id, since, until):
+        pageviews = PageView.objects.filter(project_id=project_id)
+        if since:
+            pageviews = pageviews.filter(timestamp__gte=since)
+        if until:
+            pageviews = pageviews.filter(timestamp__lt=until)
+        return pageviews
+
+
+class SQLiteStorage(BaseStorage):
+    """Page views in a SQLite file at ``path``, outside Django's databases.
+
+    Each thread has its own connection. WAL mode lets reports read while
+    page views are written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS pageview ('
+                'timestamp INTEGER NOT NULL, project_id INTEGER NOT NULL, '
+                'protocol TEXT, domain TEXT, path TEXT, url TEXT, '
+                'title TEXT, referer TEXT, window_width INTEGER, '
+                'window_height INTEGER, unique_visit INTEGER, '
+                'visitor_hash INTEGER, sample_weight INTEGER NOT NULL '
+                'DEFAULT 1)'
+            )
+            columns = {row[1] for row in
+                       connection.execute('PRAGMA table_info(pageview)')}
+            if 'sample_weight' not in columns:
+                # Files created before sampling
+                connection.execute('ALTER TABLE pageview ADD COLUMN '
+                                   'sample_weight INTEGER NOT NULL DEFAULT 1')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS pageview_project_time '
+                'ON pageview (project_id, timestamp)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def write(self, pageviews):
+        events = [self.event(pageview) for pageview in pageviews]
+        if events:
+            columns = list(events[0])
+            with self.connection:
+                self.connection.executemany(
+                    f'INSERT INTO pageview ({", ".join(columns)}) '
+                    f'VALUES ({", ".join("?" * len(columns))})',
+                    [tuple(event.values()) for event in events],
+                )
+        return len(events)
+
+    def _where(self, project_id, since, until, unique=False):
+        where, params = ['project_id = ?'], [project_id]
+        if since:
+            where.append('timestamp >= ?')
+            params.append(to_micros(since))
+        if until:
+            where.append('timestamp < ?')
+            params.append(to_micros(until))
+        if unique:
+            where.append('unique_visit')
+        return ' AND '.join(where), params
+
+    def count(self, project_id, since=None, until=None, unique=False):
+        where, params = self._where(project_id, since, until, unique)
+        return self.connection.execute(
+            f'SELECT COALESCE(SUM(sample_weight), 0) FROM pageview '
+            f'WHERE {where}', params
+        ).fetchone()[0]
+
+    def group_by(self, project_id, field, since=None, until=None):
+        self._check_field(field)
+        where, params = self._where(project_id, since, until)
+        return dict(self.connection.execute(
+            f'SELECT {field}, SUM(sample_weight) FROM pageview WHERE {where} '
+            f'GROUP BY {field}', params
+        ))
+
+
+class FileStorage(BaseStorage):
+    """Append only JSON lines files under the directory ``path``.
+
+    Page views are appended to ``<project id>/<YYYY-MM-DD>.jsonl`` with a
+    single write per file and batch, so concurrent processes don't
+    interleave lines. Reports read the files of the days in range.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, pageviews):
+        lines = {}
+        for pageview in pageviews:
+            event = self.event(pageview)
+            day = pageview.timestamp.astimezone(datetime.timezone.utc).date()
+            lines.setdefault((event['project_id'], day), []) \
+                .append(json.dumps(event) + '\n')
+        for (project_id, day), batch in lines.items():
+            directory = os.path.join(self.path, str(project_id))
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f'{day}.jsonl'), 'a') as file:
+                file.write(''.join(batch))
+        return len(pageviews)
+
+    def _events(self, project_id, since, until):
+        directory = os.path.join(self.path, str(project_id))
+        if not os.path.isdir(directory):
+            return
+        low = to_micros(since) if since else None
+        high = to_micros(until) if until else None
+        first = since.astimezone(datetime.timezone.utc).date().isoformat() \
+            if since else ''
+        last = until.astimezone(datetime.timezone.utc).date().isoformat() \
+            if until else '9999'
+        for filename in sorted(os.listdir(directory)):
+            if not first <= filename[:10] <= last:
+                continue
+            with open(os.path.join(directory, filename)) as file:
+                for line in file:
+                    event = json.loads(line)
+                    if (low is None or event['timestamp'] >= low) and \
+                            (high is None or event['timestamp'] < high):
+                        yield event
+
+    def count(self, project_id, since=None, until=None, unique=False):
+        # Events written before sampling have no weight
+        return sum(event.get('sample_weight', 1)
+                   for event in self._events(project_id, since, until)
+                   if event['unique_visit'] or not unique)
+
+    def group_by(self, project_id, field, since=None, until=None):
+        self._check_field(field)
+        counts = Counter()
+        for event in self._events(project_id, since, until):
+            counts[event[field]] += event.get('sample_weight', 1)
+        return dict(counts)
+
+
+def _guarded(storage):
+    """Return the context to write to ``storage`` in.
+
+    ORM writes go in a savepoint, so a failed one leaves the surrounding
+    transaction usable for the retries; other backends don't touch the
+    database and are written to directly.
+    """
+    if storage.uses_orm:
+        return transaction.atomic()
+    return nullcontext()
+
+
+def write_pageviews(pageviews):
+    """Store page views, returning how many were stored.
+
+    If the batch fails it is retried one page view at a time, so a single
+    malformed hit can't drop the others.
+    """
+    storage = get_storage()
+    try:
+        with _guarded(storage):
+            return storage.write(pageviews)
+    except WRITE_ERRORS:
+        logger.exception('Batch insert of %d page views failed, '
+                         'retrying individually', len(pageviews))
+
+    saved = 0
+    for pageview in pageviews:
+        try:
+            with _guarded(storage):
+                saved += storage.write([pageview])
+        except WRITE_ERRORS:
+            logger.exception('Dropping page view for %s', pageview.url)
+    return saved
+
+
+@lru_cache(maxsize=None)
+def get_storage():
+    """Return the backend named by PAGEVIEW_STORAGE."""
+    backend = import_string(settings.PAGEVIEW_STORAGE)
+    if backend.uses_orm:
+        return backend()
+    if backend is SQLiteStorage:
+        return backend(os.path.join(settings.PAGEVIEW_STORAGE_PATH,
+                                    'pageviews.sqlite3'))
+    return backend(settings.PAGEVIEW_STORAGE_PATH)
+
+
+@receiver(setting_changed)
+def reset_storage(setting, **kwargs):
+    if setting in ('PAGEVIEW_STORAGE', 'PAGEVIEW_STORAGE_PATH'):
+        get_storage.cache_clear()
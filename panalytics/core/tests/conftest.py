@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+
+import pytest
+
+from ..cache import tracking_ids
+from ..dimensions import dimensions
+from ..models import PageView, Project
+from ..profiling import QueryProfile
+from ..views import render_script
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    tracking_ids.clear()
+    dimensions.clear()
+    render_script.cache_clear()
+    yield
+    tracking_ids.clear()
+    dimensions.clear()
+    render_script.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def rollup_without_lag(settings):
+    """Roll up page views as soon as they are written."""
+    settings.ROLLUP_LAG = 0
+
+
+@pytest.fixture
+def project(db):
+    return Project.objects.create(name='Test Project')
+
+
+@pytest.fixture
+def make_pageview():
+    """Return a function building an unsaved page view of ``project``.
+
+    It is a view of ``path`` on https://example.com now, unless other
+    PageView fields are passed.
+    """
+    def make(project, path='/', **fields):
+        defaults = {
+            'protocol': 'https',
+            'domain': 'example.com',
+            'url': f'https://example.com{path}',
+            'title': 'Title',
+            'window_width': 1272,
+            'window_height': 675,
+            'unique_visit': False,
+        }
+        return PageView(project=project, path=path, **{**defaults, **fields})
+    return make
+
+
+@pytest.fixture
+def add_pageview(db, make_pageview):
+    """Return a function saving a page view, see ``make_pageview``."""
+    def add(project, path='/', **fields):
+        pageview = make_pageview(project, path, **fields)
+        pageview.save()
+        return pageview
+    return add
+
+
+@pytest.fixture
+def query_budget(db):
+    """Return a context manager failing if more than ``limit`` queries run.
+
+    Queries on all databases are counted and listed in the failure.
+    """
+    @contextmanager
+    def budget(limit):
+        with QueryProfile(record=True) as profile:
+            yield profile
+        assert profile.count <= limit, (
+            f'{profile.count} queries exceed the budget of {limit}:\n' +
+            '\n'.join(profile.statements)
+        )
+    return budget
@@ -0,0 +1,128 @@
+import datetime
+import gzip
+
+import pytest
+from django.core.management import call_command
+
+from ..access_log import copy_buffer, import_log, open_log, parse_line
+from ..models import PageView
+
+LINE = ('203.0.113.7 - - [01/Mar/2020:12:30:00 +0100] "GET {target} '
+        'HTTP/1.1" {status} 512 "{referer}" "Mozilla/5.0 (X11) Firefox/85"\n')
+
+
+def log_line(target='/about?ref=news', status=200,
+             referer='https://www.google.com/', method='GET'):
+    line = LINE.format(target=target, status=status, referer=referer)
+    return line.replace('GET', method, 1).encode()
+
+
+def test_parse_line_maps_onto_page_view_fields():
+    fields = parse_line(log_line(), 'https://example.com', 1)
+
+    assert fields['timestamp'] == datetime.datetime(
+        2020, 3, 1, 11, 30, tzinfo=datetime.timezone.utc)
+    assert fields['url'] == 'https://example.com/about?ref=news'
+    assert (fields['protocol'], fields['domain'], fields['path']) == \
+        ('https', 'example.com', '/about')
+    assert fields['referer'] == 'https://www.google.com/'
+    assert fields['unique_visit'] is True
+    assert fields['window_width'] == 0
+    assert isinstance(fields['visitor_hash'], int)
+
+
+def test_parse_line_without_referer_uses_source():
+    fields = parse_line(log_line(referer='-'), 'https://example.com', 1)
+
+    assert fields['referer'] == 'news'
+
+
+def test_parse_line_negative_utc_offset():
+    line = log_line().replace(b'+0100', b'-0530')
+
+    assert parse_line(line, 'https://example.com', 1)['timestamp'] == \
+        datetime.datetime(2020, 3, 1, 18, 0, tzinfo=datetime.timezone.utc)
+
+
+@pytest.mark.parametrize('line', [
+    log_line(target='/static/app.css'),
+    log_line(target='/logo.PNG?v=2'),
+    log_line(status=404),
+    log_line(status=500),
+    log_line(method='POST'),
+    log_line(target='http://proxy.example/'),
+    log_line(referer='http://[::1/'),
+    b'garbage\n',
+])
+def test_parse_line_skips_non_page_views(line):
+    assert parse_line(line, 'https://example.com', 1) is None
+
+
+def test_import_log_batches_and_resumes(project, tmp_path):
+    path = tmp_path / 'access.log'
+    path.write_bytes(b''.join([log_line(f'/{i}') for i in range(5)] +
+                              [log_line('/app.js')]))
+
+    with open_log(path) as log:
+        batches = import_log(log, 'https://example.com/', project.pk,
+                             batch_size=2)
+        count, offset = next(batches)
+    assert count == 2
+    assert offset == len(log_line('/0')) + len(log_line('/1'))
+
+    with open_log(path) as log:
+        assert list(import_log(log, 'https://example.com', project.pk,
+                               offset=offset, batch_size=2)) == \
+            [(2, offset * 2), (1, path.stat().st_size)]
+    assert sorted(PageView.objects.values_list('path', flat=True)) == \
+        ['/0', '/1', '/2', '/3', '/4']
+
+
+def test_import_log_skips_lines_with_malformed_urls(project, tmp_path):
+    path = tmp_path / 'access.log'
+    path.write_bytes(log_line('/a') + log_line(referer='http://[::1/') +
+                     log_line('/b'))
+
+    with open_log(path) as log:
+        assert list(import_log(log, 'https://example.com', project.pk)) == \
+            [(2, path.stat().st_size)]
+
+
+def test_import_log_truncates_long_values(project, tmp_path):
+    path = tmp_path / 'access.log'
+    path.write_bytes(log_line('/a') + log_line('/' + 'b' * 300) +
+                     log_line('/c'))
+
+    with open_log(path) as log:
+        assert list(import_log(log, 'https://example.com', project.pk)) == \
+            [(3, path.stat().st_size)]
+    assert sorted(map(len, PageView.objects.values_list('path', flat=True))) \
+        == [2, 2, 255]
+
+
+def test_copy_buffer_quotes_all_but_numbers(project):
+    fields = parse_line(log_line(referer='-', target='/'),
+                        'https://example.com', project.pk)
+    fields['title'] = ''
+
+    columns, nullable, buffer = copy_buffer([fields])
+
+    assert '"project_id"' in columns and '"id"' not in columns
+    assert set(nullable) == {'"visitor_hash"', '"domain_key_id"',
+                             '"path_key_id"', '"title_key_id"',
+                             '"referer_key_id"'}
+    values = dict(zip(columns, buffer.read().rstrip().split(',')))
+    assert values['"title"'] == '""'
+    assert values['"project_id"'] == str(project.pk)
+    assert values['"path_key_id"'] == '""'
+
+
+def test_import_access_log_command_reads_gzip(project, tmp_path):
+    path = tmp_path / 'access.log.gz'
+    with gzip.open(path, 'wb') as log:
+        log.write(log_line() * 3)
+
+    call_command('import_access_log', project.tid, str(path),
+                 '--site', 'https://example.com')
+
+    assert project.pageviews.count() == 3
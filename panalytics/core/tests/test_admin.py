@@ -0,0 +1,99 @@
+import pytest
+from django.utils import timezone
+
+from ..models import Project
+from ..rollups import update_rollups
+
+
+def hours_ago(hours):
+    return timezone.now() - timezone.timedelta(hours=hours)
+
+
+@pytest.fixture
+def add_projects(db, add_pageview):
+    """Return a function adding projects with rolled up and new views."""
+    def add(count):
+        projects = []
+        for _ in range(count):
+            project = Project.objects.create(
+                name=f'Project {Project.objects.count()}'
+            )
+            add_pageview(project, path='/a', timestamp=hours_ago(24 * 3),
+                         unique_visit=True)
+            add_pageview(project, path='/b', timestamp=hours_ago(24 * 40))
+            projects.append(project)
+        update_rollups()
+        for project in projects:
+            add_pageview(project, path='/a')
+        return projects
+    return add
+
+
+@pytest.mark.django_db
+def test_with_view_counts_matches_project_methods(add_projects):
+    add_projects(2)
+
+    for project in Project.objects.with_view_counts():
+        assert project.total_views == project.view_count() == 3
+        assert project.total_unique_views == project.unique_view_count() == 1
+        assert project.views_1d == project.view_count(days=1) == 1
+        assert project.views_7d == project.view_count(days=7) == 2
+        assert project.views_30d == project.view_count(days=30) == 2
+
+
+@pytest.mark.django_db
+def test_with_view_counts_includes_projects_without_views():
+    Project.objects.create(name='Empty Project')
+
+    project = Project.objects.with_view_counts().get()
+
+    assert project.total_views == 0
+    assert project.views_30d == 0
+
+
+@pytest.mark.django_db
+def test_top_paths_for_ranks_paths_per_project(add_pageview, add_projects):
+    projects = add_projects(2)
+    add_pageview(projects[1], path='/c')
+
+    top_paths = Project.top_paths_for([p.pk for p in projects], limit=1)
+
+    assert top_paths == {projects[0].pk: [(2, '/a')],
+                         projects[1].pk: [(2, '/a')]}
+
+
+@pytest.mark.django_db
+def test_project_changelist_shows_counts_and_top_paths(admin_client,
+                                                       add_projects):
+    add_projects(1)
+
+    response = admin_client.get('/admin/core/project/')
+
+    assert response.status_code == 200
+    assert '2 - /a<br>1 - /b' in response.content.decode()
+    assert '30 Days, Sum of Daily Visitors' in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_project_changelist_query_count_independent_of_projects(
+    admin_client, django_assert_max_num_queries, add_projects
+):
+    add_projects(2)
+    with django_assert_max_num_queries(10) as few:
+        admin_client.get('/admin/core/project/')
+
+    add_projects(10)
+    with django_assert_max_num_queries(len(few)):
+        admin_client.get('/admin/core/project/')
+
+
+def test_project_changelist_delete_action(admin_client, project):
+    # Projects with page views can't be deleted since page views are read
+    # only in the admin.
+    admin_client.post('/admin/core/project/', {
+        'action': 'delete_selected',
+        '_selected_action': [project.pk],
+        'post': 'yes',
+    })
+
+    assert not Project.objects.exists()
@@ -0,0 +1,142 @@
+import datetime
+import os
+
+import pytest
+from django.core.management import call_command
+from unittest.mock import patch
+
+from .. import archive as archive_module
+from ..archive import Segment, archive, count_views, write_segment, COLUMNS
+from ..models import PageView, Project
+from ..rollups import update_rollups
+
+DAY = datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, settings):
+    settings.ARCHIVE_DIR = str(tmp_path)
+    return tmp_path
+
+
+def segment_row(**values):
+    row = {name: 0 if typecode else '' for name, typecode in COLUMNS.items()}
+    row.update(values)
+    return row
+
+
+def test_segment_round_trip(tmp_path):
+    rows = [segment_row(),
+            segment_row(id=7, timestamp=-5, path='/a',
+                        window_width=2 ** 32 - 1),
+            segment_row()]
+    path = str(tmp_path / '2020-03-01.0.seg')
+
+    write_segment(path, rows)
+
+    with Segment(path) as segment:
+        assert len(segment) == 3
+        assert list(segment.column('id')) == [0, 7, 0]
+        assert list(segment.rows('path', 'timestamp'))[1] == ('/a', -5)
+        assert segment.column('window_width')[1] == 2 ** 32 - 1
+    assert os.listdir(tmp_path) == ['2020-03-01.0.seg']
+
+
+def test_segment_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.seg'
+    path.write_bytes(b'not a segment')
+
+    with pytest.raises(ValueError):
+        Segment(str(path))
+
+
+def test_archive_moves_closed_rolled_up_days(project, archive_dir,
+                                             add_pageview):
+    first = add_pageview(project, timestamp=DAY, path='/a', unique_visit=True)
+    add_pageview(project, timestamp=DAY + datetime.timedelta(hours=5),
+                 path='/b')
+    later = add_pageview(project, timestamp=DAY + datetime.timedelta(days=1))
+    update_rollups()
+    views = project.view_count()
+
+    archived = archive(DAY.date() + datetime.timedelta(days=1),
+                       chunk_size=1)
+
+    assert archived == [(DAY.date(), 2)]
+    assert list(PageView.objects.all()) == [later]
+    assert project.view_count() == views
+    with Segment(str(archive_dir / '2020-03-01.0.seg')) as segment:
+        assert list(segment.column('id')) == [first.pk, first.pk + 1]
+        assert segment.column('path') == ['/a', '/b']
+        assert segment.column('url') == ['https://example.com/a',
+                                         'https://example.com/b']
+        assert list(segment.column('unique_visit')) == [1, 0]
+
+
+def test_archive_skips_days_not_rolled_up(project, archive_dir, add_pageview):
+    add_pageview(project, timestamp=DAY)
+
+    assert archive(DAY.date() + datetime.timedelta(days=1)) == []
+    assert PageView.objects.count() == 1
+
+
+def test_archive_does_not_duplicate_rows_of_interrupted_run(
+    project, archive_dir, add_pageview
+):
+    pageview = add_pageview(project, timestamp=DAY)
+    update_rollups()
+    # A previous run wrote the segment but died before deleting the rows
+    write_segment(str(archive_dir / '2020-03-01.0.seg'),
+                  [segment_row(id=pageview.pk)])
+
+    assert archive(DAY.date() + datetime.timedelta(days=1)) == \
+        [(DAY.date(), 0)]
+    assert not PageView.objects.exists()
+    assert os.listdir(archive_dir) == ['2020-03-01.0.seg']
+
+
+def test_archive_keeps_rows_added_while_writing(project, archive_dir,
+                                                add_pageview):
+    add_pageview(project, timestamp=DAY)
+    update_rollups()
+    late = []
+    read_rows = archive_module._rows
+
+    def rows_then_insert(pageviews, chunk_size):
+        yield from read_rows(pageviews, chunk_size)
+        late.append(add_pageview(
+            project, timestamp=DAY + datetime.timedelta(hours=1)))
+
+    with patch('panalytics.core.archive._rows', rows_then_insert):
+        assert archive(DAY.date() + datetime.timedelta(days=1)) == \
+            [(DAY.date(), 1)]
+    assert list(PageView.objects.all()) == late
+
+
+def test_views_between_counts_live_and_archived_rows(project, archive_dir,
+                                                     add_pageview):
+    add_pageview(project, timestamp=DAY + datetime.timedelta(hours=1),
+                 unique_visit=True)
+    add_pageview(project, timestamp=DAY + datetime.timedelta(hours=3))
+    add_pageview(project, timestamp=DAY + datetime.timedelta(hours=30))
+    other = Project.objects.create(name='Other Project')
+    add_pageview(other, timestamp=DAY + datetime.timedelta(hours=2))
+    update_rollups()
+    archive(DAY.date() + datetime.timedelta(days=1))
+
+    since = DAY + datetime.timedelta(hours=2)
+    until = DAY + datetime.timedelta(days=2)
+    assert project.views_between(since, until) == 2
+    assert project.views_between(DAY, until, unique=True) == 1
+    assert count_views(project.pk, DAY, until) == 2
+    assert count_views(other.pk) == 1
+
+
+def test_archive_pageviews_command(project, archive_dir, capsys, add_pageview):
+    add_pageview(project, timestamp=DAY)
+    update_rollups()
+
+    call_command('archive_pageviews', '--older-than-days', '1')
+
+    assert 'Archived 1 page views of 2020-03-01.' in capsys.readouterr().out
+    assert not PageView.objects.exists()
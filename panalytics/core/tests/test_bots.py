@@ -0,0 +1,126 @@
+import json
+import timeit
+
+import pytest
+
+from ..bots import is_bot
+from ..models import PageView
+
+CHROME = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+          '(KHTML, like Gecko) Chrome/85.0 Safari/537.36')
+GOOGLEBOT = ('Mozilla/5.0 (compatible; Googlebot/2.1; '
+             '+http://www.google.com/bot.html)')
+
+
+@pytest.mark.parametrize('user_agent', [
+    GOOGLEBOT,
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'facebookexternalhit/1.1',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'HeadlessChrome/85.0.4182.0 Safari/537.36',
+    'Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)',
+    'Mozilla/5.0 (compatible; Ezooms/1.0; +https://example.org/ezooms)',
+    'WhatsApp/2.23.20.0 A',
+    'Uptime-Kuma/1.23.0',
+    'curl/7.68.0',
+    'python-requests/2.24.0',
+    'Go-http-client/1.1',
+    'Mozilla/5.0',
+])
+def test_bots(user_agent):
+    assert is_bot(user_agent)
+
+
+@pytest.mark.parametrize('user_agent', [
+    '',
+    CHROME,
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:81.0) Gecko/20100101 '
+    'Firefox/81.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 '
+    'Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 9; CUBOT X19) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/83.0.4103.106 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36 Edg/115.0.1901.188',
+    'Mozilla/5.0 (Linux; Android 13; SAMSUNG SM-S918B) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) SamsungBrowser/22.0 Chrome/111.0.5563.116 Mobile '
+    'Safari/537.36',
+    # In-app browsers and webviews
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 '
+    '[FBAN/FBIOS;FBDV/iPhone14,5;FBMD/iPhone;FBSN/iOS;FBSV/16.5;FBSS/3;'
+    'FBID/phone;FBLC/en_US;FBOP/5]',
+    'Mozilla/5.0 (Linux; Android 13; SM-S908B Build/TP1A.220624.014; wv) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 '
+    'Chrome/114.0.5735.196 Mobile Safari/537.36 Instagram 290.0.0.13.76 '
+    'Android (33/13; 480dpi; 1080x2340; samsung; SM-S908B; b0q; qcom; '
+    'en_GB; 493125213)',
+    'Mozilla/5.0 (Linux; Android 12; Pixel 6 Build/SD1A.210817.036; wv) '
+    'AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 '
+    'Chrome/103.0.5060.129 Mobile Safari/537.36 trill_2023001040 '
+    'JsSdk/1.0 NetType/WIFI Channel/googleplay AppName/trill '
+    'app_version/23.1.4 ByteLocale/en ByteFullLocale/en Region/US '
+    'BytedanceWebview/d8a21c6',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 '
+    'MicroMessenger/8.0.16(0x18001033) NetType/WIFI Language/zh_CN',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 '
+    '[LinkedInApp]/9.27.8155',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) GSA/274.0.553494354 '
+    'Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 '
+    'Snapchat/12.45.0.36 (like Safari/8615.3.12.10.3, panda)',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 '
+    '[Pinterest/iOS]',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Slack/4.33.90 Chrome/114.0.5735.134 '
+    'Electron/25.2.0 Safari/537.36 Sonic Slack_SSB/4.33.90',
+])
+def test_browsers(user_agent):
+    assert not is_bot(user_agent)
+
+
+def test_extra_patterns(settings):
+    settings.BOT_PATTERNS = ['firefox/81']
+    assert is_bot('Mozilla/5.0 (Windows NT 10.0; rv:81.0) Firefox/81.0')
+    assert not is_bot(CHROME)
+
+
+def test_classification_is_fast():
+    user_agents = [f'{CHROME} build/{i}' for i in range(1000)]
+    seconds = timeit.timeit(lambda: [is_bot(ua) for ua in user_agents],
+                            number=1)
+    # Uncached, well within budget even on slow CI machines
+    assert seconds / len(user_agents) < 0.001
+
+
+def test_collect_drops_bots(client, project):
+    client.get('/a.gif', {'tid': project.tid, 'url': 'http://example.com'},
+               HTTP_USER_AGENT=GOOGLEBOT)
+    client.get('/a.gif', {'tid': project.tid, 'url': 'http://example.com'},
+               HTTP_USER_AGENT=CHROME)
+
+    assert PageView.objects.count() == 1
+
+
+def test_collect_batch_drops_bots(client, project):
+    hits = [{'tid': project.tid, 'url': 'http://example.com/'}]
+    response = client.post('/a.batch', json.dumps(hits),
+                           content_type='text/plain',
+                           HTTP_USER_AGENT=GOOGLEBOT)
+
+    assert response.status_code == 204
+    assert not PageView.objects.exists()
+
+
+def test_bot_filter_can_be_disabled(client, project, settings):
+    settings.BOT_FILTER = False
+    client.get('/a.gif', {'tid': project.tid, 'url': 'http://example.com'},
+               HTTP_USER_AGENT=GOOGLEBOT)
+
+    assert PageView.objects.count() == 1
@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+from django.test import RequestFactory
+from unittest.mock import patch
+
+from ..buffer import PageViewBuffer
+from ..models import PageView
+
+
+def test_buffer_disabled_when_size_zero():
+    assert not PageViewBuffer(max_size=0, flush_interval=5).enabled
+
+
+@pytest.mark.django_db
+def test_buffer_holds_page_views_until_flushed(project, make_pageview):
+    buffer = PageViewBuffer(max_size=10, flush_interval=60)
+    buffer.add(make_pageview(project))
+    buffer.add(make_pageview(project))
+
+    assert PageView.objects.count() == 0
+    assert buffer.flush() == 2
+    assert PageView.objects.count() == 2
+    assert len(buffer) == 0
+
+
+@pytest.mark.django_db
+def test_buffer_flushes_when_full(project, make_pageview):
+    buffer = PageViewBuffer(max_size=3, flush_interval=60)
+    for _ in range(3):
+        buffer.add(make_pageview(project))
+
+    assert PageView.objects.count() == 3
+    assert len(buffer) == 0
+
+
+@pytest.mark.django_db
+def test_buffer_flushes_when_interval_elapsed(project, make_pageview):
+    buffer = PageViewBuffer(max_size=100, flush_interval=0)
+    buffer.add(make_pageview(project))
+
+    assert PageView.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_buffer_writes_batch_with_single_bulk_create(project, make_pageview):
+    buffer = PageViewBuffer(max_size=100, flush_interval=60)
+    for _ in range(5):
+        buffer.add(make_pageview(project))
+
+    with patch.object(PageView.objects, 'bulk_create') as mock_bulk_create:
+        buffer.flush()
+
+    assert mock_bulk_create.call_count == 1
+    assert len(mock_bulk_create.call_args[0][0]) == 5
+
+
+@pytest.mark.django_db
+def test_buffer_keeps_valid_rows_when_batch_fails(project, make_pageview):
+    buffer = PageViewBuffer(max_size=100, flush_interval=60)
+    bad = make_pageview(project)
+    bad.window_width = 'not a number'
+    buffer.add(make_pageview(project))
+    buffer.add(bad)
+    buffer.add(make_pageview(project))
+
+    assert buffer.flush() == 2
+    assert PageView.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_buffer_add_is_thread_safe(project, make_pageview):
+    buffer = PageViewBuffer(max_size=100000, flush_interval=60)
+    pageviews = [make_pageview(project) for _ in range(50)]
+
+    def add_all():
+        for pageview in pageviews:
+            buffer.add(pageview)
+
+    threads = [threading.Thread(target=add_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(buffer) == 400
+    assert buffer.flush() == 400
+    assert PageView.objects.count() == 400
+
+
+@pytest.mark.django_db
+def test_collect_adds_page_view_to_buffer_when_enabled(client, project):
+    buffer = PageViewBuffer(max_size=10, flush_interval=60)
+    query = {'tid': project.tid, 'url': 'http://example.com/about'}
+
+    with patch('panalytics.core.views.pageview_buffer', buffer):
+        response = client.get('/a.gif', query)
+
+    assert response.status_code == 200
+    assert project.pageviews.count() == 0
+    buffer.flush()
+    assert project.pageviews.get().path == '/about'
+
+
+def test_from_request_returns_unsaved_page_view():
+    request = RequestFactory().get('/a.gif', {'url': 'http://example.com/a'})
+    with patch('panalytics.core.models.tracking_ids') as mock_tracking_ids:
+        mock_tracking_ids.get.return_value = 1
+        pageview = PageView.from_request(request)
+
+    assert pageview.pk is None
+    assert pageview.project_id == 1
+    assert pageview.path == '/a'
+    assert pageview.timestamp is not None
+
+
+@pytest.mark.django_db
+def test_buffer_non_blocking_add_leaves_flush_to_thread(project,
+                                                        make_pageview):
+    buffer = PageViewBuffer(max_size=1, flush_interval=60)
+
+    with patch('panalytics.core.buffer.atexit'), \
+            patch('panalytics.core.buffer.threading.Thread') as mock_thread, \
+            patch.object(buffer, 'flush') as mock_flush:
+        buffer.add(make_pageview(project), block=False)
+
+    assert mock_thread.return_value.start.call_count == 1
+    assert mock_flush.call_count == 0
+    assert buffer._wake.is_set()
+
+
+@pytest.mark.django_db
+def test_buffer_non_blocking_add_without_thread_leaves_flush_to_caller(
+    project, make_pageview
+):
+    buffer = PageViewBuffer(max_size=1, flush_interval=0)
+
+    assert buffer.add(make_pageview(project), block=False) is True
+    assert len(buffer) == 1
+    assert project.pageviews.count() == 0
@@ -0,0 +1,103 @@
+import pytest
+from unittest.mock import patch
+
+from ..cache import TrackingIdCache, tracking_ids
+from ..models import Project
+
+
+@pytest.fixture
+def cache():
+    return TrackingIdCache(max_size=3, ttl=60, negative_ttl=10)
+
+
+def test_get_returns_project_id(cache, project):
+    assert cache.get(project.tid) == project.pk
+
+
+def test_get_caches_project_id(cache, project, django_assert_num_queries):
+    cache.get(project.tid)
+
+    with django_assert_num_queries(0):
+        assert cache.get(project.tid) == project.pk
+
+
+@pytest.mark.django_db
+def test_get_caches_unknown_tracking_id(cache, django_assert_num_queries):
+    assert cache.get('PA-UNKNOWN00') is None
+
+    with django_assert_num_queries(0):
+        assert cache.get('PA-UNKNOWN00') is None
+
+
+def test_lookup_misses_expired_entry(cache):
+    cache.set('PA-TESTTRACK', 1)
+
+    with patch('panalytics.core.cache.time.monotonic',
+               return_value=10 ** 9):
+        assert cache.lookup('PA-TESTTRACK') == (False, None)
+
+
+def test_set_evicts_least_recently_used(cache):
+    for i, tid in enumerate(['PA-A', 'PA-B', 'PA-C']):
+        cache.set(tid, i)
+    cache.lookup('PA-A')
+    cache.set('PA-D', 3)
+
+    assert len(cache) == 3
+    assert 'PA-A' in cache
+    assert 'PA-B' not in cache
+
+
+def test_set_skips_negative_entries_when_negative_ttl_zero():
+    cache = TrackingIdCache(max_size=3, ttl=60, negative_ttl=0)
+    cache.set('PA-TESTTRACK', None)
+
+    assert 'PA-TESTTRACK' not in cache
+
+
+@pytest.mark.django_db
+def test_warm_loads_existing_projects(cache, django_assert_num_queries):
+    projects = [Project.objects.create(name=f'Project {i}') for i in range(2)]
+    cache.clear()
+    cache.warm()
+
+    with django_assert_num_queries(0):
+        for project in projects:
+            assert cache.get(project.tid) == project.pk
+
+
+def test_saving_project_updates_cached_tracking_id(project):
+    old_tid = project.tid
+    tracking_ids.get(old_tid)
+
+    project.tid = 'PA-CHANGED00'
+    project.save()
+
+    assert old_tid not in tracking_ids
+    assert tracking_ids.lookup('PA-CHANGED00') == (True, project.pk)
+
+
+def test_deleting_project_invalidates_cached_tracking_id(project):
+    tracking_ids.get(project.tid)
+
+    project.delete()
+
+    assert not Project.is_valid_tracking_id(project.tid)
+
+
+@pytest.mark.django_db
+def test_get_many_loads_missing_tracking_ids_in_one_query(
+    cache, django_assert_num_queries
+):
+    projects = [Project.objects.create(name=f'Project {i}') for i in range(2)]
+    cache.clear()
+    cache.get(projects[0].tid)
+    tids = [projects[0].tid, projects[1].tid, 'PA-UNKNOWN00']
+
+    with django_assert_num_queries(1):
+        result = cache.get_many(tids)
+
+    assert result == {projects[0].tid: projects[0].pk,
+                      projects[1].tid: projects[1].pk,
+                      'PA-UNKNOWN00': None}
+    assert 'PA-UNKNOWN00' in cache
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from .. import dedupe
+from ..dedupe import BloomFilter, DuplicateFilter
+from ..models import PageView
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedupe.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def window(settings):
+    settings.DEDUPE_WINDOW = 10
+    return settings
+
+
+def collect(client, project, path='/', **extra):
+    return client.get('/a.gif', {'tid': project.tid,
+                                 'url': f'http://example.com{path}',
+                                 'wiw': 1272, 'wih': 675}, **extra)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(bloom.positions(b'in %d' % i))
+
+    assert all(bloom.contains(bloom.positions(b'in %d' % i))
+               for i in range(10000))
+    false_positives = sum(bloom.contains(bloom.positions(b'out %d' % i))
+                          for i in range(10000))
+    assert false_positives < 200
+
+
+def test_duplicates_are_remembered_for_a_window(clock):
+    hits = DuplicateFilter(window=10, capacity=1000, error_rate=0.001)
+    assert not hits.seen(b'a')
+    assert hits.seen(b'a')
+
+    clock[0] += 9
+    assert hits.seen(b'a')
+    assert not hits.seen(b'b')
+    clock[0] += 2
+    # Rotated: 'a' and 'b' are in the previous generation
+    assert hits.seen(b'b')
+    clock[0] += 10
+    assert not hits.seen(b'b')
+
+
+def test_idle_filters_are_forgotten(clock):
+    hits = DuplicateFilter(window=10, capacity=1000, error_rate=0.001)
+    hits.seen(b'a')
+    clock[0] += 25
+    assert not hits.seen(b'a')
+
+
+def test_full_filters_rotate_early(clock):
+    hits = DuplicateFilter(window=10, capacity=100, error_rate=0.001)
+    for i in range(250):
+        hits.seen(b'%d' % i)
+
+    # Two rotations after 100 and 200 hits dropped the first 100
+    assert not hits.seen(b'0')
+    assert hits.seen(b'150')
+
+
+def test_collect_drops_duplicates(client, project, window, clock):
+    for _ in range(3):
+        collect(client, project)
+    collect(client, project, '/other')
+    collect(client, project, REMOTE_ADDR='10.0.0.2')
+    response = collect(client, project, HTTP_USER_AGENT='Other')
+
+    assert response['Content-Type'] == 'image/gif'
+    assert PageView.objects.count() == 4
+
+    clock[0] += 30
+    collect(client, project)
+    assert PageView.objects.count() == 5
+
+
+def test_collect_batch_drops_duplicates(client, project, window, clock):
+    collect(client, project, '/0')
+    hits = [{'tid': project.tid, 'url': f'http://example.com/{i % 3}',
+             'wiw': 1272, 'wih': 675, 'a': i} for i in range(6)]
+    client.post('/a.batch', json.dumps(hits), content_type='text/plain')
+
+    assert sorted(PageView.objects.values_list('path', flat=True)) == \
+        ['/0', '/1', '/2']
+
+
+def test_duplicates_are_kept_when_disabled(client, project, settings):
+    settings.DEDUPE_WINDOW = 0
+    for _ in range(3):
+        collect(client, project)
+
+    assert PageView.objects.count() == 3
@@ -0,0 +1,138 @@
+import pytest
+from django.test import RequestFactory
+
+from ..dimensions import DimensionCache, digest
+from ..models import Domain, PageView, Path, Referer, Title
+from ..rollups import update_rollups
+
+
+@pytest.fixture
+def intern(settings):
+    settings.INTERN_DIMENSIONS = True
+
+
+def collect_request(project, path='/about', **params):
+    return RequestFactory().get('/a.gif', {
+        'tid': project.tid,
+        'url': f'https://example.com{path}?utm_source=news#top',
+        'ref': 'https://www.google.com/',
+        't': 'About us',
+        'wiw': '1272',
+        'wih': '675',
+        **params,
+    })
+
+
+@pytest.mark.django_db
+def test_get_many_creates_missing_values(django_assert_num_queries):
+    cache = DimensionCache(max_size=10)
+    Path.objects.create(value='/existing')
+
+    with django_assert_num_queries(3):
+        ids = cache.get_many(Path, ['/existing', '/new', '/new'])
+
+    assert ids == dict(Path.objects.values_list('value', 'pk'))
+    assert Path.objects.get(value='/new').digest == digest('/new')
+
+
+@pytest.mark.django_db
+def test_get_many_uses_cached_ids(django_assert_num_queries):
+    cache = DimensionCache(max_size=10)
+    ids = cache.get_many(Path, ['/a', '/b'])
+
+    with django_assert_num_queries(0):
+        assert cache.get_many(Path, ['/a', '/b']) == ids
+
+
+@pytest.mark.django_db
+def test_get_many_evicts_least_recently_used():
+    cache = DimensionCache(max_size=2)
+    cache.get_many(Path, ['/a'])
+    cache.get_many(Domain, ['/a'])
+    cache.get_many(Path, ['/a'])
+    cache.get_many(Path, ['/b'])
+
+    assert len(cache) == 2
+    assert (Domain, '/a') not in cache._entries
+
+
+def test_create_from_request_keeps_strings_by_default(project):
+    pageview = PageView.create_from_request(collect_request(project))
+
+    assert pageview.path == '/about'
+    assert pageview.path_key is None
+    assert Path.objects.count() == 0
+
+
+def test_create_from_request_interns_dimensions(project, intern):
+    PageView.create_from_request(collect_request(project))
+    PageView.create_from_request(collect_request(project))
+
+    first, second = PageView.objects.order_by('pk')
+    assert (first.domain, first.path, first.title, first.referer,
+            first.url) == ('', '', '', '', '')
+    assert first.path_key_id == second.path_key_id
+    assert first.get_dimension('path') == '/about'
+    assert first.get_dimension('domain') == 'example.com'
+    assert first.get_dimension('title') == 'About us'
+    assert first.get_dimension('referer') == 'https://www.google.com/'
+    assert first.query == '?utm_source=news#top'
+    assert first.get_url() == 'https://example.com/about?utm_source=news#top'
+    assert [model.objects.count() for model in
+            (Domain, Path, Title, Referer)] == [1, 1, 1, 1]
+
+
+def test_from_hits_interns_batch_with_one_query_per_table(
+    project, intern, django_assert_num_queries
+):
+    hits = [{'tid': project.tid, 'url': f'https://example.com/{i}'}
+            for i in range(5)]
+
+    # The tracking ID is cached when the project is saved
+    with django_assert_num_queries(4 * 3):
+        pageviews = PageView.from_hits(hits)
+
+    assert Path.objects.count() == 5
+    assert [pageview.get_url() for pageview in pageviews] == \
+        [hit['url'] for hit in hits]
+
+
+def test_rollups_and_top_paths_combine_interned_and_plain_rows(
+    project, settings
+):
+    PageView.create_from_request(collect_request(project, '/a'))
+    settings.INTERN_DIMENSIONS = True
+    PageView.create_from_request(collect_request(project, '/a'))
+    PageView.create_from_request(collect_request(project, '/b'))
+
+    assert project.top_paths() == [(2, '/a'), (1, '/b')]
+
+    update_rollups()
+    PageView.create_from_request(collect_request(project, '/b'))
+    PageView.create_from_request(collect_request(project, '/b'))
+
+    assert project.top_paths() == [(3, '/b'), (2, '/a')]
+    assert project.path_rollups.get(path='/a').views == 2
+
+
+def test_rollups_truncate_long_interned_paths(project, intern):
+    path = '/' + 'a' * 300
+    PageView.create_from_request(collect_request(project, path))
+    PageView.create_from_request(collect_request(project, path + 'b'))
+
+    update_rollups()
+
+    rollup = project.path_rollups.get()
+    assert (rollup.path, rollup.views) == (path[:255], 2)
+
+
+def test_admin_pageview_changelist_shows_interned_values(
+    admin_client, project, intern
+):
+    PageView.create_from_request(collect_request(project))
+
+    response = admin_client.get('/admin/core/pageview/')
+
+    assert b'https://example.com/about?utm_source=news#top' in \
+        response.content
+    assert b'About us' in response.content
@@ -0,0 +1,119 @@
+import csv
+import datetime
+import io
+import json
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from ..archive import archive
+from ..export import FIELDS, csv_lines, export_rows
+from ..rollups import update_rollups
+
+DAY = datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def pageviews(project, add_pageview):
+    for hours, path in [(1, '/a'), (30, '/b'), (50, '/c')]:
+        add_pageview(project, path,
+                     timestamp=DAY + datetime.timedelta(hours=hours),
+                     title='Title, "quoted"',
+                     unique_visit=path == '/a')
+
+
+def test_export_rows_include_archived_page_views(project, pageviews,
+                                                 settings, tmp_path):
+    settings.ARCHIVE_DIR = str(tmp_path)
+    update_rollups()
+    archive(DAY.date() + datetime.timedelta(days=1))
+
+    rows = list(export_rows(project.pk, chunk_size=1))
+
+    assert [row['path'] for row in rows] == ['/a', '/b', '/c']
+    assert rows[0]['timestamp'] == DAY + datetime.timedelta(hours=1)
+    assert rows[0]['unique_visit'] is True
+    assert rows[1]['url'] == 'https://example.com/b'
+
+
+def test_export_rows_within_range(project, pageviews):
+    rows = export_rows(project.pk, since=DAY + datetime.timedelta(days=1),
+                       until=DAY + datetime.timedelta(days=2))
+
+    assert [row['path'] for row in rows] == ['/b']
+
+
+def test_export_view_streams_csv(admin_client, project, pageviews):
+    response = admin_client.get(f'/export/{project.pk}',
+                                {'since': '2020-03-02'})
+
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv'
+    assert response['Content-Disposition'] == \
+        f'attachment; filename="{project.tid}.csv"'
+    content = b''.join(response.streaming_content).decode()
+    rows = list(csv.DictReader(io.StringIO(content)))
+    assert [row['path'] for row in rows] == ['/b', '/c']
+    assert rows[0]['title'] == 'Title, "quoted"'
+    assert rows[0]['timestamp'] == '2020-03-02T06:00:00+00:00'
+
+
+@pytest.mark.parametrize('title', ['=HYPERLINK("http://evil.example")',
+                                   '+1', '-1', '@SUM(A1)', '\t=1'])
+def test_csv_lines_quote_formulas(title):
+    row = {field: '' for field in FIELDS}
+    row.update(timestamp=DAY, title=title, window_width=-1)
+
+    _, line = csv_lines([row])
+
+    row = next(csv.DictReader(io.StringIO(line), FIELDS))
+    assert row['title'] == "'" + title
+    assert row['window_width'] == '-1'
+
+
+def test_export_view_streams_ndjson(admin_client, project, pageviews):
+    response = admin_client.get(f'/export/{project.pk}',
+                                {'format': 'ndjson', 'until': '2020-03-02'})
+
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert [json.loads(line)['path'] for line in lines] == ['/a']
+
+
+@pytest.mark.parametrize('params', [{'format': 'xml'},
+                                    {'since': 'yesterday'},
+                                    {'until': '2020-02-30'}])
+def test_export_view_rejects_bad_parameters(admin_client, project, params):
+    response = admin_client.get(f'/export/{project.pk}', params)
+
+    assert response.status_code == 400
+
+
+def test_export_view_requires_staff(client, project):
+    response = client.get(f'/export/{project.pk}')
+
+    assert response.status_code == 302
+    assert '/login/' in response['Location']
+
+
+def test_export_view_requires_permission(client, project):
+    user = User.objects.create_user('staff', password='secret',
+                                    is_staff=True)
+    client.force_login(user)
+
+    assert client.get(f'/export/{project.pk}').status_code == 403
+
+
+def test_export_view_unknown_project(admin_client, db):
+    assert admin_client.get('/export/999').status_code == 404
+
+
+def test_export_pageviews_command(project, pageviews, tmp_path, capsys):
+    output = tmp_path / 'export.ndjson'
+
+    call_command('export_pageviews', project.tid, '--format', 'ndjson',
+                 '--since', '2020-03-02', '--output', str(output))
+
+    assert len(output.read_text().splitlines()) == 2
+    assert 'Exported 2 page views' in capsys.readouterr().err
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from ..hll import HyperLogLog
+
+
+def random_hashes(count, seed=0):
+    generator = random.Random(seed)
+    return [generator.getrandbits(64) for _ in range(count)]
+
+
+def test_count_empty_sketch():
+    assert HyperLogLog().count() == 0
+
+
+def test_count_small_cardinality_is_close_to_exact():
+    sketch = HyperLogLog()
+    sketch.update(random_hashes(100) * 3)
+
+    assert abs(sketch.count() - 100) <= 2
+
+
+@pytest.mark.parametrize('count', [10000, 200000])
+def test_count_within_error_bound(count):
+    sketch = HyperLogLog()
+    sketch.update(random_hashes(count))
+
+    # Three standard errors at the default precision
+    assert abs(sketch.count() - count) / count < 0.049
+
+
+def test_add_treats_signed_and_unsigned_hashes_alike():
+    hashes = random_hashes(4)
+    sketch = HyperLogLog()
+    sketch.update(hashes)
+    sketch.update(value - 2 ** 64 for value in hashes)
+
+    assert sketch.count() == 4
+
+
+def test_merge_is_union():
+    first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    hashes = random_hashes(20000)
+    first.update(hashes[:15000])
+    second.update(hashes[5000:])
+    both.update(hashes)
+
+    first.merge(second)
+
+    assert first.registers == both.registers
+
+
+def test_merge_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=12).merge(HyperLogLog(precision=10))
+
+
+def test_serialization_round_trip():
+    sketch = HyperLogLog(precision=10)
+    sketch.update(random_hashes(50))
+
+    data = sketch.to_bytes()
+    loaded = HyperLogLog.from_bytes(data)
+
+    assert len(data) < 200
+    assert loaded.precision == 10
+    assert loaded.registers == sketch.registers
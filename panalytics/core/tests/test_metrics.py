@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from .. import metrics
+from ..metrics import Counter, Histogram
+
+
+@pytest.fixture
+def enabled(settings):
+    settings.METRICS_ENABLED = True
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+@pytest.fixture
+def counter():
+    counter = Counter('test_events_total', 'Events.', labels=('kind',))
+    yield counter
+    metrics.REGISTRY.remove(counter)
+
+
+@pytest.fixture
+def histogram():
+    histogram = Histogram('test_seconds', 'Latency.', buckets=(0.1, 1.0))
+    yield histogram
+    metrics.REGISTRY.remove(histogram)
+
+
+def test_counter_sums_threads(enabled, counter):
+    def increment():
+        for _ in range(1000):
+            counter.inc('a')
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc('b', amount=5)
+
+    assert counter.values() == {('a',): 4000, ('b',): 5}
+    assert counter.render() == (
+        '# HELP test_events_total Events.\n'
+        '# TYPE test_events_total counter\n'
+        'test_events_total{kind="a"} 4000\n'
+        'test_events_total{kind="b"} 5'
+    )
+
+
+def test_histogram_renders_cumulative_buckets(enabled, histogram):
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value)
+
+    assert histogram.render().split('\n')[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 4.05',
+        'test_seconds_count 4',
+    ]
+
+
+def test_disabled_metrics_record_nothing(settings, counter, histogram):
+    settings.METRICS_ENABLED = False
+    counter.inc('a')
+    histogram.observe(1)
+    with histogram.time():
+        pass
+
+    assert counter.values() == {}
+    assert histogram.values() == {}
+
+
+def test_label_values_are_escaped(enabled, counter):
+    counter.inc('say "hi"\n')
+    assert 'kind="say \\"hi\\"\\n"' in counter.render()
+
+
+def test_collect_counts_hit_outcomes(enabled, client, project):
+    client.get('/a.gif', {'tid': project.tid, 'url': 'http://example.com'})
+    client.get('/a.gif', {'tid': project.tid, 'url': 'http://example.com'},
+               HTTP_DNT='1')
+    client.get('/a.gif', {'tid': 'PA-UNKNOWN00', 'url': 'http://example.com'})
+    client.get('/a.gif', {'tid': project.tid})
+
+    assert metrics.hits.values() == {
+        ('collect', 'accepted'): 1,
+        ('collect', 'dnt'): 1,
+        ('collect', 'invalid_tid'): 1,
+        ('collect', 'missing_url'): 1,
+    }
+    assert metrics.pageviews_written.values() == {('direct',): 1}
+    counts, _ = metrics.pageview_writes.values()[('direct',)]
+    assert sum(counts) == 1
+
+
+def test_report_methods_are_timed(enabled, project):
+    project.view_count()
+    project.view_count(days=1)
+    project.top_paths()
+
+    timings = metrics.reports.values()
+    assert sum(timings[('view_count',)][0]) == 2
+    assert sum(timings[('top_paths',)][0]) == 1
+
+
+def test_metrics_endpoint(enabled, client, project):
+    client.get('/a.gif', {'tid': project.tid, 'url': 'http://example.com'})
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = response.content.decode()
+    assert 'panalytics_hits_total{endpoint="collect",outcome="accepted"} 1' \
+        in body
+    assert 'panalytics_request_seconds_count{view="collect",status="200"} 1' \
+        in body
+
+
+def test_metrics_endpoint_is_hidden_when_disabled(settings, client, db):
+    settings.METRICS_ENABLED = False
+    assert client.get('/metrics').status_code == 404
@@ -2,6 +2,7 @@ from unittest.mock import patch
 from django.utils import timezone
 
 from ..models import Project
+from ..rollups import update_rollups
 
 
 @patch('django.db.models.Model.save')
@@ -52,16 +53,29 @@ def test_project_save_get_new_tid_if_duplicate_exists(
 
 @patch('panalytics.core.models.Project.objects')
 def test_is_valid_tracking_id_true_when_valid(mock_objects):
-    mock_objects.filter.return_value.exists.return_value = True
+    # The project's primary key and options
+    mock_objects.filter.return_value.values_list.return_value \
+        .first.return_value = (1, 1, None)
     assert Project.is_valid_tracking_id('PA-TESTTRACK')
 
 
 @patch('panalytics.core.models.Project.objects')
 def test_is_valid_tracking_id_false_when_tid_not_exist(mock_objects):
-    mock_objects.filter.return_value.exists.return_value = False
+    mock_objects.filter.return_value.values_list.return_value \
+        .first.return_value = None
     assert not Project.is_valid_tracking_id('PA-TESTTRACK')
 
 
+@patch('panalytics.core.models.Project.objects')
+def test_is_valid_tracking_id_caches_lookup(mock_objects):
+    mock_objects.filter.return_value.values_list.return_value \
+        .first.return_value = None
+    Project.is_valid_tracking_id('PA-TESTTRACK')
+    Project.is_valid_tracking_id('PA-TESTTRACK')
+
+    assert mock_objects.filter.call_count == 1
+
+
 def test_is_valid_Tracking_id_false_when_none():
     assert not Project.is_valid_tracking_id(None)
 
@@ -74,67 +88,79 @@ def test_is_valid_Tracking_id_false_when_too_many_chars():
     assert not Project.is_valid_tracking_id('PA-TESTTRACK2')
 
 
-@patch('panalytics.core.models.PageView.objects')
-def test_view_count_no_days(m_queryset):
-    m_queryset.filter.return_value = m_queryset
-    m_queryset.count.return_value = 3
-    project = Project(name='test')
+def hours_ago(hours):
+    return timezone.now() - timezone.timedelta(hours=hours)
 
-    count = project.view_count()
 
-    args, kwargs = m_queryset.filter.call_args
-    assert count == 3
-    assert m_queryset.filter.call_count == 1
-    assert kwargs['project'] == project
+def test_view_count_no_days(project, add_pageview):
+    for hours in (0, 30, 24 * 40):
+        add_pageview(project, timestamp=hours_ago(hours))
 
+    assert project.view_count() == 3
 
-@patch('panalytics.core.models.PageView.objects')
-def test_view_count_with_days(m_queryset):
-    m_queryset.filter.return_value = m_queryset
-    m_queryset.count.return_value = 3
-    project = Project(name='test')
-    old_day_ago = timezone.now() - timezone.timedelta(days=1)
 
-    count = project.view_count(days=1)
+def test_view_count_with_days(project, add_pageview):
+    for hours in (0, 30, 24 * 40):
+        add_pageview(project, timestamp=hours_ago(hours))
 
-    new_day_ago = timezone.now() - timezone.timedelta(days=1)
-    arg_list = m_queryset.filter.call_args_list
-    assert count == 3
-    assert m_queryset.filter.call_count == 2
-    assert arg_list[0][1]['project'] == project
-    assert arg_list[1][1]['timestamp__gte'] >= old_day_ago
-    assert arg_list[1][1]['timestamp__gte'] <= new_day_ago
+    assert project.view_count(days=1) == 1
+    assert project.view_count(days=30) == 2
 
 
-@patch('panalytics.core.models.PageView.objects')
-def test_unique_view_count_no_days(m_queryset):
-    m_queryset.filter.return_value = m_queryset
-    m_queryset.count.return_value = 3
-    project = Project(name='test')
+def test_unique_view_count_no_days(project, add_pageview):
+    add_pageview(project, unique_visit=True)
+    add_pageview(project, timestamp=hours_ago(24 * 40), unique_visit=True)
+    add_pageview(project)
 
-    count = project.unique_view_count()
+    assert project.unique_view_count() == 2
 
-    args, kwargs = m_queryset.filter.call_args
-    assert count == 3
-    assert m_queryset.filter.call_count == 1
-    assert kwargs['project'] == project
-    assert kwargs['unique_visit']
 
+def test_unique_view_count_with_days(project, add_pageview):
+    add_pageview(project, unique_visit=True)
+    add_pageview(project, timestamp=hours_ago(24 * 40), unique_visit=True)
+    add_pageview(project)
 
-@patch('panalytics.core.models.PageView.objects')
-def test_unique_view_count_with_days(m_queryset):
-    m_queryset.filter.return_value = m_queryset
-    m_queryset.count.return_value = 3
-    project = Project(name='test')
-    old_day_ago = timezone.now() - timezone.timedelta(days=1)
-
-    count = project.unique_view_count(days=1)
-
-    new_day_ago = timezone.now() - timezone.timedelta(days=1)
-    arg_list = m_queryset.filter.call_args_list
-    assert count == 3
-    assert m_queryset.filter.call_count == 2
-    assert arg_list[0][1]['project'] == project
-    assert arg_list[0][1]['unique_visit']
-    assert arg_list[1][1]['timestamp__gte'] >= old_day_ago
-    assert arg_list[1][1]['timestamp__gte'] <= new_day_ago
+    assert project.unique_view_count(days=1) == 1
+
+
+def test_view_counts_combine_rollups_and_pending_page_views(project,
+                                                            add_pageview):
+    add_pageview(project, timestamp=hours_ago(30), unique_visit=True)
+    add_pageview(project, timestamp=hours_ago(24 * 40))
+    update_rollups()
+    add_pageview(project, unique_visit=True)
+
+    assert project.view_count() == 3
+    assert project.view_count(days=7) == 2
+    assert project.unique_view_count() == 2
+    assert project.unique_view_count(days=1) == 1
+
+
+def test_view_count_ignores_other_projects(project, add_pageview):
+    other = Project.objects.create(name='other')
+    add_pageview(other)
+    update_rollups()
+    add_pageview(other)
+
+    assert project.view_count() == 0
+
+
+def test_top_paths_combine_rollups_and_pending_page_views(project,
+                                                          add_pageview):
+    for path in ('/a', '/a', '/b', '/c'):
+        add_pageview(project, path=path)
+    update_rollups()
+    for path in ('/b', '/b', '/d'):
+        add_pageview(project, path=path)
+
+    top_paths = project.top_paths()
+
+    assert top_paths[:2] == [(3, '/b'), (2, '/a')]
+    assert sorted(top_paths[2:]) == [(1, '/c'), (1, '/d')]
+
+
+def test_top_paths_limited_to_five(project, add_pageview):
+    for i in range(7):
+        add_pageview(project, path=f'/{i}')
+
+    assert len(project.top_paths()) == 5
@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+from ..partitions import (add_months, month_start, partition_month,
+                          partition_name)
+
+UTC = datetime.timezone.utc
+
+
+def test_month_start_truncates_to_first_of_month_in_utc():
+    value = datetime.datetime(2020, 3, 31, 23, 30,
+                              tzinfo=datetime.timezone(
+                                  datetime.timedelta(hours=-5)))
+
+    assert month_start(value) == datetime.datetime(2020, 4, 1, tzinfo=UTC)
+
+
+@pytest.mark.parametrize('months, expected', [
+    (1, (2020, 12)),
+    (2, (2021, 1)),
+    (14, (2022, 1)),
+    (-11, (2019, 12)),
+])
+def test_add_months_crosses_years(months, expected):
+    month = datetime.datetime(2020, 11, 1, tzinfo=UTC)
+
+    result = add_months(month, months)
+
+    assert (result.year, result.month) == expected
+
+
+def test_partition_name_round_trips():
+    month = datetime.datetime(2020, 2, 1, tzinfo=UTC)
+
+    assert partition_name(month) == 'core_pageview_y2020m02'
+    assert partition_month(partition_name(month)) == month
+
+
+def test_partition_month_ignores_default_partition():
+    assert partition_month('core_pageview_default') is None
+
+
+@pytest.mark.django_db
+def test_partition_pageviews_requires_postgresql():
+    if connection.vendor == 'postgresql':
+        pytest.skip('Only applies to other databases')
+
+    with pytest.raises(CommandError):
+        call_command('partition_pageviews')
@@ -0,0 +1,47 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from ..models import Project
+from ..profiling import QueryProfile
+
+
+def test_query_profile_counts_queries(project):
+    with QueryProfile(record=True) as profile:
+        Project.objects.count()
+        list(Project.objects.all())
+
+    assert profile.count == 2
+    assert profile.seconds > 0
+    assert profile.statements[0].startswith('SELECT COUNT(*)')
+
+
+def test_query_profile_stops_counting_on_exit(project):
+    with QueryProfile() as profile:
+        Project.objects.count()
+    Project.objects.count()
+
+    assert profile.count == 1
+
+
+def test_middleware_adds_server_timing(settings, client, project):
+    settings.QUERY_PROFILING = True
+    response = client.get('/a.gif', {'tid': project.tid,
+                                     'url': 'http://example.com/'})
+
+    assert response['Server-Timing'].endswith('desc="1 queries"')
+
+
+def test_server_timing_is_off_by_default(client, project):
+    response = client.get('/a.gif', {'tid': project.tid,
+                                     'url': 'http://example.com/'})
+
+    assert not response.has_header('Server-Timing')
+
+
+def test_command_reports_queries(settings, db):
+    settings.QUERY_PROFILING = True
+    stderr = StringIO()
+    call_command('rollup_pageviews', stdout=StringIO(), stderr=stderr)
+
+    assert stderr.getvalue().startswith('Database: ')
@@ -0,0 +1,112 @@
+"""
+Query budgets of the hot paths.
+
+Raising a budget should be a deliberate decision: extra queries on these
+paths are the most common performance regression in this app.
+"""
+import json
+
+import pytest
+from django.utils import timezone
+
+from ..cache import tracking_ids
+from ..models import Project
+from ..rollups import update_rollups
+from ..utils import hash_visitor
+
+BUDGETS = {
+    # The insert, with the tracking ID cached
+    'collect': 1,
+    # The insert, in a savepoint so a failed batch can be retried row by row
+    'collect_batch': 3,
+    # The tracking ID lookup on a cold cache
+    'script': 1,
+    # Session, user, counts, annotated page and top paths, whatever the
+    # number of projects
+    'project_changelist': 10,
+    # The watermark, then the rollups and the page views not rolled up yet
+    'view_count': 3,
+    'top_paths': 2,
+    'unique_visitor_count': 3,
+}
+
+
+@pytest.fixture
+def add_projects(add_pageview):
+    """Return a function adding projects with a rolled up and a pending
+    page view each."""
+    def add_viewed(project, days_ago, visitor):
+        timestamp = timezone.now() - timezone.timedelta(days=days_ago)
+        add_pageview(project, '/a', timestamp=timestamp, unique_visit=True,
+                     visitor_hash=hash_visitor(project.pk, visitor, ''))
+
+    def add(count):
+        projects = [Project.objects.create(name=f'Project {i}')
+                    for i in range(count)]
+        for project in projects:
+            add_viewed(project, 2, '203.0.113.7')
+        update_rollups()
+        for project in projects:
+            add_viewed(project, 0, '203.0.113.8')
+        return projects
+    return add
+
+
+def test_collect(client, project, query_budget):
+    with query_budget(BUDGETS['collect']):
+        response = client.get('/a.gif', {'tid': project.tid,
+                                         'url': 'http://example.com/'})
+
+    assert response.status_code == 200
+    assert project.pageviews.get().url == 'http://example.com/'
+
+
+def test_collect_batch(client, project, query_budget):
+    hits = [{'tid': project.tid, 'url': f'http://example.com/{i}'}
+            for i in range(20)]
+    with query_budget(BUDGETS['collect_batch']):
+        response = client.post('/a.batch', json.dumps(hits),
+                               content_type='text/plain')
+
+    assert response.status_code == 204
+    assert project.pageviews.count() == 20
+
+
+def test_script(client, project, query_budget):
+    tracking_ids.clear()
+    with query_budget(BUDGETS['script']):
+        response = client.get('/a.js', {'tid': project.tid})
+
+    assert response.status_code == 200
+    assert project.tid in response.content.decode()
+
+
+@pytest.mark.parametrize('projects', [1, 10])
+def test_project_changelist(admin_client, query_budget, projects,
+                            add_projects):
+    projects = add_projects(projects)
+    with query_budget(BUDGETS['project_changelist']):
+        response = admin_client.get('/admin/core/project/')
+
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert all(project.tid in content for project in projects)
+    assert '2 - /a' in content
+
+
+def test_view_count(query_budget, add_projects):
+    project, = add_projects(1)
+    with query_budget(BUDGETS['view_count']):
+        assert project.view_count(days=7) == 2
+
+
+def test_top_paths(query_budget, add_projects):
+    project, = add_projects(1)
+    with query_budget(BUDGETS['top_paths']):
+        assert project.top_paths() == [(2, '/a')]
+
+
+def test_unique_visitor_count(query_budget, add_projects):
+    project, = add_projects(1)
+    with query_budget(BUDGETS['unique_visitor_count']):
+        assert project.unique_visitor_count(days=30) == 2
@@ -0,0 +1,170 @@
+import json
+
+import pytest
+from django.core.cache import cache
+
+from .. import metrics, ratelimit
+from ..models import PageView, Project
+from ..ratelimit import CacheBuckets, MemoryBuckets
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def limits(settings):
+    settings.RATE_LIMIT_ENABLED = True
+    settings.RATE_LIMIT_IP = 0
+    settings.RATE_LIMIT_TID = 1
+    settings.RATE_LIMIT_BURST = 3
+    settings.METRICS_ENABLED = True
+    metrics.clear()
+    cache.clear()
+    yield settings
+    metrics.clear()
+    cache.clear()
+
+
+def collect(client, project, **extra):
+    return client.get('/a.gif', {'tid': project.tid,
+                                 'url': 'http://example.com'}, **extra)
+
+
+def test_memory_buckets_refill(clock):
+    buckets = MemoryBuckets(max_keys=10)
+    assert [buckets.take('a', 2, 4) for _ in range(5)] == \
+        [True, True, True, True, False]
+    assert buckets.take('b', 2, 4)
+
+    clock[0] += 1
+    assert [buckets.take('a', 2, 4) for _ in range(3)] == \
+        [True, True, False]
+
+
+def test_memory_buckets_large_cost_goes_into_debt(clock):
+    buckets = MemoryBuckets(max_keys=10)
+    assert buckets.take('a', 1, 2, cost=5)
+    clock[0] += 2
+    assert not buckets.take('a', 1, 2)
+    clock[0] += 2
+    assert buckets.take('a', 1, 2)
+
+
+def test_memory_buckets_drop_least_recently_used(clock):
+    buckets = MemoryBuckets(max_keys=2)
+    buckets.take('a', 1, 1)
+    buckets.take('b', 1, 1)
+    buckets.take('c', 1, 1)
+    # 'a' was forgotten, so it starts with a full bucket again
+    assert buckets.take('a', 1, 1)
+    assert not buckets.take('c', 1, 1)
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_buckets_take_all_or_nothing(clock, limits, shared):
+    buckets = CacheBuckets('default') if shared else MemoryBuckets(10)
+    assert buckets.take('tid', 1, 1)
+
+    assert buckets.take_all([('ip', 1, 1, 1), ('tid', 1, 1, 1)]) == 'tid'
+    assert buckets.take('ip', 1, 1)
+
+
+def test_cache_buckets_count_per_window(clock, limits):
+    buckets = CacheBuckets('default')
+    assert [buckets.take('a', 1, 3) for _ in range(4)] == \
+        [True, True, True, False]
+    clock[0] += 3
+    assert buckets.take('a', 1, 3)
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_buckets_refuse_cost_above_remaining_tokens(clock, limits, shared):
+    buckets = CacheBuckets('default') if shared else MemoryBuckets(10)
+    assert buckets.take('a', 1, 5, cost=3)
+    assert not buckets.take('a', 1, 5, cost=3)
+    assert buckets.take('a', 1, 5, cost=2)
+    assert not buckets.take('a', 1, 5)
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_collect_drops_hits_over_the_tid_limit(client, project, limits,
+                                               clock, shared):
+    limits.RATE_LIMIT_CACHE = 'default' if shared else ''
+    responses = [collect(client, project) for _ in range(5)]
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response['Content-Type'] == 'image/gif'
+               for response in responses)
+    assert PageView.objects.count() == 3
+    assert metrics.rate_limited.values() == {('collect', 'tid'): 2}
+    assert metrics.hits.values()[('collect', 'rate_limited')] == 2
+
+
+def test_collect_drops_hits_over_the_ip_limit(client, project, limits,
+                                              clock):
+    limits.RATE_LIMIT_TID = 0
+    limits.RATE_LIMIT_IP = 1
+    for _ in range(4):
+        collect(client, project, REMOTE_ADDR='10.0.0.1')
+    collect(client, project, REMOTE_ADDR='10.0.0.2')
+
+    assert PageView.objects.count() == 4
+    assert metrics.rate_limited.values() == {('collect', 'ip'): 1}
+
+
+def test_project_rate_limit_overrides_setting(client, project, limits,
+                                              clock):
+    project.rate_limit = 2
+    project.save()
+    for _ in range(8):
+        collect(client, project)
+
+    assert PageView.objects.count() == 6
+
+
+def test_script_is_limited(client, project, limits, clock):
+    responses = [client.get('/a.js', {'tid': project.tid}) for _ in range(4)]
+
+    assert [response.status_code for response in responses] == \
+        [200, 200, 200, 429]
+    assert responses[-1]['Retry-After'] == '1'
+
+
+def test_batch_costs_its_number_of_hits(client, project, limits, clock):
+    hits = [{'tid': project.tid, 'url': f'http://example.com/{i}'}
+            for i in range(2)]
+    for seconds in (0, 0, 1):
+        clock[0] += seconds
+        client.post('/a.batch', json.dumps(hits), content_type='text/plain')
+
+    assert PageView.objects.count() == 4
+    assert metrics.rate_limited.values() == {('batch', 'tid'): 2}
+
+
+def test_batch_charges_every_tid(client, project, limits, clock):
+    other = Project.objects.create(name='Other Project')
+    hits = [{'tid': 1}, {'tid': ['PA-A']},
+            {'tid': project.tid, 'url': 'http://example.com/a'},
+            {'tid': project.tid, 'url': 'http://example.com/b'},
+            {'tid': other.tid, 'url': 'http://example.com/c'}]
+    for _ in range(2):
+        response = client.post('/a.batch', json.dumps(hits),
+                               content_type='text/plain')
+        assert response.status_code == 204
+
+    assert project.pageviews.count() == 2
+    assert other.pageviews.count() == 1
+    assert metrics.rate_limited.values() == {('batch', 'tid'): 5}
+
+
+def test_no_limits_when_disabled(client, project, limits, clock):
+    limits.RATE_LIMIT_ENABLED = False
+    for _ in range(5):
+        collect(client, project)
+
+    assert PageView.objects.count() == 5
@@ -0,0 +1,207 @@
+import datetime
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from ..hll import HyperLogLog
+from ..models import (DailyRollup, HourlyRollup, PathRollup, Project,
+                      RollupWatermark, TopValues, VisitorSketch)
+from ..rollups import update_rollups
+from ..utils import hash_visitor
+
+
+def visitor(n):
+    """Spread small numbers over the 64 bit range like real hashes."""
+    return n * 0x9E3779B97F4A7C15 % 2 ** 64 - 2 ** 63
+
+
+NOON = datetime.datetime(2020, 3, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def add_pageview(add_pageview):
+    """Add page views at NOON unless given another timestamp."""
+    def add(project, **fields):
+        return add_pageview(project, **{'timestamp': NOON, **fields})
+    return add
+
+
+def test_update_rollups_aggregates_by_hour_and_day(project, add_pageview):
+    add_pageview(project, unique_visit=True)
+    add_pageview(project)
+    add_pageview(project, timestamp=NOON + datetime.timedelta(hours=2))
+
+    assert update_rollups() == 3
+
+    hourly = HourlyRollup.objects.order_by('bucket')
+    assert [(h.bucket.hour, h.views, h.unique_views) for h in hourly] == \
+        [(12, 2, 1), (14, 1, 0)]
+    daily = DailyRollup.objects.get()
+    assert (daily.bucket, daily.views, daily.unique_views) == \
+        (NOON.date(), 3, 1)
+
+
+def test_update_rollups_aggregates_paths_by_day(project, add_pageview):
+    add_pageview(project, path='/a')
+    add_pageview(project, path='/a')
+    add_pageview(project, path='/b')
+
+    update_rollups()
+
+    assert dict(PathRollup.objects.values_list('path', 'views')) == \
+        {'/a': 2, '/b': 1}
+
+
+def test_update_rollups_only_processes_new_page_views(project, add_pageview):
+    add_pageview(project)
+    update_rollups()
+    pageview = add_pageview(project)
+
+    assert update_rollups() == 1
+    assert HourlyRollup.objects.get().views == 2
+    assert DailyRollup.objects.get().views == 2
+    assert RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS) == \
+        pageview.pk
+
+
+def test_update_rollups_in_small_batches(project, add_pageview):
+    for _ in range(5):
+        add_pageview(project, path='/a')
+
+    assert update_rollups(batch_size=2) == 5
+    assert HourlyRollup.objects.get().views == 5
+    assert PathRollup.objects.get().views == 5
+
+
+def test_update_rollups_with_no_page_views(db):
+    assert update_rollups() == 0
+    assert not HourlyRollup.objects.exists()
+
+
+def test_update_rollups_keeps_late_page_views_in_their_bucket(project,
+                                                              add_pageview):
+    add_pageview(project, timestamp=timezone.now())
+    update_rollups()
+    add_pageview(project)
+
+    update_rollups()
+
+    noon_bucket = NOON.replace(minute=0)
+    assert HourlyRollup.objects.get(bucket=noon_bucket).views == 1
+
+
+def test_update_rollups_waits_for_lag_before_rolling_up_new_ids(project,
+                                                                add_pageview):
+    first = add_pageview(project)
+
+    assert update_rollups(lag=60) == 0
+    RollupWatermark.objects.update(
+        seen_at=timezone.now() - datetime.timedelta(seconds=61))
+    add_pageview(project)
+
+    assert update_rollups(lag=60) == 1
+    assert RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS) == first.pk
+    assert update_rollups(lag=60) == 0
+    assert DailyRollup.objects.get().views == 1
+
+
+def test_rollup_pageviews_command(project, capsys, add_pageview):
+    add_pageview(project)
+
+    call_command('rollup_pageviews')
+
+    assert 'Rolled up 1 page views.' in capsys.readouterr().out
+    assert DailyRollup.objects.get().views == 1
+
+
+def test_update_rollups_builds_daily_visitor_sketches(project, add_pageview):
+    for n in (1, 2, 2, 3):
+        add_pageview(project, visitor_hash=visitor(n))
+    add_pageview(project, timestamp=NOON + datetime.timedelta(days=1),
+                 visitor_hash=visitor(1))
+    add_pageview(project)
+
+    update_rollups(batch_size=2)
+
+    sketches = VisitorSketch.objects.order_by('bucket')
+    assert [(s.bucket, HyperLogLog.from_bytes(s.sketch).count())
+            for s in sketches] == \
+        [(NOON.date(), 3), (NOON.date() + datetime.timedelta(days=1), 1)]
+
+
+def test_unique_visitor_count_merges_sketches_and_pending(project,
+                                                          add_pageview):
+    today = timezone.now()
+    add_pageview(project, timestamp=today - datetime.timedelta(days=10),
+                 visitor_hash=visitor(1))
+    add_pageview(project, timestamp=today - datetime.timedelta(days=1),
+                 visitor_hash=visitor(2))
+    add_pageview(project, timestamp=today, visitor_hash=visitor(2))
+    update_rollups()
+    add_pageview(project, timestamp=today, visitor_hash=visitor(3))
+    add_pageview(project, timestamp=today, visitor_hash=visitor(1))
+
+    assert project.unique_visitor_count() == 3
+    assert project.unique_visitor_count(days=7) == 3
+    assert project.unique_visitor_count(days=1) == 3
+    assert Project.unique_visitor_counts([project.pk], days=2) == \
+        {project.pk: 3}
+
+
+def test_unique_visitor_count_sums_daily_visitors(project, add_pageview):
+    today = timezone.now()
+    for days in (0, 1):
+        day = today - datetime.timedelta(days=days)
+        add_pageview(project, timestamp=day, visitor_hash=hash_visitor(
+            project.pk, '203.0.113.7', 'Firefox', day.date()))
+    update_rollups()
+
+    # The same person on two days
+    assert project.unique_visitor_count(days=2) == 2
+
+
+def test_unique_visitor_count_without_visitors(project, add_pageview):
+    add_pageview(project)
+
+    assert project.unique_visitor_count(days=30) == 0
+
+
+def test_update_rollups_keeps_top_values_by_day_and_overall(project,
+                                                            add_pageview):
+    for path in ('/a', '/a', '/b'):
+        add_pageview(project, path=path)
+    add_pageview(project, path='/b',
+                 timestamp=NOON + datetime.timedelta(days=1))
+    update_rollups(batch_size=2)
+    add_pageview(project, path='/b',
+                 timestamp=NOON + datetime.timedelta(days=1))
+    update_rollups()
+
+    summaries = TopValues.objects.filter(dimension=TopValues.PATH)
+    assert {s.bucket: s.items for s in summaries} == {
+        NOON.date(): [['/a', 2, 0], ['/b', 1, 0]],
+        NOON.date() + datetime.timedelta(days=1): [['/b', 2, 0]],
+        None: [['/b', 3, 0], ['/a', 2, 0]],
+    }
+    assert project.top_values(TopValues.PATH) == [(3, '/b'), (2, '/a')]
+
+
+def test_top_referers_and_titles_within_days(project, add_pageview):
+    today = timezone.now()
+    for days_ago, referer, title in [(0, 'https://a.com/', 'Home'),
+                                     (1, 'https://a.com/', 'About'),
+                                     (1, '', 'About'),
+                                     (8, 'https://b.com/', 'About'),
+                                     (8, 'https://b.com/', 'Home'),
+                                     (9, 'https://b.com/', 'Home')]:
+        add_pageview(project, unique_visit=True, referer=referer,
+                     title=title,
+                     timestamp=today - datetime.timedelta(days=days_ago))
+    update_rollups()
+
+    assert project.top_referers() == [(3, 'https://b.com/'),
+                                      (2, 'https://a.com/')]
+    assert project.top_referers(days=7) == [(2, 'https://a.com/')]
+    assert project.top_titles(days=2, limit=1) == [(2, 'About')]
+    assert project.top_titles() == [(3, 'About'), (3, 'Home')]
@@ -0,0 +1,138 @@
+import datetime
+import json
+
+import pytest
+from django.utils import timezone
+
+from .. import archive
+from ..cache import tracking_ids
+from ..models import PageView, Project, TopValues
+from ..rollups import update_rollups
+from ..utils import hash_visitor
+
+
+@pytest.fixture
+def project(project):
+    """A project recording one visitor in four."""
+    project.sample_every = 4
+    project.save()
+    return project
+
+
+def visit(client, project, visitor, path='/'):
+    client.get('/a.gif', {'tid': project.tid,
+                          'url': f'http://example.com{path}'},
+               REMOTE_ADDR=f'10.0.{visitor // 256}.{visitor % 256}')
+
+
+@pytest.fixture
+def add_pageviews(make_pageview):
+    """Return a function adding views of ``count`` visitors at once."""
+    def add(project, count, weight, timestamp=None, path='/a'):
+        PageView.objects.bulk_create(
+            make_pageview(project, path,
+                          timestamp=timestamp or timezone.now(),
+                          unique_visit=True,
+                          visitor_hash=hash_visitor(project.pk, str(visitor),
+                                                    ''),
+                          sample_weight=weight)
+            for visitor in range(count)
+        )
+    return add
+
+
+def test_collect_samples_visitors(client, project):
+    for visitor in range(400):
+        visit(client, project, visitor)
+
+    stored = PageView.objects.filter(project=project)
+    assert 50 < stored.count() < 150
+    assert set(stored.values_list('sample_weight', flat=True)) == {4}
+    assert all(value % 4 == 0
+               for value in stored.values_list('visitor_hash', flat=True))
+
+
+def test_collect_keeps_or_drops_visitors_as_a_whole(client, project):
+    for visitor in range(40):
+        visit(client, project, visitor, '/first')
+        visit(client, project, visitor, '/second')
+
+    paths = PageView.objects.values_list('path', flat=True)
+    assert paths.filter(path='/first').count() == \
+        paths.filter(path='/second').count()
+
+
+def test_collect_batch_samples_visitors(client, project):
+    hits = [{'tid': project.tid, 'url': f'http://example.com/{i}'}
+            for i in range(5)]
+    kept = 0
+    for visitor in range(40):
+        client.post('/a.batch', json.dumps(hits), content_type='text/plain',
+                    REMOTE_ADDR=f'10.0.0.{visitor}')
+        count = PageView.objects.count()
+        assert count - kept in (0, 5)
+        kept = count
+    assert 0 < kept < 200
+    assert set(PageView.objects.values_list('sample_weight',
+                                            flat=True)) == {4}
+
+
+def test_unsampled_projects_keep_every_hit(client, db):
+    project = Project.objects.create(name='Quiet Project')
+    for visitor in range(20):
+        visit(client, project, visitor)
+
+    assert set(PageView.objects.values_list('sample_weight',
+                                            flat=True)) == {1}
+    assert PageView.objects.count() == 20
+
+
+def test_changing_the_rate_updates_cached_tracking_id(client, project):
+    tracking_ids.get(project.tid)
+    project.sample_every = 1
+    project.save()
+
+    assert tracking_ids.sample_every(project.tid) == 1
+    for visitor in range(20):
+        visit(client, project, visitor)
+    assert PageView.objects.count() == 20
+
+
+@pytest.mark.parametrize('rolled_up', [False, True])
+def test_reports_scale_sampled_counts(project, rolled_up, add_pageviews):
+    add_pageviews(project, 25, weight=4)
+    add_pageviews(project, 5, weight=1, path='/b')
+    if rolled_up:
+        update_rollups()
+
+    assert project.view_count() == 105
+    assert project.view_count(days=1) == 105
+    assert project.unique_view_count() == 105
+    assert project.top_paths() == [(100, '/a'), (5, '/b')]
+    annotated = Project.objects.with_view_counts().get(pk=project.pk)
+    assert annotated.total_views == annotated.views_1d == 105
+
+
+def test_top_values_scale_sampled_counts(project, add_pageviews):
+    add_pageviews(project, 25, weight=4)
+    update_rollups()
+    assert project.top_values(TopValues.PATH) == [(100, '/a')]
+
+
+@pytest.mark.parametrize('rolled_up', [False, True])
+def test_unique_visitors_are_scaled(project, rolled_up, add_pageviews):
+    add_pageviews(project, 250, weight=4)
+    if rolled_up:
+        update_rollups()
+    assert project.unique_visitor_count() == pytest.approx(1000, rel=0.05)
+
+
+def test_archived_page_views_keep_their_weight(project, settings, tmp_path,
+                                               add_pageviews):
+    settings.ARCHIVE_DIR = str(tmp_path)
+    day = datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)
+    add_pageviews(project, 3, weight=4, timestamp=day)
+    update_rollups()
+    archive.archive(day.date() + datetime.timedelta(days=1))
+
+    assert project.views_between(day, day + datetime.timedelta(days=1)) == 12
@@ -0,0 +1,230 @@
+import datetime
+import os
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+from ..models import PageView, SpoolOffset
+from ..spool import (HEADER, SpoolWriter, drain, read_records,
+                     segment_paths, spool)
+from ..timeseries import series
+
+NOW = datetime.datetime(2020, 3, 1, 12, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def spool_dir(tmp_path, settings):
+    settings.SPOOL_DIR = str(tmp_path)
+    yield tmp_path
+    spool.close()
+
+
+@pytest.fixture
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def writer(spool_dir):
+    writer = SpoolWriter(segment_size=4096, fsync='always')
+    yield writer
+    writer.close()
+
+
+def hit(project, path='/', **fields):
+    return {
+        'project_id': project.pk,
+        'timestamp': NOW,
+        'protocol': 'https',
+        'domain': 'example.com',
+        'path': path,
+        'url': f'https://example.com{path}',
+        'title': 'Title',
+        'window_width': '1272',
+        'window_height': '675',
+        'referer': '',
+        'unique_visit': True,
+        'visitor_hash': 42,
+        **fields,
+    }
+
+
+def test_append_and_read_records(writer, project):
+    assert writer.append(hit(project, '/a'))
+    assert writer.append(hit(project, '/b'))
+
+    path, = segment_paths()
+    records, offset, sealed = read_records(path)
+    assert [record['path'] for record in records] == ['/a', '/b']
+    assert records[0]['timestamp'] == NOW
+    assert not sealed
+
+    assert read_records(path, offset) == ([], offset, False)
+
+
+def test_close_seals_segment(writer, project):
+    writer.append(hit(project))
+    writer.close()
+
+    records, offset, sealed = read_records(segment_paths()[0])
+    assert len(records) == 1
+    assert sealed
+
+
+def test_full_segment_rotates(writer, project):
+    for i in range(40):
+        assert writer.append(hit(project, f'/{i}'))
+
+    first, *rest = segment_paths()
+    assert rest
+    records, _, sealed = read_records(first)
+    assert sealed
+    assert sum(len(read_records(path)[0]) for path in segment_paths()) == 40
+
+
+def test_full_spool_refuses_hits(spool_dir, project):
+    writer = SpoolWriter(segment_size=4096, max_bytes=4096)
+    appended = [writer.append(hit(project, f'/{i}')) for i in range(40)]
+    writer.close()
+
+    assert appended[0]
+    assert not appended[-1]
+    assert len(segment_paths()) == 1
+
+
+def test_read_stops_at_damaged_record(writer, project):
+    writer.append(hit(project, '/a'))
+    writer.append(hit(project, '/b'))
+    writer.close()
+    path, = segment_paths()
+    _, first_end, _ = read_records(path, limit=1)
+
+    with open(path, 'r+b') as segment:
+        segment.seek(first_end + HEADER.size)
+        segment.write(b'X')
+
+    records, offset, sealed = read_records(path)
+    assert [record['path'] for record in records] == ['/a']
+    assert offset == first_end
+    assert not sealed
+
+
+def test_drain_loads_and_deletes_sealed_segments(writer, project):
+    for i in range(5):
+        writer.append(hit(project, f'/{i}'))
+    writer.close()
+
+    assert drain(batch_size=2) == 5
+    assert PageView.objects.count() == 5
+    assert PageView.objects.first().timestamp == NOW
+    assert segment_paths() == []
+    assert not SpoolOffset.objects.exists()
+
+
+def test_drain_updates_cached_buckets(writer, project, clear_cache):
+    day = NOW.replace(hour=0)
+    until = day + datetime.timedelta(days=1)
+    assert series(project.pk, day, until) == [(day, 0, 0)]
+    writer.append(hit(project))
+    writer.close()
+
+    drain()
+
+    assert series(project.pk, day, until) == [(day, 1, 1)]
+
+
+def test_drain_keeps_segment_of_live_writer(writer, project):
+    writer.append(hit(project, '/a'))
+    assert drain() == 1
+
+    writer.append(hit(project, '/b'))
+    assert drain() == 1
+    assert len(segment_paths()) == 1
+    assert SpoolOffset.objects.get().offset > 0
+
+    writer.close()
+    assert drain() == 0
+    assert segment_paths() == []
+    assert list(PageView.objects.order_by('path')
+                .values_list('path', flat=True)) == ['/a', '/b']
+
+
+def test_drain_resumes_from_committed_offset(writer, project):
+    for i in range(3):
+        writer.append(hit(project, f'/{i}'))
+    writer.close()
+    path, = segment_paths()
+    _, offset, _ = read_records(path, limit=2)
+    # Crashed after committing the first two hits
+    SpoolOffset.objects.create(segment=os.path.basename(path), offset=offset)
+
+    assert drain() == 1
+    assert list(PageView.objects.values_list('path', flat=True)) == ['/2']
+
+
+def test_drain_deletes_segments_of_exited_writers(spool_dir, project):
+    pid = os.fork()
+    if pid == 0:
+        SpoolWriter(segment_size=4096).append(hit(project))
+        # Exit without sealing, as if crashed
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert drain() == 1
+    assert segment_paths() == []
+
+
+def test_drain_skips_invalid_hits(writer, project):
+    writer.append(hit(project, '/a'))
+    writer.append(hit(project, '/b', project_id=project.pk + 1))
+    writer.close()
+
+    assert drain() == 1
+    assert segment_paths() == []
+
+
+def test_collect_spools_hits(settings, spool_dir, client, project):
+    settings.SPOOL_ENABLED = True
+    client.get('/a.gif', {'tid': project.tid,
+                          'url': 'https://example.com/landing'})
+    spool.close()
+
+    assert not PageView.objects.exists()
+    records, _, _ = read_records(segment_paths()[0])
+    assert records[0]['path'] == '/landing'
+
+
+def test_collect_writes_directly_when_spool_full(settings, spool_dir,
+                                                 client, project):
+    settings.SPOOL_ENABLED = True
+    settings.SPOOL_MAX_BYTES = 0
+    client.get('/a.gif', {'tid': project.tid,
+                          'url': 'https://example.com/landing'})
+
+    assert PageView.objects.get().path == '/landing'
+    assert segment_paths() == []
+
+
+def test_collect_batch_spools_hits(settings, spool_dir, client, project):
+    settings.SPOOL_ENABLED = True
+    client.post('/a.batch', f'[{{"tid": "{project.tid}", '
+                f'"url": "https://example.com/a"}}]',
+                content_type='text/plain')
+    spool.close()
+
+    assert drain() == 1
+    assert PageView.objects.get().path == '/a'
+
+
+def test_drain_spool_command(writer, project):
+    writer.append(hit(project))
+    writer.close()
+    stdout = StringIO()
+    call_command('drain_spool', '--once', stdout=stdout)
+
+    assert stdout.getvalue() == 'Loaded 1 page views.\n'
+    assert PageView.objects.count() == 1
@@ -0,0 +1,171 @@
+import datetime
+
+import pytest
+from django.test import RequestFactory
+
+from ..models import PageView, Project
+from ..rollups import update_rollups
+from ..storage import (FileStorage, ORMStorage, SQLiteStorage, get_storage,
+                       write_pageviews)
+
+HOUR = datetime.datetime(2020, 3, 1, 12, tzinfo=datetime.timezone.utc)
+
+BACKENDS = {
+    'orm': 'panalytics.core.storage.ORMStorage',
+    'sqlite': 'panalytics.core.storage.SQLiteStorage',
+    'file': 'panalytics.core.storage.FileStorage',
+}
+
+
+@pytest.fixture(params=list(BACKENDS))
+def storage(request, settings, tmp_path, db):
+    settings.PAGEVIEW_STORAGE = BACKENDS[request.param]
+    settings.PAGEVIEW_STORAGE_PATH = str(tmp_path)
+    return get_storage()
+
+
+@pytest.fixture
+def pageview(make_pageview):
+    """Return a function building a page view ``minutes`` after HOUR."""
+    def make(project, minutes=0, path='/', title='Title',
+             unique_visit=False):
+        return make_pageview(
+            project, path, title=title, unique_visit=unique_visit,
+            timestamp=HOUR + datetime.timedelta(minutes=minutes))
+    return make
+
+
+@pytest.fixture
+def stored(storage, project, pageview):
+    storage.write([
+        pageview(project, 0, '/', unique_visit=True),
+        pageview(project, 10, '/'),
+        pageview(project, 20, '/about', 'About', unique_visit=True),
+        pageview(project, 70, '/'),
+        pageview(project, 80, '/blog', 'Blog'),
+    ])
+    return storage
+
+
+def test_get_storage_uses_setting(settings, tmp_path):
+    settings.PAGEVIEW_STORAGE_PATH = str(tmp_path)
+    assert isinstance(get_storage(), ORMStorage)
+
+    settings.PAGEVIEW_STORAGE = BACKENDS['sqlite']
+    assert isinstance(get_storage(), SQLiteStorage)
+    assert get_storage().path == str(tmp_path / 'pageviews.sqlite3')
+
+    settings.PAGEVIEW_STORAGE = BACKENDS['file']
+    assert isinstance(get_storage(), FileStorage)
+    assert get_storage().path == str(tmp_path)
+
+
+def test_write_returns_count(storage, project, pageview):
+    assert storage.write([pageview(project), pageview(project)]) == 2
+    assert storage.write([pageview(project)]) == 1
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'file'])
+def test_write_pageviews_leaves_database_alone(settings, tmp_path, project,
+                                               pageview, backend,
+                                               django_assert_num_queries):
+    settings.PAGEVIEW_STORAGE = BACKENDS[backend]
+    settings.PAGEVIEW_STORAGE_PATH = str(tmp_path)
+
+    with django_assert_num_queries(0):
+        assert write_pageviews([pageview(project), pageview(project)]) == 2
+
+
+def test_count(stored, project):
+    assert stored.count(project.pk) == 5
+    assert stored.count(project.pk, unique=True) == 2
+
+
+def test_count_time_range(stored, project):
+    since = HOUR + datetime.timedelta(minutes=10)
+    until = HOUR + datetime.timedelta(minutes=70)
+    assert stored.count(project.pk, since=since) == 4
+    assert stored.count(project.pk, until=until) == 3
+    assert stored.count(project.pk, since=since, until=until) == 2
+    assert stored.count(project.pk, since=since, until=until,
+                        unique=True) == 1
+
+
+def test_count_only_counts_project(stored, project, pageview):
+    other = Project.objects.create(name='Other Project')
+    stored.write([pageview(other)])
+    assert stored.count(project.pk) == 5
+    assert stored.count(other.pk) == 1
+
+
+def test_group_by(stored, project):
+    assert stored.group_by(project.pk, 'path') == {
+        '/': 3, '/about': 1, '/blog': 1,
+    }
+    assert stored.group_by(project.pk, 'title',
+                           since=HOUR + datetime.timedelta(hours=1)) == {
+        'Title': 1, 'Blog': 1,
+    }
+
+
+def test_group_by_rejects_unknown_field(stored, project):
+    with pytest.raises(ValueError):
+        stored.group_by(project.pk, 'visitor_hash')
+
+
+def test_top(stored, project):
+    assert stored.top(project.pk, 'path') == [
+        (3, '/'), (1, '/about'), (1, '/blog'),
+    ]
+    assert stored.top(project.pk, 'path', limit=1) == [(3, '/')]
+    assert stored.top(project.pk, 'title',
+                      until=HOUR + datetime.timedelta(hours=1)) == [
+        (2, 'Title'), (1, 'About'),
+    ]
+
+
+def test_project_reports_use_storage(stored, project):
+    assert project.view_count() == 5
+    assert project.unique_view_count() == 2
+    assert project.top_paths() == [(3, '/'), (1, '/about'), (1, '/blog')]
+
+
+def test_sampled_page_views_count_for_their_weight(storage, project, pageview):
+    sampled = pageview(project, 0, '/', unique_visit=True)
+    sampled.sample_weight = 10
+    storage.write([sampled, pageview(project, 10, '/about')])
+
+    assert storage.count(project.pk) == 11
+    assert storage.count(project.pk, unique=True) == 10
+    assert storage.count(project.pk, since=HOUR,
+                         until=HOUR + datetime.timedelta(minutes=5)) == 10
+    assert storage.top(project.pk, 'path') == [(10, '/'), (1, '/about')]
+
+
+def test_collect_writes_to_storage(storage, project, client):
+    client.get('/a.gif', {'tid': project.tid,
+                          'url': 'https://example.com/landing'})
+    assert storage.group_by(project.pk, 'path') == {'/landing': 1}
+
+
+def test_orm_count_reads_rollups(project, pageview):
+    storage = ORMStorage()
+    storage.write([pageview(project), pageview(project, 90)])
+    update_rollups()
+    storage.write([pageview(project, 100)])
+
+    assert storage.count(project.pk) == 3
+    assert storage.count(project.pk, since=HOUR) == 3
+    assert PageView.objects.filter(project=project).delete()[0] == 3
+    assert storage.count(project.pk, since=HOUR) == 2
+
+
+def test_non_orm_storage_skips_interning(settings, tmp_path, project):
+    settings.INTERN_DIMENSIONS = True
+    settings.PAGEVIEW_STORAGE = BACKENDS['sqlite']
+    settings.PAGEVIEW_STORAGE_PATH = str(tmp_path)
+    request = RequestFactory().get('/a.gif', {
+        'tid': project.tid, 'url': 'https://example.com/about',
+    })
+    PageView.create_from_request(request)
+    assert get_storage().group_by(project.pk, 'path') == {'/about': 1}
@@ -0,0 +1,232 @@
+import datetime
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from ..access_log import write_rows
+from ..models import TopValues
+from ..rollups import update_rollups
+from ..timeseries import bucket_starts, forget_buckets, parse_time, series
+
+DAY = datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def add_pageview(add_pageview):
+    """Add unique views of /a at ``timestamp`` by default."""
+    def add(project, timestamp, path='/a', unique_visit=True):
+        return add_pageview(project, path, timestamp=timestamp,
+                            unique_visit=unique_visit)
+    return add
+
+
+@pytest.fixture
+def pageviews(project, add_pageview):
+    add_pageview(project, DAY + datetime.timedelta(hours=1))
+    add_pageview(project, DAY + datetime.timedelta(hours=1, minutes=30),
+                 unique_visit=False)
+    add_pageview(project, DAY + datetime.timedelta(hours=30), path='/b')
+    update_rollups()
+    # Not rolled up yet
+    add_pageview(project, DAY + datetime.timedelta(hours=30, minutes=5),
+                 path='/b')
+
+
+def test_parse_time():
+    assert parse_time('2020-03-01') == DAY
+    assert parse_time('2020-03-01T05:00') == DAY + datetime.timedelta(hours=5)
+    assert parse_time('2020-03-01T05:00+01:00') == \
+        DAY + datetime.timedelta(hours=4)
+    with pytest.raises(ValueError):
+        parse_time('yesterday')
+
+
+def test_bucket_starts_cover_partial_buckets():
+    since = DAY + datetime.timedelta(hours=5)
+    assert bucket_starts(since, since + datetime.timedelta(days=1), 'day') == \
+        [DAY, DAY + datetime.timedelta(days=1)]
+    assert len(bucket_starts(DAY, DAY + datetime.timedelta(days=1),
+                             'hour')) == 24
+
+
+def test_daily_series(project, pageviews):
+    assert series(project.pk, DAY, DAY + datetime.timedelta(days=3)) == [
+        (DAY, 2, 1),
+        (DAY + datetime.timedelta(days=1), 2, 2),
+        (DAY + datetime.timedelta(days=2), 0, 0),
+    ]
+
+
+def test_hourly_series(project, pageviews):
+    since = DAY + datetime.timedelta(hours=1)
+    assert series(project.pk, since, since + datetime.timedelta(hours=2),
+                  'hour') == [(since, 2, 1),
+                              (since + datetime.timedelta(hours=1), 0, 0)]
+    hour = DAY + datetime.timedelta(hours=30)
+    assert series(project.pk, hour, hour + datetime.timedelta(hours=1),
+                  'hour') == [(hour, 2, 2)]
+
+
+def test_settled_buckets_are_cached(project, pageviews,
+                                    django_assert_num_queries, add_pageview):
+    until = DAY + datetime.timedelta(days=2)
+    expected = series(project.pk, DAY, until)
+    add_pageview(project, DAY + datetime.timedelta(hours=2))
+
+    with django_assert_num_queries(0):
+        assert series(project.pk, DAY, until) == expected
+
+
+def test_settled_buckets_expire(project, pageviews, settings, add_pageview):
+    settings.API_BUCKET_TTL = 0
+    until = DAY + datetime.timedelta(days=2)
+    series(project.pk, DAY, until)
+    add_pageview(project, DAY + datetime.timedelta(hours=2))
+
+    assert series(project.pk, DAY, until)[0] == (DAY, 3, 2)
+
+
+def test_forget_buckets_drops_cached_hours_and_days(project, pageviews,
+                                                    add_pageview):
+    since = DAY + datetime.timedelta(hours=1)
+    until = DAY + datetime.timedelta(days=2)
+    series(project.pk, since, until, 'hour')
+    series(project.pk, DAY, until)
+    add_pageview(project, DAY + datetime.timedelta(hours=1, minutes=45))
+
+    forget_buckets([(project.pk, DAY + datetime.timedelta(hours=1))])
+
+    assert series(project.pk, since, until, 'hour')[0] == (since, 3, 2)
+    assert series(project.pk, DAY, until)[0] == (DAY, 3, 2)
+
+
+def test_imported_page_views_update_cached_buckets(project, pageviews):
+    until = DAY + datetime.timedelta(days=2)
+    series(project.pk, DAY, until)
+
+    write_rows([{'project_id': project.pk,
+                 'timestamp': DAY + datetime.timedelta(hours=2),
+                 'protocol': 'https', 'domain': 'example.com',
+                 'path': '/c', 'url': 'https://example.com/c',
+                 'window_width': 0, 'window_height': 0,
+                 'unique_visit': True}])
+
+    assert series(project.pk, DAY, until)[0] == (DAY, 3, 2)
+
+
+def test_open_buckets_are_not_cached(project, add_pageview):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    since = now - datetime.timedelta(days=1)
+    add_pageview(project, now)
+    assert series(project.pk, since, now + datetime.timedelta(seconds=1),
+                  'day')[-1][1:] == (1, 1)
+
+    add_pageview(project, now)
+    assert series(project.pk, since, now + datetime.timedelta(seconds=1),
+                  'day')[-1][1:] == (2, 2)
+
+
+def test_timeseries_view(admin_client, project, pageviews):
+    response = admin_client.get(f'/api/projects/{project.pk}/timeseries',
+                                {'since': '2020-03-01', 'until': '2020-03-03'})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        'project': project.tid,
+        'interval': 'day',
+        'buckets': [
+            {'start': '2020-03-01T00:00:00Z', 'views': 2, 'unique_views': 1},
+            {'start': '2020-03-02T00:00:00Z', 'views': 2, 'unique_views': 2},
+        ],
+    }
+    assert response['Cache-Control'] == 'private, max-age=5'
+
+
+def test_timeseries_view_conditional_get(admin_client, project, pageviews):
+    url = f'/api/projects/{project.pk}/timeseries'
+    params = {'since': '2020-03-01', 'until': '2020-03-03'}
+    etag = admin_client.get(url, params)['ETag']
+
+    response = admin_client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response.content == b''
+
+
+def test_timeseries_view_caches_responses(admin_client, project, pageviews,
+                                          django_assert_max_num_queries):
+    url = f'/api/projects/{project.pk}/timeseries'
+    params = {'interval': 'hour', 'since': '2020-03-01'}
+    first = admin_client.get(url, params)
+
+    # Only the session, user and project
+    with django_assert_max_num_queries(3):
+        assert admin_client.get(url, params).content == first.content
+
+
+@pytest.mark.parametrize('params', [
+    {'interval': 'week'},
+    {'since': 'yesterday'},
+    {'interval': 'hour', 'since': '2000-01-01', 'until': '2020-01-01'},
+])
+def test_timeseries_view_rejects_bad_parameters(admin_client, project,
+                                                params):
+    response = admin_client.get(f'/api/projects/{project.pk}/timeseries',
+                                params)
+    assert response.status_code == 400
+
+
+def test_top_view(admin_client, project, pageviews):
+    update_rollups()
+    response = admin_client.get(f'/api/projects/{project.pk}/top',
+                                {'dimension': TopValues.PATH})
+
+    assert response.status_code == 200
+    assert response.json()['values'] == [{'value': '/a', 'views': 2},
+                                         {'value': '/b', 'views': 2}]
+
+
+@pytest.mark.parametrize('limit, count', [('1', 1), ('0', 1), ('-5', 1),
+                                          ('1000', 2)])
+def test_top_view_clamps_limit(admin_client, project, pageviews, limit,
+                               count):
+    update_rollups()
+    response = admin_client.get(f'/api/projects/{project.pk}/top',
+                                {'dimension': TopValues.PATH,
+                                 'limit': limit})
+
+    assert response.status_code == 200
+    assert len(response.json()['values']) == count
+
+
+def test_top_view_rejects_non_integer_limit(admin_client, project):
+    response = admin_client.get(f'/api/projects/{project.pk}/top',
+                                {'limit': 'ten'})
+    assert response.status_code == 400
+
+
+def test_top_view_rejects_unknown_dimension(admin_client, project):
+    response = admin_client.get(f'/api/projects/{project.pk}/top',
+                                {'dimension': 'country'})
+    assert response.status_code == 400
+
+
+def test_api_requires_permission(client, project):
+    assert client.get(f'/api/projects/{project.pk}/top').status_code == 302
+    user = User.objects.create_user('staff', password='secret',
+                                    is_staff=True)
+    client.force_login(user)
+    assert client.get(f'/api/projects/{project.pk}/top').status_code == 403
+    assert client.get(
+        f'/api/projects/{project.pk}/timeseries').status_code == 403
+
+
+def test_api_unknown_project(admin_client, db):
+    assert admin_client.get('/api/projects/999/timeseries').status_code == 404
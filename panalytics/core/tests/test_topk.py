@@ -0,0 +1,82 @@
+import random
+
+from ..topk import SpaceSaving
+
+
+def test_counts_exact_below_capacity():
+    top = SpaceSaving(capacity=3)
+    for value in ['/a', '/b', '/a', '/c', '/a', '/b']:
+        top.add(value)
+
+    assert top.top(2) == [(3, '/a'), (2, '/b')]
+    assert top.floor() == 1
+
+
+def test_add_weighted_counts():
+    top = SpaceSaving(capacity=3)
+    top.add('/a', 5)
+    top.add('/a', 2)
+
+    assert top.top(5) == [(7, '/a')]
+
+
+def test_replaces_least_frequent_value_when_full():
+    top = SpaceSaving(capacity=2)
+    top.add('/a', 5)
+    top.add('/b', 2)
+    top.add('/c')
+
+    assert top.to_list() == [['/a', 5, 0], ['/c', 3, 2]]
+
+
+def test_finds_heavy_hitters_in_skewed_stream():
+    generator = random.Random(0)
+    stream = [f'/page/{int(generator.paretovariate(1.2))}'
+              for _ in range(20000)]
+    exact = {}
+    for value in stream:
+        exact[value] = exact.get(value, 0) + 1
+    top = SpaceSaving(capacity=50)
+    for value in stream:
+        top.add(value)
+
+    expected = sorted(exact, key=lambda v: -exact[v])[:5]
+    assert [value for _, value in top.top(5)] == expected
+    for value, count, error in top.to_list()[:5]:
+        assert count - error <= exact[value] <= count
+
+
+def test_merge_adds_counts():
+    first, second = SpaceSaving(capacity=3), SpaceSaving(capacity=3)
+    first.add('/a', 3)
+    first.add('/b', 1)
+    second.add('/a', 1)
+    second.add('/c', 2)
+
+    first.merge(second)
+
+    assert first.top(3) == [(4, '/a'), (2, '/c'), (1, '/b')]
+
+
+def test_merge_bounds_values_missing_from_full_summary():
+    first, second = SpaceSaving(capacity=2), SpaceSaving(capacity=2)
+    first.add('/a', 10)
+    first.add('/b', 4)
+    second.add('/a', 1)
+    second.add('/c', 3)
+
+    first.merge(second)
+
+    # /c may have been counted up to 4 times in first before eviction
+    assert first.to_list() == [['/a', 11, 0], ['/c', 7, 4]]
+
+
+def test_list_round_trip():
+    top = SpaceSaving(capacity=2)
+    top.add('/a', 2)
+    top.add('/b')
+    top.add('/c')
+
+    loaded = SpaceSaving.from_list(2, top.to_list())
+
+    assert loaded.to_list() == top.to_list()
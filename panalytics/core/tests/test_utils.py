@@ -1,7 +1,9 @@
+import datetime
+
 from django.test import RequestFactory
 import re
 
-from ..utils import do_not_track, get_tracking_id
+from ..utils import client_ip, do_not_track, get_tracking_id, visitor_hash
 
 
 def test_do_not_track_as_enabled():
@@ -27,3 +29,34 @@ def test_get_tracking_id_include_nine_random_character_string():
 def test_get_tracking_id_returns_twelve_character_string():
     result = get_tracking_id()
     assert len(result) == 12
+
+
+def test_visitor_hash_stable_for_same_visitor_and_day():
+    first = RequestFactory().get('/a.gif', HTTP_USER_AGENT='Firefox')
+    second = RequestFactory().get('/a.gif', HTTP_USER_AGENT='Firefox')
+
+    assert visitor_hash(first, 1) == visitor_hash(second, 1)
+    assert -2 ** 63 <= visitor_hash(first, 1) < 2 ** 63
+
+
+def test_visitor_hash_differs_by_visitor_project_and_day():
+    request = RequestFactory().get('/a.gif', HTTP_USER_AGENT='Firefox')
+    other = RequestFactory().get('/a.gif', HTTP_USER_AGENT='Chrome')
+    today = datetime.date(2020, 3, 1)
+
+    assert len({
+        visitor_hash(request, 1, today),
+        visitor_hash(other, 1, today),
+        visitor_hash(request, 2, today),
+        visitor_hash(request, 1, today + datetime.timedelta(days=1)),
+    }) == 4
+
+
+def test_visitor_hash_uses_configured_ip_header(settings):
+    settings.VISITOR_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+    first = RequestFactory().get('/a.gif',
+                                 HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.9')
+    second = RequestFactory().get('/a.gif', HTTP_X_FORWARDED_FOR='10.0.0.2')
+
+    assert client_ip(first) == '10.0.0.1'
+    assert visitor_hash(first, 1) != visitor_hash(second, 1)
@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.http import Http404
+from django.test import RequestFactory
+from unittest.mock import patch
+
+from ..buffer import PageViewBuffer
+from ..handlers import TrackingASGIHandler
+from ..models import Project
+from ..spool import spool
+from ..views import PXL, collect_async, script_async
+
+
+def collect_request(tid, **extra):
+    return RequestFactory().get('/a.gif',
+                                {'url': 'http://example.com/about',
+                                 'tid': tid},
+                                **extra)
+
+
+def test_collect_async_persists_page_view(project):
+    response = async_to_sync(collect_async)(collect_request(project.tid))
+
+    assert response.status_code == 200
+    assert PXL in response.content
+    assert project.pageviews.get().path == '/about'
+
+
+def test_collect_async_skips_page_view_when_dnt_enabled(project):
+    async_to_sync(collect_async)(collect_request(project.tid, HTTP_DNT='1'))
+
+    assert project.pageviews.count() == 0
+
+
+def test_collect_async_skips_page_view_for_unknown_tid(project):
+    response = async_to_sync(collect_async)(collect_request('PA-UNKNOWN00'))
+
+    assert response.status_code == 200
+    assert project.pageviews.count() == 0
+
+
+def test_collect_async_hands_page_view_to_buffer(project):
+    buffer = PageViewBuffer(max_size=10, flush_interval=60)
+
+    with patch('panalytics.core.views.pageview_buffer', buffer):
+        async_to_sync(collect_async)(collect_request(project.tid))
+
+    assert len(buffer) == 1
+    assert buffer.flush() == 1
+    assert project.pageviews.count() == 1
+
+
+def test_collect_async_flushes_buffer_without_thread(project):
+    buffer = PageViewBuffer(max_size=1, flush_interval=0)
+
+    with patch('panalytics.core.views.pageview_buffer', buffer):
+        async_to_sync(collect_async)(collect_request(project.tid))
+
+    assert len(buffer) == 0
+    assert project.pageviews.count() == 1
+
+
+def test_collect_async_interns_buffered_page_view(project, settings):
+    settings.INTERN_DIMENSIONS = True
+    buffer = PageViewBuffer(max_size=10, flush_interval=60)
+
+    with patch('panalytics.core.views.pageview_buffer', buffer):
+        async_to_sync(collect_async)(collect_request(project.tid))
+
+    assert buffer.flush() == 1
+    assert project.pageviews.get().get_dimension('path') == '/about'
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def test_collect_async_takes_cached_rate_limits_in_thread(project,
+                                                          settings):
+    settings.RATE_LIMIT_ENABLED = True
+    settings.RATE_LIMIT_CACHE = 'default'
+    calls = []
+
+    with patch('panalytics.core.ratelimit.CacheBuckets.take_all',
+               lambda self, limits: calls.append(in_event_loop())):
+        async_to_sync(collect_async)(collect_request(project.tid))
+
+    assert calls == [False]
+    assert project.pageviews.count() == 1
+
+
+def test_collect_async_spools_in_thread(project, settings):
+    settings.SPOOL_ENABLED = True
+    calls = []
+
+    # A spool refusing the hit has it written directly
+    with patch.object(spool, 'append',
+                      lambda fields: calls.append(in_event_loop())):
+        async_to_sync(collect_async)(collect_request(project.tid))
+
+    assert calls == [False]
+    assert project.pageviews.count() == 1
+
+
+def test_script_async_returns_javascript(project):
+    request = RequestFactory().get('/a.js', {'tid': project.tid})
+
+    response = async_to_sync(script_async)(request)
+
+    assert response.status_code == 200
+    assert project.tid in response.content.decode()
+
+
+def test_script_async_raises_404_for_unknown_tid(db):
+    request = RequestFactory().get('/a.js', {'tid': 'PA-UNKNOWN00'})
+
+    with pytest.raises(Http404):
+        async_to_sync(script_async)(request)
+
+
+@async_to_sync
+async def asgi_get(path, query_string=b'', host=b'testserver'):
+    scope = {'type': 'http', 'method': 'GET', 'path': path,
+             'query_string': query_string, 'headers': [(b'host', host)],
+             'root_path': ''}
+    communicator = ApplicationCommunicator(TrackingASGIHandler(), scope)
+    await communicator.send_input({'type': 'http.request'})
+    start = await communicator.receive_output()
+    body = await communicator.receive_output()
+    return start, body
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tracking_handler_serves_pixel_without_middleware():
+    project = Project.objects.create(name='Test Project')
+    query = f'tid={project.tid}&url=http://example.com/about'.encode()
+
+    start, body = asgi_get('/a.gif', query)
+
+    headers = dict(start['headers'])
+    assert start['status'] == 200
+    assert body['body'] == PXL
+    assert headers[b'Content-Type'] == b'image/gif'
+    assert b'X-Frame-Options' not in headers
+    assert project.pageviews.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tracking_handler_returns_404_for_unknown_tid():
+    start, _ = asgi_get('/a.js', b'tid=PA-UNKNOWN00')
+
+    assert start['status'] == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tracking_handler_rejects_disallowed_host():
+    project = Project.objects.create(name='Test Project')
+    query = f'tid={project.tid}&url=http://example.com/about'.encode()
+
+    start, _ = asgi_get('/a.gif', query, host=b'evil.example')
+
+    assert start['status'] == 400
+    assert project.pageviews.count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tracking_handler_turns_errors_into_500():
+    with patch('panalytics.core.views.script_async',
+               side_effect=RuntimeError):
+        start, _ = asgi_get('/a.js', b'tid=PA-UNKNOWN00')
+
+    assert start['status'] == 500
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+from django.utils import timezone
+from unittest.mock import patch
+
+from ..buffer import PageViewBuffer
+from ..models import PageView, Project
+
+
+def post_hits(client, hits, **extra):
+    return client.post('/a.batch', json.dumps(hits),
+                       content_type='text/plain', **extra)
+
+
+def hit(tid, path='/about', **values):
+    return {'tid': tid, 'url': f'http://example.com{path}', 't': 'Title',
+            'wiw': 1272, 'wih': 675, **values}
+
+
+def test_collect_batch_persists_all_hits(client, project):
+    other = Project.objects.create(name='Other Project')
+
+    response = post_hits(client, [hit(project.tid, '/a'),
+                                  hit(project.tid, '/b'),
+                                  hit(other.tid, '/c')])
+
+    assert response.status_code == 204
+    assert sorted(project.pageviews.values_list('path', flat=True)) == \
+        ['/a', '/b']
+    assert other.pageviews.get().window_width == 1272
+
+
+def test_collect_batch_uses_one_insert(client, project,
+                                       django_assert_num_queries):
+    hits = [hit(project.tid, f'/{i}') for i in range(20)]
+    post_hits(client, hits[:1])
+
+    # The savepoint around the insert lets a failed batch be retried
+    with django_assert_num_queries(3):
+        post_hits(client, hits)
+
+
+def test_collect_batch_skips_invalid_hits(client, project):
+    response = post_hits(client, [
+        hit(project.tid, '/ok'),
+        hit('PA-UNKNOWN00'),
+        hit('INVALID'),
+        hit(project.tid, wiw='wide'),
+        {'tid': project.tid},
+        'not a hit',
+    ])
+
+    assert response.status_code == 204
+    assert list(PageView.objects.values_list('path', flat=True)) == ['/ok']
+
+
+@pytest.mark.parametrize('values', [{'tid': 1}, {'tid': ['PA-A']},
+                                    {'a': 1e400}])
+def test_collect_batch_skips_hits_of_wrong_types(client, project, values):
+    response = post_hits(client, [hit(project.tid, '/ok'),
+                                  {**hit(project.tid, '/bad'), **values}])
+
+    assert response.status_code == 204
+    assert list(PageView.objects.values_list('path', flat=True)) == ['/ok']
+
+
+@pytest.mark.parametrize('intern', [False, True])
+def test_collect_batch_drops_unencodable_characters(client, project,
+                                                    settings, intern):
+    settings.INTERN_DIMENSIONS = intern
+
+    response = post_hits(client, [hit(project.tid, '/ok'),
+                                  hit(project.tid, '/\ud800', t='\ud800')])
+
+    assert response.status_code == 204
+    assert sorted((pageview.get_dimension('path'),
+                   pageview.get_dimension('title'))
+                  for pageview in PageView.objects.all()) == \
+        [('/', ''), ('/ok', 'Title')]
+
+
+def test_collect_batch_truncates_long_values(client, project):
+    response = post_hits(client, [hit(project.tid, '/ok'),
+                                  hit(project.tid, '/' + 'a' * 300)])
+
+    assert response.status_code == 204
+    paths = PageView.objects.values_list('path', flat=True)
+    assert sorted(map(len, paths)) == [3, 255]
+
+
+def test_collect_batch_backdates_queued_hits(client, project):
+    post_hits(client, [hit(project.tid, a=30000)])
+
+    age = timezone.now() - project.pageviews.get().timestamp
+    assert timezone.timedelta(seconds=30) <= age < \
+        timezone.timedelta(seconds=40)
+
+
+def test_collect_batch_limits_hits_per_request(client, project, settings):
+    settings.BATCH_MAX_HITS = 2
+
+    post_hits(client, [hit(project.tid) for _ in range(5)])
+
+    assert project.pageviews.count() == 2
+
+
+def test_collect_batch_respects_dnt(client, project):
+    response = post_hits(client, [hit(project.tid)], HTTP_DNT='1')
+
+    assert response.status_code == 204
+    assert project.pageviews.count() == 0
+
+
+@pytest.mark.parametrize('body', ['not json', '{"tid": "PA-TESTTRACK"}'])
+def test_collect_batch_rejects_malformed_body(client, db, body):
+    response = client.post('/a.batch', body, content_type='text/plain')
+
+    assert response.status_code == 400
+
+
+def test_collect_batch_requires_post(client, db):
+    assert client.get('/a.batch').status_code == 405
+
+
+def test_collect_batch_adds_hits_to_buffer_when_enabled(client, project):
+    buffer = PageViewBuffer(max_size=10, flush_interval=60)
+
+    with patch('panalytics.core.views.pageview_buffer', buffer):
+        post_hits(client, [hit(project.tid), hit(project.tid)])
+
+    assert len(buffer) == 2
+    assert project.pageviews.count() == 0
+    buffer.flush()
+    assert project.pageviews.count() == 2
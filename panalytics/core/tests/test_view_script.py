@@ -1,9 +1,11 @@
+import gzip
+
 import pytest
 from django.http import Http404
 from django.test import RequestFactory
 from unittest.mock import patch
 
-from ..views import script
+from ..views import render_script, script
 
 JAVASCRIPT = """(function(){var w=window,d=document,
     i=new Image,e=encodeURIComponent;i.src='http://127.0.0.1:8000/a.gif?
@@ -59,3 +61,79 @@ def test_script_view_raises_404_status_with_invalid_tid(
     mock_is_valid_tracking_id.return_value = False
     with pytest.raises(Http404):
         script(script_get_request_no_tid)
+
+
+@patch('panalytics.core.models.Project.is_valid_tracking_id')
+def test_script_returns_beacon_javascript_when_requested(
+    mock_is_valid_tracking_id
+):
+    mock_is_valid_tracking_id.return_value = True
+    request = RequestFactory().get('/a.js',
+                                   {'tid': 'PA-TESTTRACK', 'beacon': '1'})
+    response = script(request)
+
+    content = response.content.decode()
+    assert "h='http://127.0.0.1:8000',t='PA-TESTTRACK'" in content
+    assert "n.sendBeacon(h+'/a.batch'" in content
+    assert 'q.length>=10' in content
+
+
+@patch('panalytics.core.models.Project.is_valid_tracking_id')
+def test_script_is_cacheable(mock_is_valid_tracking_id, script_get_request,
+                             settings):
+    settings.SCRIPT_MAX_AGE = 3600
+    mock_is_valid_tracking_id.return_value = True
+    response = script(script_get_request)
+
+    assert response['Cache-Control'] == 'public, max-age=3600'
+    assert response['Vary'] == 'Accept-Encoding'
+    assert response['ETag'].startswith('"')
+    assert 'Content-Encoding' not in response
+
+
+@patch('panalytics.core.models.Project.is_valid_tracking_id')
+def test_script_304_when_etag_matches(mock_is_valid_tracking_id,
+                                      script_get_request):
+    mock_is_valid_tracking_id.return_value = True
+    etag = script(script_get_request)['ETag']
+    request = RequestFactory().get('/a.js', {'tid': 'PA-TESTTRACK'},
+                                   HTTP_IF_NONE_MATCH=etag)
+    response = script(request)
+
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response['ETag'] == etag
+
+
+@patch('panalytics.core.models.Project.is_valid_tracking_id')
+def test_script_200_when_etag_is_stale(mock_is_valid_tracking_id):
+    mock_is_valid_tracking_id.return_value = True
+    request = RequestFactory().get('/a.js', {'tid': 'PA-TESTTRACK'},
+                                   HTTP_IF_NONE_MATCH='"stale"')
+
+    assert script(request).status_code == 200
+
+
+@patch('panalytics.core.models.Project.is_valid_tracking_id')
+def test_script_gzipped_when_accepted(mock_is_valid_tracking_id,
+                                      script_get_request):
+    mock_is_valid_tracking_id.return_value = True
+    plain = script(script_get_request)
+    request = RequestFactory().get('/a.js', {'tid': 'PA-TESTTRACK'},
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+    response = script(request)
+
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.content) == plain.content
+    assert response['ETag'] != plain['ETag']
+
+
+@patch('panalytics.core.models.Project.is_valid_tracking_id')
+def test_script_rendered_once_per_tid(mock_is_valid_tracking_id,
+                                      script_get_request):
+    mock_is_valid_tracking_id.return_value = True
+    for _ in range(3):
+        script(script_get_request)
+
+    assert render_script.cache_info().misses == 1
+    assert render_script.cache_info().hits == 2
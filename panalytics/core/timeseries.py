@@ -0,0 +1,139 @@
+"""
+Bucketed view counts of a project for the read API.
+
+Counts come from the hourly and daily rollups plus the page views not
+rolled up yet. A bucket is cached per project once it has been closed for
+API_BUCKET_SETTLE seconds, long enough for late hits (e.g. queued by
+sendBeacon) to have arrived, so a dashboard only recounts its most recent
+buckets. Page views written into closed buckets later, by importing logs
+or draining the spool, drop those buckets from the cache, and cached
+buckets expire after API_BUCKET_TTL seconds in any case.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import DailyRollup, HourlyRollup, PageView, RollupWatermark
+
+INTERVALS = {
+    'hour': (HourlyRollup, TruncHour, datetime.timedelta(hours=1)),
+    'day': (DailyRollup, TruncDay, datetime.timedelta(days=1)),
+}
+
+
+def parse_time(value):
+    """Parse an ISO 8601 date or date and time, UTC unless specified.
+
+    Raises ValueError for anything else.
+    """
+    if len(value) == 10:
+        value = datetime.datetime.combine(datetime.date.fromisoformat(value),
+                                          datetime.time())
+    else:
+        value = datetime.datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def bucket_start(value, interval):
+    """Return the start of the UTC bucket ``value`` falls in."""
+    value = value.astimezone(datetime.timezone.utc) \
+        .replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if interval == 'day' else value
+
+
+def bucket_starts(since, until, interval):
+    """Return starts of the buckets overlapping ``[since, until)``."""
+    step = INTERVALS[interval][2]
+    start, starts = bucket_start(since, interval), []
+    while start < until:
+        starts.append(start)
+        start += step
+    return starts
+
+
+def _cache_key(project_id, interval, start):
+    return f'timeseries:{project_id}:{interval}:{start:%Y%m%d%H}'
+
+
+def forget_buckets(pageviews):
+    """Drop the cached buckets of ``(project ID, timestamp)`` pairs of
+    page views written after the fact."""
+    keys = {_cache_key(project_id, interval,
+                       bucket_start(timestamp, interval))
+            for project_id, timestamp in pageviews
+            for interval in INTERVALS}
+    if keys:
+        caches[settings.API_CACHE].delete_many(keys)
+
+
+def count_buckets(project_id, since, until, interval):
+    """Return ``{bucket start: (views, unique views)}`` for the buckets
+    starting in ``[since, until)``, both bucket aligned. Buckets without
+    views are left out."""
+    model, trunc, _ = INTERVALS[interval]
+    last_id = RollupWatermark.last_id_for(RollupWatermark.PAGEVIEWS)
+    rollups = model.objects.filter(project_id=project_id)
+    if interval == 'day':
+        rollups = rollups.filter(bucket__gte=since.date(),
+                                 bucket__lt=until.date())
+    else:
+        rollups = rollups.filter(bucket__gte=since, bucket__lt=until)
+    pending = PageView.objects.filter(project_id=project_id, id__gt=last_id,
+                                      timestamp__gte=since,
+                                      timestamp__lt=until) \
+        .annotate(bucket=trunc('timestamp', tzinfo=datetime.timezone.utc)) \
+        .order_by().values('bucket') \
+        .annotate(views=Sum('sample_weight'),
+                  unique_views=Sum('sample_weight',
+                                   filter=Q(unique_visit=True))) \
+        .values_list('bucket', 'views', 'unique_views')
+
+    counts = {}
+    for bucket, views, unique_views in [
+        *rollups.values_list('bucket', 'views', 'unique_views'), *pending
+    ]:
+        if interval == 'day' and not isinstance(bucket, datetime.datetime):
+            bucket = datetime.datetime.combine(bucket, datetime.time(),
+                                               tzinfo=datetime.timezone.utc)
+        previous = counts.get(bucket, (0, 0))
+        counts[bucket] = (previous[0] + views,
+                          previous[1] + (unique_views or 0))
+    return counts
+
+
+def series(project_id, since, until, interval='day'):
+    """Return ``(bucket start, views, unique views)`` of every bucket
+    overlapping ``[since, until)``.
+
+    Settled buckets are read from the API_CACHE cache where possible and
+    the rest are counted in one pass.
+    """
+    step = INTERVALS[interval][2]
+    starts = bucket_starts(since, until, interval)
+    if not starts:
+        return []
+    settled = timezone.now() - \
+        datetime.timedelta(seconds=settings.API_BUCKET_SETTLE)
+    cache = caches[settings.API_CACHE]
+    keys = {start: _cache_key(project_id, interval, start)
+            for start in starts if start + step <= settled}
+    cached = cache.get_many(keys.values())
+    counts = {start: tuple(cached[key]) for start, key in keys.items()
+              if key in cached}
+
+    missing = [start for start in starts if start not in counts]
+    if missing:
+        counted = count_buckets(project_id, missing[0], missing[-1] + step,
+                                interval)
+        for start in missing:
+            counts[start] = counted.get(start, (0, 0))
+        cache.set_many({keys[start]: counts[start] for start in missing
+                        if start in keys},
+                       timeout=settings.API_BUCKET_TTL)
+    return [(start, *counts[start]) for start in starts]
@@ -0,0 +1,72 @@
+"""
+Space-Saving summaries of the most frequent values in a stream.
+
+A summary tracks at most ``capacity`` values. A value not yet tracked
+replaces the value with the lowest count once the summary is full and
+inherits that count as its possible overestimation (``error``). Counts are
+never underestimated and overestimated by at most the total weight added
+divided by ``capacity``, so every value seen more often than that is
+guaranteed to be tracked. Reporting the top few values of a summary with a
+capacity of a hundred or so is accurate for the skewed distributions of
+paths, referrers and titles.
+"""
+
+
+def _rank(item):
+    value, (count, _) = item
+    return -count, value
+
+
+class SpaceSaving:
+    def __init__(self, capacity, counters=None):
+        self.capacity = capacity
+        # value -> [count, error]
+        self.counters = counters or {}
+
+    @classmethod
+    def from_list(cls, capacity, items):
+        return cls(capacity, {value: [count, error]
+                              for value, count, error in items})
+
+    def to_list(self):
+        """Return ``[value, count, error]`` lists, most frequent first."""
+        return [[value, count, error] for value, (count, error) in
+                sorted(self.counters.items(), key=_rank)]
+
+    def add(self, value, weight=1):
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [weight, 0]
+        else:
+            evicted = min(self.counters, key=lambda v: self.counters[v][0])
+            floor = self.counters.pop(evicted)[0]
+            self.counters[value] = [floor + weight, floor]
+
+    def merge(self, other):
+        """Fold ``other`` into this summary.
+
+        A value missing from a full summary may have been counted up to
+        that summary's lowest count, which is added to both its count and
+        error to keep counts from being underestimated.
+        """
+        own_floor, other_floor = self.floor(), other.floor()
+        merged = {}
+        for value in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(value, [own_floor, own_floor])
+            other_count, other_error = other.counters.get(
+                value, [other_floor, other_floor])
+            merged[value] = [count + other_count, error + other_error]
+        top = sorted(merged.items(), key=_rank)
+        self.counters = dict(top[:self.capacity])
+
+    def floor(self):
+        """Count any untracked value may have reached."""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def top(self, limit):
+        """Return ``(count, value)`` of the ``limit`` most frequent values."""
+        return [(count, value) for value, count, _ in self.to_list()[:limit]]
@@ -1,8 +1,20 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+if settings.ASYNC_VIEWS:
+    script, collect = views.script_async, views.collect_async
+else:
+    script, collect = views.script, views.collect
+
 urlpatterns = [
-    path('a.js', views.script, name='script'),
-    path('a.gif', views.collect, name='collect'),
+    path('a.js', script, name='script'),
+    path('a.gif', collect, name='collect'),
+    path('a.batch', views.collect_batch, name='collect_batch'),
+    path('export/<int:project_id>', views.export, name='export'),
+    path('api/projects/<int:project_id>/timeseries', views.timeseries,
+         name='timeseries'),
+    path('api/projects/<int:project_id>/top', views.top, name='top'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,3 +1,9 @@
+import hashlib
+import hmac
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 
@@ -12,3 +18,39 @@ def do_not_track(request):
 
 def get_tracking_id():
     return f'PA-{get_random_string(9).upper()}'
+
+
+def client_ip(request):
+    if settings.VISITOR_IP_HEADER:
+        forwarded = request.META.get(settings.VISITOR_IP_HEADER, '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def visitor_hash(request, project_id, day=None):
+    """Return a signed 64 bit ID of the visitor making ``request``.
+
+    The client IP and user agent are hashed with a salt derived from the
+    secret key and the current UTC date, so no cookie is needed, the same
+    visitor gets a different ID every day and IDs can't be traced back to
+    an IP address once the day is over.
+    """
+    return hash_visitor(project_id, client_ip(request),
+                        request.META.get('HTTP_USER_AGENT', ''), day)
+
+
+def hash_visitor(project_id, ip, user_agent, day=None):
+    day = day or timezone.now().date()
+    value = f'{project_id}|{ip}|{user_agent}'.encode()
+    return int.from_bytes(
+        hmac.new(_visitor_key(day), value, hashlib.sha256).digest()[:8],
+        'big', signed=True,
+    )
+
+
+@lru_cache(maxsize=8)
+def _visitor_key(day):
+    # The key salted_hmac would derive, computed once per day
+    return hashlib.sha256(f'panalytics.visitor.{day.isoformat()}'
+                          f'{settings.SECRET_KEY}'.encode()).digest()
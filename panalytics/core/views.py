@@ -1,8 +1,37 @@
-from django.http import HttpResponse, Http404
+import gzip
+import hashlib
+import json
+import re
+from collections import Counter
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (HttpResponse, HttpResponseBadRequest, Http404,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
 from base64 import b64decode
 from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from .models import PageView, Project
+from .bots import is_bot_request
+from .buffer import pageview_buffer
+from .dedupe import duplicate_hits
+from .cache import tracking_ids
+from .export import FORMATS, export_lines, export_rows, parse_day
+from .metrics import (CONTENT_TYPE, hits, pageview_writes, pageviews_written,
+                      render)
+from .models import PageView, Project, TopValues
+from .spool import spool
+from .ratelimit import rate_limiter
+from .storage import write_pageviews
+from .timeseries import INTERVALS, bucket_starts, parse_time, series
 from .utils import do_not_track
 
 JAVASCRIPT = """(function(){var w=window,d=document,
@@ -10,27 +39,356 @@ JAVASCRIPT = """(function(){var w=window,d=document,
     +e(d.location.href)+'&ref='+e(d.referrer)+'&t='+e(d.title)+'&wiw='
     +e(w.innerWidth)+'&wih='+e(w.innerHeight);})()"""
 
+# Queues hits and sends them in batches with navigator.sendBeacon when the
+# page is hidden or the queue is full, falling back to the pixel. Calling
+# window.panalytics() records another page view, e.g. on SPA navigation.
+BEACON_JAVASCRIPT = """(function(){var w=window,d=document,n=navigator,q=[],
+    h='%s',t='%s',r=d.referrer,e=encodeURIComponent;function f(){if(q.length)
+    {n.sendBeacon(h+'/a.batch',JSON.stringify(q.map(function(x){x.a=Date.now()
+    -x.a;return x})));q=[]}}function p(){var x={tid:t,url:d.location.href,
+    ref:r,t:d.title,wiw:w.innerWidth,wih:w.innerHeight,a:Date.now()};
+    r=x.url;if(!n.sendBeacon){var i=new Image;i.src=h+'/a.gif?tid='+t+'&url='
+    +e(x.url)+'&ref='+e(x.ref)+'&t='+e(x.t)+'&wiw='+e(x.wiw)+'&wih='
+    +e(x.wih);return}q.push(x);if(q.length>=%d)f()}w.panalytics=p;
+    d.addEventListener('visibilitychange',function(){if(d.visibilityState
+    ==='hidden')f()});w.addEventListener('pagehide',f);p();})()"""
+
+SCRIPTS = {
+    False: JAVASCRIPT.replace('\n', '').replace('    ', ''),
+    True: BEACON_JAVASCRIPT.replace('\n', '').replace('    ', ''),
+}
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
 # Transparent 1x1 GIF Pixel
 PXL = b64decode('R0lGODlhAQABAIAAANvf7wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw==')
 
 
+@lru_cache(maxsize=4096)
+def render_script(tid, beacon=False):
+    """Return the plain and gzipped script for ``tid`` with their ETags."""
+    if beacon:
+        params = (settings.ANALYTICS_HOST, tid, settings.BEACON_BATCH_SIZE)
+    else:
+        params = (settings.ANALYTICS_HOST, tid)
+    body = (SCRIPTS[beacon] % params).encode()
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    return {
+        False: (body, f'"{etag}"'),
+        True: (gzip.compress(body, mtime=0), f'"{etag}-gzip"'),
+    }
+
+
+def script_response(request, tid, beacon=False):
+    compress = bool(ACCEPTS_GZIP.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    body, etag = render_script(tid, beacon)[compress]
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='text/javascript')
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={settings.SCRIPT_MAX_AGE}'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def pixel_response():
+    response = HttpResponse(PXL, content_type='image/gif')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def too_many_requests():
+    response = HttpResponse('Too many requests', status=429)
+    response['Retry-After'] = '1'
+    return response
+
+
 def script(request):
-    clean_js = JAVASCRIPT.replace('\n', '').replace('    ', '')
     tid = request.GET.get('tid')
+    if not rate_limiter.allow(request, 'script', tid):
+        return too_many_requests()
     if not Project.is_valid_tracking_id(tid):
         raise Http404
-    response = f'{clean_js}' % (settings.ANALYTICS_HOST, tid)
-    return HttpResponse(response, content_type="text/javascript")
+    return script_response(request, tid,
+                           beacon=request.GET.get('beacon') == '1')
 
 
 def collect(request):
-    dnt = do_not_track(request)
-    tid = Project.is_valid_tracking_id(request.GET.get('tid'))
-    url = request.GET.get('url')
+    if do_not_track(request):
+        hits.inc('collect', 'dnt')
+    elif is_bot_request(request):
+        hits.inc('collect', 'bot')
+    elif not rate_limiter.allow(request, 'collect', request.GET.get('tid')):
+        hits.inc('collect', 'rate_limited')
+    elif not request.GET.get('url'):
+        hits.inc('collect', 'missing_url')
+    elif not Project.is_valid_tracking_id(request.GET.get('tid')):
+        hits.inc('collect', 'invalid_tid')
+    elif PageView.request_sampled_out(request):
+        hits.inc('collect', 'sampled')
+    elif duplicate_hits.enabled and \
+            duplicate_hits.seen_hit(request.GET, request):
+        hits.inc('collect', 'duplicate')
+    elif spool.enabled and spool.append(PageView.parse_request(request)):
+        hits.inc('collect', 'spooled')
+    else:
+        hits.inc('collect', 'accepted')
+        if pageview_buffer.enabled:
+            pageview_buffer.add(PageView.from_request(request))
+        else:
+            PageView.create_from_request(request)
 
-    if not dnt and tid and url:
-        PageView.create_from_request(request)
+    return pixel_response()
 
-    response = HttpResponse(PXL, content_type='image/gif')
-    response['Cache-Control'] = 'private, no-cache'
+
+@csrf_exempt
+@require_POST
+def collect_batch(request):
+    """Record a JSON array of hits sent by navigator.sendBeacon.
+
+    sendBeacon posts as text/plain to avoid a CORS preflight, so the body
+    is parsed as JSON whatever the content type.
+    """
+    if do_not_track(request):
+        hits.inc('batch', 'dnt')
+        return HttpResponse(status=204)
+    if is_bot_request(request):
+        hits.inc('batch', 'bot')
+        return HttpResponse(status=204)
+
+    try:
+        batch = json.loads(request.body)
+    except ValueError:
+        batch = None
+    if not isinstance(batch, list):
+        hits.inc('batch', 'malformed')
+        return HttpResponseBadRequest()
+
+    batch = batch[:settings.BATCH_MAX_HITS]
+    tids = Counter(hit['tid'] for hit in batch if isinstance(hit, dict) and
+                   isinstance(hit.get('tid'), str))
+    if not rate_limiter.allow_many(request, 'batch', tids, len(batch)):
+        hits.inc('batch', 'rate_limited', amount=len(batch))
+        return HttpResponse(status=204)
+    if duplicate_hits.enabled:
+        unique = [hit for hit in batch if not isinstance(hit, dict) or
+                  not duplicate_hits.seen_hit(hit, request)]
+        hits.inc('batch', 'duplicate', amount=len(batch) - len(unique))
+        batch = unique
+    parsed = PageView.parse_hits(batch, request=request)
+    hits.inc('batch', 'invalid', amount=len(batch) - len(parsed))
+    sampled = len(parsed)
+    parsed = [fields for fields in parsed if not PageView.sampled_out(fields)]
+    hits.inc('batch', 'sampled', amount=sampled - len(parsed))
+    if spool.enabled:
+        spooled = len(parsed)
+        parsed = [fields for fields in parsed if not spool.append(fields)]
+        hits.inc('batch', 'spooled', amount=spooled - len(parsed))
+    pageviews = [PageView(**fields) for fields in PageView.intern(parsed)]
+    hits.inc('batch', 'accepted', amount=len(pageviews))
+    if pageview_buffer.enabled:
+        for pageview in pageviews:
+            pageview_buffer.add(pageview)
+    elif pageviews:
+        with pageview_writes.time('batch'):
+            saved = write_pageviews(pageviews)
+        pageviews_written.inc('batch', amount=saved)
+    return HttpResponse(status=204)
+
+
+async def script_async(request):
+    tid = request.GET.get('tid')
+    if not await rate_limiter.aallow(request, 'script', tid):
+        return too_many_requests()
+    if not Project.is_tracking_id_format(tid) or \
+            await tracking_ids.aget(tid) is None:
+        raise Http404
+    return script_response(request, tid,
+                           beacon=request.GET.get('beacon') == '1')
+
+
+async def collect_async(request):
+    """Async collect view for ASGI deployments.
+
+    Cached tracking IDs are resolved without leaving the event loop and
+    buffered page views are handed to the buffer's background thread, so
+    a request only waits on the database for an uncached tid or when
+    buffering is disabled. Rate limits kept in a cache and the spool's
+    file writes are run in a thread; duplicate hits are only ever
+    remembered in process memory, so they are checked in the loop.
+    """
+    tid = request.GET.get('tid')
+
+    if do_not_track(request):
+        hits.inc('collect', 'dnt')
+    elif is_bot_request(request):
+        hits.inc('collect', 'bot')
+    elif not await rate_limiter.aallow(request, 'collect', tid):
+        hits.inc('collect', 'rate_limited')
+    elif not request.GET.get('url'):
+        hits.inc('collect', 'missing_url')
+    elif not Project.is_tracking_id_format(tid):
+        hits.inc('collect', 'invalid_tid')
+    else:
+        project_id = await tracking_ids.aget(tid)
+        if project_id is None:
+            hits.inc('collect', 'invalid_tid')
+        elif PageView.request_sampled_out(request, project_id):
+            hits.inc('collect', 'sampled')
+        elif duplicate_hits.enabled and \
+                duplicate_hits.seen_hit(request.GET, request):
+            hits.inc('collect', 'duplicate')
+        elif spool.enabled and await sync_to_async(spool.append)(
+            PageView.parse_request(request, project_id)
+        ):
+            hits.inc('collect', 'spooled')
+        else:
+            hits.inc('collect', 'accepted')
+            if pageview_buffer.enabled:
+                if settings.INTERN_DIMENSIONS:
+                    # Uncached values are looked up in the database
+                    pageview = await sync_to_async(PageView.from_request)(
+                        request, project_id)
+                else:
+                    pageview = PageView.from_request(request, project_id)
+                if pageview_buffer.add(pageview, block=False):
+                    # No background thread to write the due batch
+                    await sync_to_async(pageview_buffer.flush)()
+            else:
+                await sync_to_async(PageView.create_from_request)(request)
+
+    return pixel_response()
+
+
+@staff_member_required
+def export(request, project_id):
+    """Stream a project's page views as CSV or NDJSON.
+
+    Takes ``format`` (csv or ndjson) and optional ``since`` and ``until``
+    dates (YYYY-MM-DD, until exclusive) as query parameters.
+    """
+    if not request.user.has_perm('core.view_pageview'):
+        raise PermissionDenied
+    project = get_object_or_404(Project, pk=project_id)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest('Unknown format')
+    try:
+        since = parse_day(request.GET.get('since'))
+        until = parse_day(request.GET.get('until'))
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD')
+
+    rows = export_rows(project.pk, since, until)
+    response = StreamingHttpResponse(export_lines(export_format, rows),
+                                     content_type=FORMATS[export_format])
+    response['Content-Disposition'] = \
+        f'attachment; filename="{project.tid}.{export_format}"'
+    return response
+
+
+def api_response(request, build):
+    """Return ``build()`` as JSON from the response cache.
+
+    Responses are cached for API_RESPONSE_TTL seconds by URL and carry an
+    ETag, so pollers sending If-None-Match get a 304 without anything
+    being recomputed.
+    """
+    cache = caches[settings.API_CACHE]
+    key = 'api:' + hashlib.md5(request.get_full_path().encode()).hexdigest()
+    cached = cache.get(key)
+    if cached is None:
+        body = json.dumps(build(), cls=DjangoJSONEncoder)
+        cached = (body, '"%s"' % hashlib.md5(body.encode()).hexdigest())
+        cache.set(key, cached, settings.API_RESPONSE_TTL)
+    body, etag = cached
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = \
+        f'private, max-age={settings.API_RESPONSE_TTL}'
     return response
+
+
+def api_project(request, project_id):
+    if not request.user.has_perm('core.view_project'):
+        raise PermissionDenied
+    return get_object_or_404(Project, pk=project_id)
+
+
+@staff_member_required
+def timeseries(request, project_id):
+    """Views and unique views of a project per hour or day.
+
+    Takes ``interval`` (hour or day), ``since`` and ``until`` (ISO 8601
+    dates or times, until exclusive) as query parameters. By default the
+    last 30 days or 48 hours up to now are returned.
+    """
+    project = api_project(request, project_id)
+    interval = request.GET.get('interval', 'day')
+    if interval not in INTERVALS:
+        return HttpResponseBadRequest('Unknown interval')
+    try:
+        until = parse_time(request.GET['until']) \
+            if request.GET.get('until') else timezone.now()
+        since = parse_time(request.GET['since']) \
+            if request.GET.get('since') else \
+            until - timezone.timedelta(days=30 if interval == 'day' else 2)
+    except ValueError:
+        return HttpResponseBadRequest('Times must be ISO 8601')
+    if len(bucket_starts(since, until, interval)) > settings.API_MAX_BUCKETS:
+        return HttpResponseBadRequest('Too many buckets')
+
+    def build():
+        return {
+            'project': project.tid,
+            'interval': interval,
+            'buckets': [
+                {'start': start, 'views': views,
+                 'unique_views': unique_views}
+                for start, views, unique_views in
+                series(project.pk, since, until, interval)
+            ],
+        }
+    return api_response(request, build)
+
+
+@staff_member_required
+def top(request, project_id):
+    """Most viewed paths, referrers or titles of a project.
+
+    Takes ``dimension`` (path, referer or title), ``days`` (all time if
+    omitted, today being the first day) and ``limit`` (at most 100).
+    """
+    project = api_project(request, project_id)
+    dimension = request.GET.get('dimension', TopValues.PATH)
+    if dimension not in TopValues.DIMENSIONS:
+        return HttpResponseBadRequest('Unknown dimension')
+    try:
+        days = int(request.GET['days']) if request.GET.get('days') else None
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError:
+        return HttpResponseBadRequest('days and limit must be integers')
+
+    def build():
+        return {
+            'project': project.tid,
+            'dimension': dimension,
+            'days': days,
+            'values': [{'value': value, 'views': views} for views, value in
+                       project.top_values(dimension, days, limit)],
+        }
+    return api_response(request, build)
+
+
+def metrics(request):
+    """Expose this process's metrics to Prometheus."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -24,10 +24,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 
-    'panalytics.core'
+    'panalytics.core.apps.CoreConfig'
 ]
 
 MIDDLEWARE = [
+    'panalytics.core.middleware.MetricsMiddleware',
+    'panalytics.core.profiling.QueryProfileMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -112,3 +114,151 @@ ADMIN_URL = config('ADMIN_URL', default='admin/')
 
 # Domain that is inserted into Javascript
 ANALYTICS_HOST = config('ANALYTICS_HOST', default='http://127.0.0.1:8000')
+
+# Page views buffered in memory before being written in a single batch.
+# A size of 0 writes every hit as it arrives.
+PAGEVIEW_BUFFER_SIZE = config('PAGEVIEW_BUFFER_SIZE', default=0, cast=int)
+
+# Maximum number of seconds a buffered page view waits before being written
+PAGEVIEW_BUFFER_INTERVAL = config('PAGEVIEW_BUFFER_INTERVAL',
+                                  default=5.0,
+                                  cast=float)
+
+# Tracking ID lookups cached per process. Unknown tracking IDs are cached
+# for the shorter negative TTL so made up IDs don't reach the database.
+TRACKING_ID_CACHE_SIZE = config('TRACKING_ID_CACHE_SIZE',
+                                default=10000,
+                                cast=int)
+TRACKING_ID_CACHE_TTL = config('TRACKING_ID_CACHE_TTL',
+                               default=300,
+                               cast=int)
+TRACKING_ID_NEGATIVE_CACHE_TTL = config('TRACKING_ID_NEGATIVE_CACHE_TTL',
+                                        default=60,
+                                        cast=int)
+
+# Load existing tracking IDs into the cache when the app starts
+TRACKING_ID_CACHE_WARM = config('TRACKING_ID_CACHE_WARM',
+                                default=True,
+                                cast=bool)
+
+# Monthly page view partitions kept ready ahead of time and the number of
+# months kept before partitions are dropped (0 keeps everything). Only used
+# by the partition_pageviews command on PostgreSQL.
+PAGEVIEW_PARTITION_MONTHS_AHEAD = config('PAGEVIEW_PARTITION_MONTHS_AHEAD',
+                                         default=3,
+                                         cast=int)
+PAGEVIEW_RETENTION_MONTHS = config('PAGEVIEW_RETENTION_MONTHS',
+                                   default=0,
+                                   cast=int)
+
+# Serve the tracking script and pixel with async views. Only worth enabling
+# when running under ASGI (panalytics.asgi), ideally with buffering on.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Most hits accepted in one batch request and how many hits the beacon
+# script (a.js?beacon=1) queues before sending them.
+BATCH_MAX_HITS = config('BATCH_MAX_HITS', default=100, cast=int)
+BEACON_BATCH_SIZE = config('BEACON_BATCH_SIZE', default=10, cast=int)
+
+# Seconds browsers and CDNs may cache the tracking script (a.js)
+SCRIPT_MAX_AGE = config('SCRIPT_MAX_AGE', default=86400, cast=int)
+
+# Store domains, paths, titles and referers of new page views once in lookup
+# tables referenced by ID, and how many of those IDs are cached per process.
+INTERN_DIMENSIONS = config('INTERN_DIMENSIONS', default=False, cast=bool)
+DIMENSION_CACHE_SIZE = config('DIMENSION_CACHE_SIZE',
+                              default=100000,
+                              cast=int)
+
+# Request header holding the client IP when running behind a proxy, e.g.
+# HTTP_X_FORWARDED_FOR. REMOTE_ADDR is used when empty.
+VISITOR_IP_HEADER = config('VISITOR_IP_HEADER', default='')
+
+# Values tracked per project, dimension and day for the top paths, referers
+# and titles reports. More values make the reported counts more accurate.
+TOP_VALUES_CAPACITY = config('TOP_VALUES_CAPACITY', default=100, cast=int)
+
+# Seconds before new page view IDs are rolled up. IDs are handed out before
+# inserts commit, so this must exceed the longest page view transaction or
+# a late commit below the rollup watermark is never counted. 0 rolls up
+# every committed page view at once.
+ROLLUP_LAG = config('ROLLUP_LAG', default=60, cast=int)
+
+# Directory of archived page view segments and the age in days after which
+# the archive_pageviews command moves page views there.
+ARCHIVE_DIR = config('ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive'))
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=90, cast=int)
+
+# Page views fetched per round trip when streaming an export
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Backend page views are stored in and counted from: ORMStorage (the
+# database, required by the admin, rollups, archive and export),
+# SQLiteStorage or FileStorage from panalytics.core.storage. The latter two
+# keep their data under PAGEVIEW_STORAGE_PATH.
+PAGEVIEW_STORAGE = config('PAGEVIEW_STORAGE',
+                          default='panalytics.core.storage.ORMStorage')
+PAGEVIEW_STORAGE_PATH = config('PAGEVIEW_STORAGE_PATH',
+                               default=os.path.join(BASE_DIR, 'pageviews'))
+
+# Record ingest and report metrics and expose them at /metrics in the
+# Prometheus text format. Restrict access to /metrics at the proxy.
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+
+# Count the SQL queries and database time of every request and management
+# command. Totals are logged to panalytics.core.profiling, sent in a
+# Server-Timing header and recorded as metrics if those are enabled.
+QUERY_PROFILING = config('QUERY_PROFILING', default=False, cast=bool)
+
+# Append hits to a local spool instead of writing them to the database,
+# to be loaded by the drain_spool command. Segment files are allocated
+# SPOOL_SEGMENT_SIZE bytes at a time, up to SPOOL_MAX_BYTES, past which
+# hits are written to the database directly. SPOOL_FSYNC is always,
+# interval (every SPOOL_FSYNC_INTERVAL seconds) or never.
+SPOOL_ENABLED = config('SPOOL_ENABLED', default=False, cast=bool)
+SPOOL_DIR = config('SPOOL_DIR', default=os.path.join(BASE_DIR, 'spool'))
+SPOOL_SEGMENT_SIZE = config('SPOOL_SEGMENT_SIZE', default=16 * 1024 * 1024,
+                            cast=int)
+SPOOL_MAX_BYTES = config('SPOOL_MAX_BYTES', default=1024 * 1024 * 1024,
+                         cast=int)
+SPOOL_FSYNC = config('SPOOL_FSYNC', default='interval')
+SPOOL_FSYNC_INTERVAL = config('SPOOL_FSYNC_INTERVAL', default=1.0,
+                              cast=float)
+
+# Cache used by the /api/ time series and top values endpoints. Buckets
+# that ended API_BUCKET_SETTLE seconds ago, by when delayed hits (up to an
+# hour late) have arrived, are cached for API_BUCKET_TTL seconds or until
+# imported or spooled page views land in them; whole responses are cached
+# for API_RESPONSE_TTL seconds. A request may span API_MAX_BUCKETS buckets.
+API_CACHE = config('API_CACHE', default='default')
+API_BUCKET_SETTLE = config('API_BUCKET_SETTLE', default=3600, cast=int)
+API_BUCKET_TTL = config('API_BUCKET_TTL', default=86400, cast=int)
+API_RESPONSE_TTL = config('API_RESPONSE_TTL', default=5, cast=int)
+API_MAX_BUCKETS = config('API_MAX_BUCKETS', default=2000, cast=int)
+
+# Drop hits from crawlers, bots and headless browsers, recognised by user
+# agent. BOT_PATTERNS adds regular expressions, matched against the lower
+# case user agent, to the built-in list in panalytics.core.bots.
+BOT_FILTER = config('BOT_FILTER', default=True, cast=bool)
+BOT_PATTERNS = config('BOT_PATTERNS', default='', cast=Csv())
+
+# Drop hits beyond RATE_LIMIT_TID per second for a tracking ID (unless the
+# project sets its own limit) or RATE_LIMIT_IP per second from a client IP,
+# 0 for no limit.
+# Buckets hold RATE_LIMIT_BURST seconds worth of hits. They are kept in
+# process memory, at most RATE_LIMIT_MAX_KEYS of them, or in the cache
+# named by RATE_LIMIT_CACHE so that all workers share them.
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=False, cast=bool)
+RATE_LIMIT_TID = config('RATE_LIMIT_TID', default=100, cast=int)
+RATE_LIMIT_IP = config('RATE_LIMIT_IP', default=10, cast=int)
+RATE_LIMIT_BURST = config('RATE_LIMIT_BURST', default=10, cast=int)
+RATE_LIMIT_MAX_KEYS = config('RATE_LIMIT_MAX_KEYS', default=100000, cast=int)
+RATE_LIMIT_CACHE = config('RATE_LIMIT_CACHE', default='')
+
+# Drop hits identical to one received in the last DEDUPE_WINDOW seconds
+# (0 turns this off), remembered in Bloom filters sized for DEDUPE_CAPACITY
+# hits per window with a DEDUPE_ERROR_RATE chance of dropping a unique hit.
+# The filters take about 3.6 MB with the defaults.
+DEDUPE_WINDOW = config('DEDUPE_WINDOW', default=0, cast=float)
+DEDUPE_CAPACITY = config('DEDUPE_CAPACITY', default=1000000, cast=int)
+DEDUPE_ERROR_RATE = config('DEDUPE_ERROR_RATE', default=0.001, cast=float)